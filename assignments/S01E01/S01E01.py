@@ -1,15 +1,16 @@
 import os
 import requests
-from time import sleep
 import re
 import sys
 from urllib.parse import urlencode
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from assignments.utils.openai_api import ask_gpt
+from assignments.utils.resilience_utils import backoff_delay, resilient_call, check_status
+from time import sleep
 
 def get_question_xyz(url):
     try:
-        response = requests.get(url)
+        response = resilient_call("xyz", lambda: check_status(requests.get(url)), max_attempts=3)
         if response.status_code == 200:
             # Use regex to find content between Question:<br> and </p>
             pattern = r'Question:<br />(.*?)</p>'
@@ -52,24 +53,36 @@ def submit_form_xyz(url, login, password, answer):
     except Exception as e:
         return False, f"Error submitting form: {str(e)}"
 
+def is_number(answer):
+    return re.fullmatch(r'-?\d+', answer.strip()) is not None
+
 def main():
     url = os.getenv("XYZ")
     login = "tester"
     password = "574e112a"
     prompt = "You are a helpful assistant. Provide only the direct answer without any additional text or explanations. The answer is ALWAYS a number."
     
+    # The question changes every few seconds, so retry quickly with jittered backoff
+    # instead of waiting a fixed 25 seconds
+    attempt = 0
     while True:
+        attempt += 1
         try:
             question = get_question_xyz(url)
             if not question:
-                print("Failed to get question, retrying in 25 seconds...")
-                sleep(25)
+                delay = backoff_delay(attempt, max_delay=10)
+                print(f"Failed to get question, retrying in {delay:.1f} seconds...")
+                sleep(delay)
                 continue
                 
-            answer = ask_gpt(prompt, question, "gpt-4")
+            # The form expires quickly: race the providers, then cheapest model first and
+            # a bigger one only for a non-numeric reply
+            answer = ask_gpt(prompt, question, hedge=True, validate=is_number,
+                             latency_budget=3.0, call_site="S01E01.answer", race=True)
             if not answer:
-                print("Failed to get answer, retrying in 25 seconds...")
-                sleep(25)
+                delay = backoff_delay(attempt, max_delay=10)
+                print(f"Failed to get answer, retrying in {delay:.1f} seconds...")
+                sleep(delay)
                 continue
             
             # Submit and print response
@@ -96,13 +109,15 @@ def main():
                 break
 
             
-            print("\nSubmission failed, retrying in 25 seconds...")
-            sleep(25)
+            delay = backoff_delay(attempt, max_delay=10)
+            print(f"\nSubmission failed, retrying in {delay:.1f} seconds...")
+            sleep(delay)
             
         except Exception as e:
+            delay = backoff_delay(attempt, max_delay=10)
             print(f"\nError occurred: {e}")
-            print("Retrying in 25 seconds...")
-            sleep(25)
+            print(f"Retrying in {delay:.1f} seconds...")
+            sleep(delay)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
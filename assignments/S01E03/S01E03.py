@@ -1,37 +1,66 @@
 import json
-from typing import List, Dict
+from typing import List, Dict, Iterator
 import operator
 import requests
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from assignments.utils.openai_api import ask_gpt
+from assignments.utils.token_budget import count_tokens
 from assignments.utils.aidevs3_utils import send_report
 
-def validate_math_equations(json_file_path: str) -> None:
+TASK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library serializer
+    orjson = None
+
+# Define operators mapping
+OPERATORS_MAP = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv
+}
+
+def load_json(json_file_path: str) -> Dict:
+    """
+    Parse the JSON file once and return the in-memory object.
+    """
+    print(f"Reading JSON file {json_file_path}...")
+    with open(json_file_path, 'rb') as file:
+        raw = file.read()
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def dump_json(data) -> bytes:
+    """
+    Serialize data with orjson when available, json otherwise.
+    """
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+def save_json(json_file_path: str, data: Dict) -> None:
     """
-    Validates and corrects math equations in JSON file.
+    Serialize the in-memory object back to the file in a single write.
+    """
+    print(f"Saving data to {json_file_path}")
+    with open(json_file_path, 'wb') as file:
+        file.write(dump_json(data))
+    print("Done!")
+
+def validate_math_equations(data: Dict, chunk_size: int = 10) -> int:
+    """
+    Validates and corrects math equations in the parsed JSON data in place.
     Processes data in chunks to handle large files efficiently.
+
+    Returns:
+        int: Number of corrections made
     """
-    print(f"Starting validation of {json_file_path}")
-    
-    # Define operators mapping
-    operators_map = {
-        '+': operator.add,
-        '-': operator.sub,
-        '*': operator.mul,
-        '/': operator.truediv
-    }
-    
-    # Read JSON file
-    print("Reading JSON file...")
-    with open(json_file_path, 'r') as file:
-        data = json.load(file)
-    
     # Get test data array
     test_data = data.get('test-data', [])
     total_items = len(test_data)
-    chunk_size = 10  # Changed to process 10 items at a time
     total_chunks = (total_items + chunk_size - 1) // chunk_size
     
     print(f"Found {total_items} equations to validate")
@@ -43,64 +72,246 @@ def validate_math_equations(json_file_path: str) -> None:
         chunk = test_data[i:i + chunk_size]
         chunk_num = (i // chunk_size) + 1
         print(f"\nProcessing chunk {chunk_num}/{total_chunks} (items {i}-{min(i+chunk_size, total_items)})")
-        corrections = process_chunk(chunk, operators_map)
-        corrections_made += corrections
+        corrections_made += process_chunk(chunk, OPERATORS_MAP)
     
     print(f"\nValidation complete!")
     print(f"Total corrections made: {corrections_made}")
-    
-    # Save corrected data back to file
-    print(f"Saving corrected data back to {json_file_path}")
-    with open(json_file_path, 'w') as file:
-        json.dump(data, file, indent=4)
-    print("Done!")
+    return corrections_made
 
-def process_test_questions(json_file_path: str) -> None:
+def process_test_questions(data: Dict, pack: bool = True, token_budget: int = 1000) -> int:
     """
-    Process only the test questions from the JSON file using GPT-4.
-    Updates the 'a' property with one-word answers from GPT-4.
+    Process only the test questions from the parsed JSON data using GPT-4.
+    Updates the 'a' property with one-word answers from GPT-4 in place.
+
+    Args:
+        data (Dict): Parsed JSON data
+        pack (bool): Group several questions into one request
+        token_budget (int): Estimated prompt size of a single packed request
+
+    Returns:
+        int: Number of questions answered
     """
-    prompt = """
+    return answer_test_questions(data.get('test-data', []), pack, token_budget)
+
+TEST_PROMPT = """
     You must provide only a single word as an answer. No punctuation or explanation.
     """
-    print(f"Starting test questions processing for {json_file_path}")
-    
-    # Read JSON file
-    print("Reading JSON file...")
-    with open(json_file_path, 'r') as file:
-        data = json.load(file)
-    
-    # Get test data array
-    test_data = data.get('test-data', [])
+
+PACKED_PROMPT = """
+    You will receive a numbered list of questions. Answer every question with a single word.
+    Respond ONLY with a JSON array of strings, where the element at index i answers question i.
+    No punctuation inside the answers, no explanation, no code fences.
+    """
+
+def pack_questions(questions: List[str], token_budget: int = 1000, max_pack: int = 50,
+                   model: str = "gpt-4o") -> List[List[int]]:
+    """
+    Group question indexes into packs whose prompt size, counted with the
+    tokenizer of model, fits token_budget.
+
+    Returns:
+        List[List[int]]: Packs of indexes into questions
+    """
+    packs = []
+    current = []
+    used = count_tokens(PACKED_PROMPT, model)
+    for idx, question in enumerate(questions):
+        # Every entry costs its text plus its index label, and its answer in the reply
+        cost = count_tokens(question, model) + 8
+        if current and (used + cost > token_budget or len(current) >= max_pack):
+            packs.append(current)
+            current = []
+            used = count_tokens(PACKED_PROMPT, model)
+        current.append(idx)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+def is_single_word(answer) -> bool:
+    """Check that the answer is a non-empty single word."""
+    return isinstance(answer, str) and len(answer.strip().split()) == 1
+
+def parse_packed_reply(reply: str):
+    """Parse the JSON array of a packed reply, or return None."""
+    if not reply:
+        return None
+    try:
+        parsed = json.loads(reply.strip().strip('`').removeprefix('json').strip())
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, list) else None
+
+def ask_packed_questions(questions: List[str]) -> List:
+    """
+    Ask several questions in one request and return the answers by index.
+    Entries that are missing or invalid are returned as None.
+
+    The router starts with a small model and escalates when the reply is not
+    a JSON array with one answer per question.
+    """
+    numbered = "\n".join(f"{idx}. {question}" for idx, question in enumerate(questions))
+    reply = ask_gpt(
+        PACKED_PROMPT, numbered, call_site="S01E03.packed",
+        validate=lambda r: len(parse_packed_reply(r) or []) == len(questions)
+    )
+    answers = [None] * len(questions)
+    parsed = parse_packed_reply(reply)
+    if parsed is None:
+        print(f"Could not parse packed reply: {reply}")
+        return answers
+
+    for idx, answer in enumerate(parsed[:len(questions)]):
+        if is_single_word(answer):
+            answers[idx] = answer.strip()
+    return answers
+
+def answer_test_questions(items: List[Dict], pack: bool = True, token_budget: int = 1000) -> int:
+    """
+    Answer the embedded 'test' questions of the given items in place.
+
+    With pack=True questions are grouped into requests sized by token_budget,
+    and any answer that is missing or not a single word is retried on its own.
+    """
+    pending = [
+        item for item in items
+        if isinstance(item.get('test'), dict) and item['test'].get('q')
+    ]
     questions_processed = 0
-    
-    # Process each item that has a test question
-    for item in test_data:
-        if 'test' in item and isinstance(item['test'], dict):
-            question = item['test'].get('q')
-            if question:
-                print(f"\nProcessing test question: {question}")
-                
-                try:
-                    answer = ask_gpt(prompt, question, "gpt-4")
-                    
-                    if answer:
-                        # Update the answer in the data
-                        item['test']['a'] = answer
-                        questions_processed += 1
-                        print(f"Answer received: {answer}")
-                    
-                except Exception as e:
-                    print(f"Error processing question: {str(e)}")
-                    continue
+    retry = pending
+
+    if pack and len(pending) > 1:
+        retry = []
+        questions = [item['test']['q'] for item in pending]
+        packs = pack_questions(questions, token_budget)
+        print(f"\nAnswering {len(questions)} test questions in {len(packs)} packed requests")
+        for pack_indexes in packs:
+            try:
+                answers = ask_packed_questions([questions[idx] for idx in pack_indexes])
+            except Exception as e:
+                print(f"Error processing packed questions: {str(e)}")
+                answers = [None] * len(pack_indexes)
+            for idx, answer in zip(pack_indexes, answers):
+                if answer:
+                    pending[idx]['test']['a'] = answer
+                    questions_processed += 1
+                else:
+                    retry.append(pending[idx])
+        if retry:
+            print(f"Retrying {len(retry)} questions individually")
+
+    # Process each remaining item that has a test question
+    for item in retry:
+        question = item['test']['q']
+        print(f"\nProcessing test question: {question}")
+        
+        try:
+            answer = ask_gpt(TEST_PROMPT, question, call_site="S01E03.single", validate=is_single_word)
+            
+            if answer:
+                # Update the answer in the data
+                item['test']['a'] = answer
+                questions_processed += 1
+                print(f"Answer received: {answer}")
+            
+        except Exception as e:
+            print(f"Error processing question: {str(e)}")
+            continue
     
     print(f"\nProcessed {questions_processed} test questions")
-    
-    # Save updated data back to file
-    print(f"Saving updated data back to {json_file_path}")
-    with open(json_file_path, 'w') as file:
-        json.dump(data, file, indent=4)
-    print("Done!")
+    return questions_processed
+
+def iter_json_top_level(file) -> Iterator:
+    """
+    Incrementally parse a JSON object and yield its top-level members.
+
+    Yields ('value', key, value) for regular members and ('item', key, item)
+    for every element of the 'test-data' array, so the array is never
+    materialized in memory.
+    """
+    import ijson
+
+    key = None
+    builder = None
+    depth = 0
+    for prefix, event, value in ijson.parse(file, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+            if depth == 0:
+                yield ('item' if prefix == 'test-data.item' else 'value'), key, builder.value
+                builder = None
+            continue
+
+        if prefix == '' and event == 'map_key':
+            key = value
+        elif prefix == 'test-data' and event in ('start_array', 'end_array'):
+            yield event, key, None
+        elif event in ('start_map', 'start_array') and prefix in (key, 'test-data.item'):
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            depth = 1
+        elif prefix == 'test-data.item':
+            yield 'item', key, value
+        elif prefix == key:
+            yield 'value', key, value
+
+def stream_json_pipeline(input_path: str, output_path: str, chunk_size: int = 100) -> Dict:
+    """
+    Streaming variant of the pipeline for files larger than memory.
+
+    Parses 'test-data' incrementally, validates equations and answers test
+    questions chunk by chunk and writes each corrected chunk straight to
+    output_path.
+
+    Returns:
+        Dict: Counters of corrections and answered questions
+    """
+    print(f"Streaming {input_path} -> {output_path}")
+    stats = {"items": 0, "corrections": 0, "questions": 0}
+    chunk = []
+    first_member = True
+    first_item = True
+
+    def flush(dst):
+        nonlocal first_item, chunk
+        if not chunk:
+            return
+        stats["corrections"] += process_chunk(chunk, OPERATORS_MAP)
+        stats["questions"] += answer_test_questions(chunk)
+        for item in chunk:
+            dst.write(b'' if first_item else b',')
+            dst.write(dump_json(item))
+            first_item = False
+        stats["items"] += len(chunk)
+        chunk = []
+
+    with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+        dst.write(b'{')
+        for kind, key, value in iter_json_top_level(src):
+            if kind in ('value', 'start_array'):
+                dst.write(b'' if first_member else b',')
+                dst.write(dump_json(key) + b':')
+                first_member = False
+            if kind == 'value':
+                dst.write(dump_json(value))
+            elif kind == 'start_array':
+                dst.write(b'[')
+            elif kind == 'item':
+                chunk.append(value)
+                if len(chunk) >= chunk_size:
+                    flush(dst)
+            elif kind == 'end_array':
+                flush(dst)
+                dst.write(b']')
+        dst.write(b'}')
+
+    print(f"Streamed {stats['items']} items, {stats['corrections']} corrections, "
+          f"{stats['questions']} answered questions")
+    return stats
 
 def process_chunk(chunk: List[Dict], operators_map: Dict) -> int:
     """Process a chunk of test data items."""
@@ -143,28 +354,35 @@ def process_chunk(chunk: List[Dict], operators_map: Dict) -> int:
     
     return corrections
 
-def main():
-    json_file_path = 'resources/json.txt'
+def main(stream: bool = False):
+    json_file_path = os.path.join(TASK_DIR, 'resources', 'json.txt')
+
+    if stream:
+        output_path = json_file_path + '.corrected'
+        stream_json_pipeline(json_file_path, output_path)
+        # The corrected file is sent from disk, never loaded whole
+        send_report("centrala", answer_path=output_path)
+        return
 
     # Read JSON file once
     try:
-        with open(json_file_path, 'r') as file:
-            json_data = json.load(file)
+        json_data = load_json(json_file_path)
     except FileNotFoundError:
         print(f"Error: File {json_file_path} not found")
         sys.exit(1)
-    except json.JSONDecodeError:
+    except ValueError:
         print("Error: Invalid JSON file")
         sys.exit(1)
 
     # Run the validation first
-    validate_math_equations(json_file_path)
+    validate_math_equations(json_data)
     
     # Then process the test questions
-    process_test_questions(json_file_path)
-    
-    # Finally, send the corrected JSON to the endpoint
+    process_test_questions(json_data)
+
+    # Serialize once and send the corrected JSON to the endpoint
+    save_json(json_file_path, json_data)
     send_report("centrala", json_data)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(stream="--stream" in sys.argv)
@@ -12,17 +12,35 @@ from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from assignments.utils.aidevs3_utils import transcribe_files, get_answer_from_content
+from assignments.utils.batch_utils import batch_enabled, chat_request, run_batch
+from assignments.utils.token_budget import count_message_tokens, fit_content
 import requests
 
 # Load environment variables from .env file
 load_dotenv()
 
-def extract_facts_from_transcriptions(transcriptions_dir: str) -> str:
+TASK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FACTS_SYSTEM_PROMPT = "You are a fact extraction expert. Extract and summarize only the most important facts from the given text."
+
+def facts_messages(content: str) -> list:
+    prompt = f"""Please analyze the following Polish transcription and extract the most important facts in a concise manner:
+
+{content}
+
+Extract only the key facts and present them in a clear, bullet-point format in Polish."""
+    return [
+        {"role": "system", "content": FACTS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def extract_facts_from_transcriptions(transcriptions_dir: str, batch: bool = None) -> str:
     """
     Extract important facts from each transcription file using GPT-4.
     
     Args:
         transcriptions_dir (str): Directory containing transcription markdown files
+        batch (bool): Send all files as one batch job, defaults to AIDEVS3_BATCH
     
     Returns:
         str: Concatenated string of important facts from all transcriptions
@@ -36,36 +54,43 @@ def extract_facts_from_transcriptions(transcriptions_dir: str) -> str:
     transcriptions_path = Path(transcriptions_dir)
     md_files = list(transcriptions_path.glob("*.md"))
     
+    contents = {}
+    prompt_tokens = count_message_tokens(facts_messages(""))
+    for md_file in md_files:
+        # Read the content of the markdown file
+        with open(md_file, "r", encoding="utf-8") as f:
+            content = f.read()
+        if content.strip():  # Skip empty files
+            # Long transcriptions are packed to the token budget before they are sent
+            contents[md_file], _ = fit_content(content, "gpt-4o", reserved=prompt_tokens)
+
+    replies = {}
+    if batch_enabled(batch):
+        try:
+            batch_replies = run_batch("S02E01.facts", {
+                str(md_file): chat_request("gpt-4o", facts_messages(content), temperature=0.3)
+                for md_file, content in contents.items()
+            })
+            replies = {md_file: batch_replies.get(str(md_file)) for md_file in contents}
+        except Exception as e:
+            print(f"Batch failed, extracting facts directly: {e}")
+    
     all_facts = []
     
-    for md_file in md_files:
+    for md_file, content in contents.items():
         try:
-            # Read the content of the markdown file
-            with open(md_file, "r", encoding="utf-8") as f:
-                content = f.read()
-            
-            if not content.strip():  # Skip empty files
-                continue
-                
-            # Create prompt for GPT-4
-            prompt = f"""Please analyze the following Polish transcription and extract the most important facts in a concise manner:
-
-{content}
-
-Extract only the key facts and present them in a clear, bullet-point format in Polish."""
-
-            # Make API call to GPT-4
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a fact extraction expert. Extract and summarize only the most important facts from the given text."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3  # Lower temperature for more focused output
-            )
+            reply = replies.get(md_file)
+            if reply is None:
+                # Make API call to GPT-4
+                response = client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=facts_messages(content),
+                    temperature=0.3  # Lower temperature for more focused output
+                )
+                reply = response.choices[0].message.content
             
             # Add filename and extracted facts to results
-            facts = f"\n### Facts from {md_file.name}:\n{response.choices[0].message.content}\n"
+            facts = f"\n### Facts from {md_file.name}:\n{reply}\n"
             all_facts.append(facts)
             
         except Exception as e:
@@ -242,13 +267,12 @@ def send_report(task, answer):
         print(f"Error: {e}")
         return None
 
-if __name__ == "__main__":
-    # Example usage
-    input_directory = "resources/przesluchania"
-    output_directory = "resources/transkrypcje"
+def main():
+    input_directory = os.path.join(TASK_DIR, "resources", "przesluchania")
+    output_directory = os.path.join(TASK_DIR, "resources", "transkrypcje")
     
     transcribe_files(input_directory, output_directory)
-    facts = extract_facts_from_transcriptions("transcriptions")
+    facts = extract_facts_from_transcriptions(os.path.join(TASK_DIR, "transcriptions"))
     #print(facts)
     facts_answer = get_answer_from_content(facts, "Na jakiej uczelni wykłada Andrzej Maj? Fakty od Rafała są ważniejsze niż fakty od innych osób.")
     print("Answer:", facts_answer)
@@ -266,3 +290,7 @@ if __name__ == "__main__":
     
     #report_response = send_report("mp3", answer)
     #print("Report response:", report_response)
+    return facts_answer
+
+if __name__ == "__main__":
+    main()
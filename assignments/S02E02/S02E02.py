@@ -6,6 +6,8 @@ import os
 from dotenv import load_dotenv
 from assignments.utils.aidevs3_utils import request_anthropic
 
+TASK_DIR = os.path.dirname(os.path.abspath(__file__))
+
 load_dotenv()
 
 def analyze_map_images(map_directory) -> list:
@@ -125,7 +127,7 @@ Be explicit about how each observed detail supports your conclusion about the ci
     return results
 
 def main():
-    map_directory = "resources/map/"
+    map_directory = os.path.join(TASK_DIR, "resources", "map")
 
     prompt = """<context>
     {content}
@@ -88,9 +88,7 @@ Format the response as a clear, concise description with no explanations or pref
     
     return response.content[0].text
 
-if __name__ == "__main__":
-    api_key = os.getenv("AIDEVS3_API_KEY")
-    
+def main():
     # Get the description first
     description = get_robot_description()
     print("DESCRIPTION:", description + "\n")
@@ -104,4 +102,7 @@ if __name__ == "__main__":
     IMGURL = "https://cdn.midjourney.com/2ae8d2f2-9343-405b-86ca-af5b5a3451d8/0_0.png"
     answer = send_report("robotid", IMGURL)
     print(answer + "\n")
+    return answer
 
+if __name__ == "__main__":
+    main()
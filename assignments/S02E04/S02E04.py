@@ -1,37 +1,40 @@
 import os
 import json
+import hashlib
 import re
 import sys
 import frontmatter
 from pathlib import Path
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from openai import OpenAI
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from assignments.utils.aidevs3_utils import transcribe_audio_with_groq, extract_text_from_images, send_report, txt_to_markdown
+from assignments.utils.aidevs3_utils import (
+    send_report, transcribe_audio_file, extract_text_from_image_file, txt_file_to_markdown,
+    AUDIO_FORMATS, IMAGE_FORMATS, get_groq_client
+)
+from assignments.utils.batch_utils import batch_enabled, chat_request, run_batch
+from assignments.utils.build_utils import BuildGraph
+from assignments.utils.resilience_utils import resilient_call
+from assignments.utils.tracing import span, bind_context
+from assignments.utils.usage_ledger import record_response
+from assignments.utils.openai_api import get_embeddings, get_openai_client
+from assignments.utils.classifier_utils import KNNClassifier, load_labeled_examples, save_labeled_examples
 
+TASK_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def categorize_files(directory_path: str) -> Dict[str, List[str]]:
-    """
-    Categorize markdown files into people, hardware, or other using GPT-4.
-    """
-    print("\n=== Starting file categorization ===")
-    
-    # Initialize categories
-    categories = {
-        "people": [],
-        "hardware": [],
-        "other": []
-    }
-    print(f"Processing files from directory: {directory_path}")
-    
-    # Initialize OpenAI client
-    client = OpenAI()
-    
-    # Get all markdown files
-    md_files = [f for f in os.listdir(directory_path) if f.endswith('.md')]
-    print(f"Found {len(md_files)} markdown files to process")
-    
-    system_prompt = """You are a Technical Content Classifier. Categorize files into: `people`, `hardware`, or `other`.
+CATEGORIES = ("people", "hardware", "other")
+# Neighbours voting in the local classifier
+KNN_K = 5
+
+# Labeled seed examples, mirroring the few-shot examples of the system prompt
+SEED_EXAMPLES = [
+    {"text": "był tam Jan Kowalski którego aresztowalismy", "label": "people"},
+    {"text": "kamera została zdemontowana i wymieniona", "label": "hardware"},
+    {"text": "roboty udały się do lasu", "label": "other"},
+]
+
+SYSTEM_PROMPT = """You are a Technical Content Classifier. Categorize files into: `people`, `hardware`, or `other`.
 
 1. STRIP METADATA
    - Remove headers, timestamps, signatures, departments, approvals
@@ -84,44 +87,174 @@ def categorize_files(directory_path: str) -> Dict[str, List[str]]:
 </examples>
 """
 
-    # Process each markdown file
-    for md_file in md_files:
-        print(f"\nProcessing file: {md_file}")
-        md_path = os.path.join(directory_path, md_file)
-        
-        # Read markdown content
-        with open(md_path, 'r', encoding='utf-8') as f:
-            post = frontmatter.load(f)
-            content = post.content
-            original_filename = post.get('filename', md_file)
-            print(f"Original filename: {original_filename}")
-            print(f"Content length: {len(content)} characters")
-        
-        # Get category from GPT-4
-        print("Sending to GPT-4 for categorization...")
-        response = client.chat.completions.create(
+def parse_category(response_text: str) -> str:
+    """
+    Extract the category from a free-form reply, ignoring the <thinking> block.
+    """
+    answer = re.sub(r'<thinking>.*?</thinking>', '', response_text, flags=re.DOTALL | re.IGNORECASE).lower()
+    matches = re.findall(r'\b(people|hardware|other)\b', answer)
+    return matches[-1] if matches else "other"
+
+def valid_category(label: str) -> str:
+    """Keep only known categories; anything else is stored as other."""
+    if label in CATEGORIES:
+        return label
+    print(f"WARNING: unknown category {label!r}, using other")
+    return "other"
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.strip().encode('utf-8')).hexdigest()
+
+def categorize_messages(content: str) -> List[Dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+def categorize_with_llm(client: OpenAI, content: str) -> str:
+    """Categorize a single text with GPT-4o."""
+    with span("openai.chat", kind="llm", call_site="categorize_with_llm", model="gpt-4o",
+              request_chars=len(SYSTEM_PROMPT) + len(content)) as s:
+        response = resilient_call("openai", client.chat.completions.create,
             model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": content}
-            ],
+            messages=categorize_messages(content),
             temperature=0
         )
-        
-        # Extract category from response
-        category_response = response.choices[0].message.content.lower()
-        print(f"GPT-4 response: {category_response}")
-        
-        # Determine category
-        if 'people' in category_response:
-            categories['people'].append(original_filename)
-            print(f"Categorized as: people")
-        elif 'hardware' in category_response:
-            categories['hardware'].append(original_filename)
-            print(f"Categorized as: hardware") 
+        record_response(s, response, "openai")
+    return parse_category(response.choices[0].message.content)
+
+def load_markdown_files(directory_path: str, files: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Read markdown files and return their content and original filename.
+    """
+    md_files = files if files is not None else [f for f in os.listdir(directory_path) if f.endswith('.md')]
+    documents = []
+    for md_file in md_files:
+        with open(os.path.join(directory_path, md_file), 'r', encoding='utf-8') as f:
+            post = frontmatter.load(f)
+        documents.append({
+            "file": md_file,
+            "filename": post.get('filename', md_file),
+            "content": post.content
+        })
+    return documents
+
+def classify_documents(documents: List[Dict],
+                       labels_path: Optional[str] = None,
+                       target_precision: float = 0.95,
+                       max_workers: int = 8,
+                       batch: Optional[bool] = None) -> Dict[str, str]:
+    """
+    Classify documents with a local kNN over embeddings of labeled examples and
+    escalate only the low-confidence ones to GPT-4o, concurrently.
+
+    On a fresh checkout only the three seed examples (one per category) are
+    known, so the leave-one-out calibration cannot reach target_precision and
+    every document is escalated. The GPT-4o labels are saved to labels_path,
+    and later runs classify locally once the examples calibrate.
+
+    Args:
+        documents (List[Dict]): Documents from load_markdown_files
+        labels_path (str): JSON file with labeled examples; LLM decisions are appended to it
+            as content hash, label and embedding, so known texts are not embedded again
+        target_precision (float): Leave-one-out precision required to trust the local label
+        max_workers (int): Concurrent LLM requests for escalated documents
+        batch (bool): Send the escalated documents as one batch job, defaults to AIDEVS3_BATCH
+
+    Returns:
+        Dict[str, str]: Category for every document file
+    """
+    if not documents:
+        return {}
+
+    examples = [e for e in load_labeled_examples(labels_path, SEED_EXAMPLES) if e["label"] in CATEGORIES]
+    for example in examples:
+        # Label files written before the vectors were stored still hold the text
+        if "hash" not in example:
+            example["hash"] = content_hash(example["text"])
+    for document in documents:
+        document["hash"] = content_hash(document["content"])
+
+    # Only texts without a stored vector are embedded
+    vectors = {e["hash"]: e["embedding"] for e in examples if e.get("embedding")}
+    texts = {e["hash"]: e["text"] for e in examples if e["hash"] not in vectors}
+    texts.update({d["hash"]: d["content"] for d in documents if d["hash"] not in vectors})
+    vectors.update(zip(texts, get_embeddings(list(texts.values()))))
+
+    # k must leave a neighbour to vote when an example is held out in calibrate()
+    classifier = KNNClassifier(k=min(KNN_K, len(examples) - 1)).fit(
+        [vectors[e["hash"]] for e in examples], [e["label"] for e in examples])
+    threshold = classifier.calibrate(target_precision)
+    print(f"kNN classifier: {len(examples)} labeled examples, confidence threshold {threshold:.2f}")
+
+    results = {}
+    escalate = []
+    for document, (label, confidence) in zip(documents, classifier.predict([vectors[d["hash"]] for d in documents])):
+        if label is not None and confidence >= threshold:
+            results[document["file"]] = label
+            print(f"{document['file']}: {label} (local, confidence {confidence:.2f})")
         else:
-            categories['other'].append(original_filename)
-            print(f"Categorized as: other")
+            escalate.append(document)
+
+    if escalate:
+        print(f"Escalating {len(escalate)} of {len(documents)} files to GPT-4o")
+        if batch_enabled(batch):
+            try:
+                replies = run_batch("S02E04.categorize", {
+                    d["file"]: chat_request("gpt-4o", categorize_messages(d["content"]), temperature=0)
+                    for d in escalate
+                })
+            except Exception as e:
+                print(f"Batch failed, asking GPT-4o directly: {e}")
+                replies = {}
+            for document in escalate:
+                if replies.get(document["file"]) is not None:
+                    results[document["file"]] = valid_category(parse_category(replies[document["file"]]))
+                    print(f"{document['file']}: {results[document['file']]} (GPT-4o batch)")
+
+        # Documents without a batch reply (or all of them outside batch mode) are asked directly
+        pending = [d for d in escalate if d["file"] not in results]
+        client = get_openai_client()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            labels = executor.map(bind_context(lambda d: categorize_with_llm(client, d["content"])), pending)
+            for document, label in zip(pending, labels):
+                label = valid_category(label)
+                results[document["file"]] = label
+                print(f"{document['file']}: {label} (GPT-4o)")
+
+        if labels_path:
+            # Labels are stored with the content hash and vector, not the content itself
+            known = {e["hash"] for e in examples}
+            stored = [{"hash": e["hash"], "label": e["label"], "embedding": vectors[e["hash"]]}
+                      for e in examples[len(SEED_EXAMPLES):]]
+            new_examples = [
+                {"hash": d["hash"], "label": results[d["file"]], "embedding": vectors[d["hash"]]}
+                for d in escalate if d["hash"] not in known
+            ]
+            save_labeled_examples(labels_path, stored + new_examples)
+
+    return results
+
+def categorize_files(directory_path: str, labels_path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Categorize markdown files into people, hardware, or other.
+
+    Files are classified locally first; only ambiguous ones are sent to GPT-4o.
+    """
+    print("\n=== Starting file categorization ===")
+    print(f"Processing files from directory: {directory_path}")
+
+    documents = load_markdown_files(directory_path)
+    print(f"Found {len(documents)} markdown files to process")
+
+    if labels_path is None:
+        labels_path = os.path.join(directory_path, "labels.json")
+    labels = classify_documents(documents, labels_path)
+
+    # Initialize categories
+    categories = {category: [] for category in CATEGORIES}
+    for document in documents:
+        categories[labels[document["file"]]].append(document["filename"])
 
     # Remove 'other' category files
     print("\n=== Final Results ===")
@@ -132,19 +265,69 @@ def categorize_files(directory_path: str) -> Dict[str, List[str]]:
     
     return categories
 
-def main():
+def build_pipeline(directory_path: str) -> BuildGraph:
+    """
+    Describe the ingestion pipeline as an incremental build graph.
+
+    Text, audio and image conversion run in parallel and only for new or changed
+    files; categorization reruns only for markdown files whose content changed.
+    """
+    graph = BuildGraph(os.path.join(directory_path, ".build_manifest.json"))
 
-    resources_files_path = "resources/pliki_z_fabryki/"
+    def files_with(suffixes):
+        return lambda: sorted(
+            os.path.join(directory_path, f) for f in os.listdir(directory_path)
+            if Path(f).suffix.lower() in suffixes
+        )
+
+    def markdown_for(path):
+        return [str(Path(path).with_suffix(".md"))]
+
+    def build_each(convert):
+        def build(paths):
+            built = {}
+            for path in paths:
+                try:
+                    convert(path)
+                    built[path] = markdown_for(path)[0]
+                    print(f"Converted {os.path.basename(path)}")
+                except Exception as e:
+                    print(f"Error processing {os.path.basename(path)}: {e}")
+            return built
+        return build
+
+    def categorize(paths):
+        documents = load_markdown_files(directory_path, [os.path.basename(p) for p in paths])
+        labels = classify_documents(documents, os.path.join(directory_path, "labels.json"))
+        return {
+            os.path.join(directory_path, d["file"]): {"filename": d["filename"], "category": labels[d["file"]]}
+            for d in documents
+        }
 
-    txt_to_markdown(resources_files_path, overwrite=False)
+    groq_client = get_groq_client()
+    openai_client = get_openai_client()
+
+    graph.stage("text", "1", files_with({".txt"}), build_each(txt_file_to_markdown), markdown_for)
+    graph.stage("audio", "1", files_with(AUDIO_FORMATS),
+                build_each(lambda path: transcribe_audio_file(groq_client, path)), markdown_for)
+    graph.stage("images", "1", files_with(IMAGE_FORMATS),
+                build_each(lambda path: extract_text_from_image_file(openai_client, path)), markdown_for)
+    graph.stage("categorize", "1", files_with({".md"}), categorize, after=("text", "audio", "images"))
+    return graph
+
+def main():
 
-    transcribe_files_results = transcribe_audio_with_groq(resources_files_path, overwrite=False)
-    #print(transcribe_files_results)
+    resources_files_path = os.path.join(TASK_DIR, "resources", "pliki_z_fabryki")
 
-    transcribe_images_results = extract_text_from_images(resources_files_path, overwrite=False)
-    #print(transcribe_images_results)
+    graph = build_pipeline(resources_files_path)
+    summary = graph.run()
+    print(json.dumps(summary, indent=2))
 
-    results = categorize_files(resources_files_path)
+    categories = {"people": [], "hardware": []}
+    for result in graph.results("categorize").values():
+        if result["category"] in categories:
+            categories[result["category"]].append(result["filename"])
+    results = {category: sorted(files) for category, files in categories.items()}
     print(json.dumps(results, indent=2))
 
     report_response = send_report("kategorie", results)
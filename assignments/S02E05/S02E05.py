@@ -8,8 +8,10 @@ from dotenv import load_dotenv
 import base64
 import json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from assignments.utils.openai_api import get_answer_from_content
-from assignments.utils.aidevs3_utils import send_report, process_image
+from assignments.utils.openai_api import get_answer_from_content, get_answers_from_content
+from assignments.utils.aidevs3_utils import send_report, process_image, html_to_markdown
+
+TASK_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def fetch_questions(url):
     """Fetch and parse questions from the given URL"""
@@ -20,19 +22,33 @@ def fetch_questions(url):
     print(f"Number of questions: {len(questions)}")
     return questions
 
-def process_questions(questions, content):
-    """Process each question and return answers dictionary"""
-    answers = {}
-    print("\nProcessing questions:")
+def process_questions(questions, content, shared_context=True):
+    """Process questions and return answers dictionary
+
+    With shared_context the article is sent once with all questions;
+    otherwise every question is answered in its own request.
+    """
+    parsed_questions = {}
     for question in questions:
         # Split question ID and text using '=' as separator
         q_id, q_text = question.split('=', 1)
-        formatted_id = f"{q_id.zfill(2)}"
+        parsed_questions[f"{q_id.zfill(2)}"] = q_text
+
+    if shared_context:
+        print(f"\nAnswering {len(parsed_questions)} questions in one request")
+        answers = get_answers_from_content(content, parsed_questions, source="S02E05.article")
+        for formatted_id, answer in answers.items():
+            print(f"Answer {formatted_id}: {answer}")
+        return answers
+
+    answers = {}
+    print("\nProcessing questions:")
+    for formatted_id, q_text in parsed_questions.items():
         print(f"\nProcessing question {formatted_id}")
         print(f"Question text: {q_text}")
         
         # Get answer using the utility function
-        answer = get_answer_from_content(content, q_text)
+        answer = get_answer_from_content(content, q_text, source="S02E05.article")
         print(f"Generated answer: {answer}")
         answers[formatted_id] = answer
     return answers
@@ -51,7 +67,7 @@ def main():
 
     # Uncomment these lines to generate the markdown file
     markdown_content = html_to_markdown(S02E05_ARTICLE_URL)
-    output_file = "resources/article.md"
+    output_file = os.path.join(TASK_DIR, "resources", "article.md")
     print(f"\nReading content from {output_file}")
     
     with open(output_file, "w", encoding="utf-8") as f:
@@ -2,13 +2,27 @@ import os
 import anthropic
 import sys
 import json
+import re
+import hashlib
+import frontmatter
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from assignments.utils.aidevs3_utils import send_report
-from openai import OpenAI
+from assignments.utils.batch_utils import batch_enabled, chat_request, run_batch
+from assignments.utils.retrieval_utils import match_texts
+from assignments.utils.fact_store import FactStore
+from assignments.utils.resilience_utils import resilient_call
+from assignments.utils.tracing import bind_context
+from assignments.utils.openai_api import get_openai_client
+
+TASK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORTS_DIR = os.path.join(TASK_DIR, "resources", "pliki_z_fabryki")
+FACTS_DIR = os.path.join(REPORTS_DIR, "facts")
+FACTS_PATH = os.path.join(TASK_DIR, "facts.md")
 
 def merge_facts_to_markdown():
     print("\n=== Starting merge_facts_to_markdown() ===")
-    facts_dir = "resources/pliki_z_fabryki/facts"
+    facts_dir = FACTS_DIR
     print(f"Looking for files in: {facts_dir}")
     
     markdown_content = ""  # Content for facts.md
@@ -39,14 +53,14 @@ def merge_facts_to_markdown():
             markdown_content += f"{section_name}\n\n{content}\n\n"
     
     # Write all content to facts.md
-    with open("facts.md", 'w', encoding='utf-8') as facts_file:
+    with open(FACTS_PATH, 'w', encoding='utf-8') as facts_file:
         facts_file.write(markdown_content)
     print("Created facts.md with all content")
 
 def convert_reports_to_markdown():
     print("\n=== Starting convert_reports_to_markdown() ===")
-    reports_dir = "resources/pliki_z_fabryki"
-    output_dir = "resources/pliki_z_fabryki"
+    reports_dir = REPORTS_DIR
+    output_dir = REPORTS_DIR
     print(f"Looking for reports in: {reports_dir}")
     
     os.makedirs(output_dir, exist_ok=True)
@@ -65,6 +79,11 @@ def convert_reports_to_markdown():
             print(f"Read {len(content)} characters from {file_name}")
         
         markdown_content = f"# {file_name}\n\n{content}\n"
+
+        # Keep the file (and its keyword front matter) when the report did not change
+        if os.path.exists(output_path) and read_markdown(output_path).content.strip() == markdown_content.strip():
+            print(f"{output_file} is up to date")
+            continue
         
         with open(output_path, 'w', encoding='utf-8') as output_file:
             output_file.write(markdown_content)
@@ -72,79 +91,149 @@ def convert_reports_to_markdown():
     
     return output_dir
 
-def add_keywords_to_sections(file_path):
-    print(f"\n=== Processing file: {file_path} ===")
-    
-    client = OpenAI()  # Make sure OPENAI_API_KEY is set in your environment
-    
-    # Read the content of the markdown file
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-    
-    # Split content into lines while keeping the title
-    lines = content.split('\n', 1)
-    title = lines[0]
-    content_without_title = content
-    
-    print(f"Getting keywords for: {title}")
-    
-    # Get keywords from GPT-4
-    prompt = f"""Analyze this text and provide only a comma-separated list of Polish keywords. Always first include in the keywords the Sektor name and the name of the person:
+KEYWORDS_PROMPT_VERSION = "1"
 
-{content_without_title}"""
-    
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": """You are a keyword extractor focused on identifying:
+def read_markdown(file_path):
+    """
+    Load a markdown file with its front matter.
+
+    Older runs prepended a new keywords block on every run, so any stacked
+    front matter blocks left in the body are merged into the metadata.
+    """
+    post = frontmatter.load(file_path)
+    while re.match(r'^---\s*\n', post.content):
+        stacked = frontmatter.loads(post.content)
+        if stacked.content == post.content:
+            break
+        post.metadata = {**stacked.metadata, **post.metadata}
+        post.content = stacked.content
+    return post
+
+def content_hash(text):
+    return hashlib.sha256(text.strip().encode('utf-8')).hexdigest()
+
+KEYWORDS_SYSTEM_PROMPT = """You are a keyword extractor focused on identifying:
 - Names of individuals
 - Skills of individuals
 - Sector identifiers (e.g., Sektor A, B, C)
 - Specific locations or areas
 - Key events and activities
 - Technical terms and equipment mentioned
-Respond only with comma-separated keywords in Polish, no other text."""},
-            {"role": "user", "content": prompt}
-        ],
+Respond only with comma-separated keywords in Polish, no other text."""
+
+def keywords_messages(content):
+    prompt = f"""Analyze this text and provide only a comma-separated list of Polish keywords. Always first include in the keywords the Sektor name and the name of the person:
+
+{content}"""
+    return [
+        {"role": "system", "content": KEYWORDS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def keywords_up_to_date(post, digest):
+    return (post.get('keywords_hash') == digest
+            and str(post.get('keywords_prompt_version')) == KEYWORDS_PROMPT_VERSION)
+
+def write_keywords(file_path, post, digest, keywords):
+    # Update the front matter instead of prepending another block
+    post['keywords'] = keywords
+    post['keywords_hash'] = digest
+    post['keywords_prompt_version'] = KEYWORDS_PROMPT_VERSION
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(frontmatter.dumps(post) + '\n')
+    
+    print(f"Added keywords to {file_path}")
+
+def add_keywords_to_sections(file_path, client=None, force=False):
+    """
+    Store GPT-4o keywords in the file's front matter, together with the content
+    hash and prompt version they were computed from.
+
+    Returns:
+        bool: True when keywords were (re)computed, False when the file was up to date
+    """
+    post = read_markdown(file_path)
+    digest = content_hash(post.content)
+    if not force and keywords_up_to_date(post, digest):
+        print(f"Skipping {file_path} - keywords up to date")
+        return False
+
+    print(f"\n=== Processing file: {file_path} ===")
+    client = client or get_openai_client()  # Make sure OPENAI_API_KEY is set in your environment
+    
+    # Split content into lines while keeping the title
+    title = post.content.split('\n', 1)[0]
+    print(f"Getting keywords for: {title}")
+    
+    # Get keywords from GPT-4
+    response = resilient_call("openai", client.chat.completions.create,
+        model="gpt-4o",
+        messages=keywords_messages(post.content),
         temperature=0
     )
     
     keywords = response.choices[0].message.content.strip()
     print(f"Keywords received: {keywords}")
-    
-    # Create updated content with YAML frontmatter
-    updated_content = f"---\nkeywords: {keywords}\n---\n{content}"
-    
-    # Write updated content back to the file
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(updated_content)
-    
-    print(f"Added keywords to {file_path}")
+    write_keywords(file_path, post, digest, keywords)
+    return True
+
+def add_keywords_batch(file_paths):
+    """
+    Compute the keywords of every stale file with one batch job (see batch_utils).
+
+    Returns:
+        list: Files that still need keywords because their batch request (or the batch) failed
+    """
+    stale = {}
+    for file_path in file_paths:
+        post = read_markdown(file_path)
+        digest = content_hash(post.content)
+        if keywords_up_to_date(post, digest):
+            print(f"Skipping {file_path} - keywords up to date")
+        else:
+            stale[file_path] = (post, digest)
 
-def process_all_markdown_files():
+    try:
+        replies = run_batch("S03E01.keywords", {
+            file_path: chat_request("gpt-4o", keywords_messages(post.content), temperature=0)
+            for file_path, (post, _) in stale.items()
+        })
+    except Exception as e:
+        print(f"Batch failed, computing keywords directly: {e}")
+        return list(stale)
+    failed = []
+    for file_path, (post, digest) in stale.items():
+        if replies.get(file_path) is None:
+            failed.append(file_path)
+        else:
+            write_keywords(file_path, post, digest, replies[file_path].strip())
+    return failed
+
+def process_all_markdown_files(max_workers=8, batch=None):
     print("\n=== Starting to process all markdown files ===")
-    directory = "resources/pliki_z_fabryki"
+    directory = REPORTS_DIR
     
     # Get all .md files in the directory
-    md_files = [f for f in os.listdir(directory) if f.endswith('.md')]
+    md_files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.md')]
     print(f"Found {len(md_files)} markdown files")
     
-    for file_name in md_files:
-        file_path = os.path.join(directory, file_name)
-        add_keywords_to_sections(file_path)
+    if batch_enabled(batch):
+        md_files = add_keywords_batch(md_files)
+        print(f"{len(md_files)} files left after the batch")
 
-def merge_keywords_with_facts():
-    print("\n=== Starting merge_keywords_with_facts() ===")
-    
-    client = OpenAI()
-    facts_dir = "resources/pliki_z_fabryki"
-    result = {}
-    
-    # Read facts.md content first
-    with open("facts.md", 'r', encoding='utf-8') as file:
+    client = get_openai_client()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        updated = sum(executor.map(bind_context(lambda path: add_keywords_to_sections(path, client)), md_files))
+    print(f"Updated keywords in {updated} of {len(md_files)} files")
+
+def parse_facts_sections(facts_path=None):
+    """
+    Split facts.md into {section name: section content} on H1 headers.
+    """
+    facts_path = facts_path or FACTS_PATH
+    with open(facts_path, 'r', encoding='utf-8') as file:
         facts_content = file.read()
     
-    # Extract sections with their content for better matching
     sections = {}
     current_section = None
     current_content = []
@@ -159,48 +248,95 @@ def merge_keywords_with_facts():
             current_content.append(line)
     if current_section:
         sections[current_section] = '\n'.join(current_content)
+    return sections
+
+def match_reports_to_sections(reports, sections, client=None, tie_margin=0.05):
+    """
+    Pick the most relevant facts section for every report locally.
+
+    All reports are scored against all sections with TF-IDF cosine similarity in
+    one matrix multiply. When the two best scores are closer than tie_margin and
+    a client is given, GPT-4o breaks the tie between the closest candidates.
+
+    Args:
+        reports (list): Report texts
+        sections (dict): Section name -> section text
+        client (OpenAI): Optional client for tie-breaks
+        tie_margin (float): Score gap below which the match is ambiguous
+
+    Returns:
+        list: Matched section name for every report
+    """
+    names = list(sections.keys())
+    # Section names (people, sectors) are strong signals, so score them with the text
+    scores = match_texts(reports, [f"{name}\n{sections[name]}" for name in names])
+
+    matches = []
+    for report, row in zip(reports, scores):
+        ranked = row.argsort()[::-1]
+        best = names[ranked[0]]
+        if client and len(ranked) > 1 and row[ranked[0]] - row[ranked[1]] < tie_margin:
+            candidates = [names[idx] for idx in ranked[:3]]
+            print(f"Close scores for {candidates}, asking GPT-4o to break the tie")
+            prompt = f"""Given this report:
+{report}
+
+Which of these sections is most relevant (respond with just the section name):
+{', '.join(candidates)}"""
+            response = resilient_call("openai", client.chat.completions.create,
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": "You are a document matcher. Respond only with the most relevant section name from the list, nothing else."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0
+            )
+            answer = response.choices[0].message.content.strip()
+            if answer in sections:
+                best = answer
+        matches.append(best)
+    return matches
+
+def merge_keywords_with_facts(llm_tie_break=True, fact_store=None):
+    print("\n=== Starting merge_keywords_with_facts() ===")
     
-    # Process each markdown file
-    md_files = [f for f in os.listdir(facts_dir) if f.endswith('.md')]
+    client = get_openai_client()
+    facts_dir = REPORTS_DIR
+    result = {}
+    
+    # Extract sections with their content for better matching
+    sections = parse_facts_sections()
+    
+    # Read every report first so all of them are matched in one pass
+    md_files = [f for f in os.listdir(facts_dir) if f.endswith('.md') and f != 'facts.md']
+    reports = []
     for file_name in md_files:
-        if file_name == 'facts.md':
-            continue
-            
-        file_path = os.path.join(facts_dir, file_name)
+        with open(os.path.join(facts_dir, file_name), 'r', encoding='utf-8') as file:
+            reports.append(file.read())
+    matched_sections = match_reports_to_sections(reports, sections, client if llm_tie_break else None)
+    
+    # Process each markdown file
+    for file_name, content, matched_section in zip(md_files, reports, matched_sections):
         print(f"\n=== Processing {file_name} ===")
-        
-        # Read the content of the current file
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
             
         # Extract the H1 title from the content
         lines = content.split('\n')
         title = next((line.replace('# ', '') for line in lines if line.startswith('# ')), '')
-        
-        # Find the most relevant section
-        prompt = f"""Given this report:
-{content}
-
-Which of these sections is most relevant (respond with just the section name):
-{', '.join(sections.keys())}"""
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a document matcher. Respond only with the most relevant section name from the list, nothing else."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
-        
-        matched_section = response.choices[0].message.content.strip()
         print(f"Matched with section: {matched_section}")
+
+        # Prefer the facts that mention the report's people, fall back to the matched section
+        related_facts = fact_store.facts_for_text(content) if fact_store else {}
+        if related_facts:
+            print(f"Joined facts: {', '.join(related_facts)}")
+            main_section = "\n\n".join(related_facts.values())
+        else:
+            main_section = sections[matched_section]
         
         # Create merged keywords prompt using the matched section
         prompt = f"""Given these two texts:
 
 1. Main section:
-{sections[matched_section]}
+{main_section}
 
 2. Report to analyze:
 {content}
@@ -215,7 +351,7 @@ Task: Create a comprehensive list of keywords that combines:
 Provide only comma-separated keywords in Polish, no other text."""
 
         # Get merged keywords from GPT-4
-        response = client.chat.completions.create(
+        response = resilient_call("openai", client.chat.completions.create,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a keyword merger. Respond only with comma-separated keywords, nothing else."},
@@ -235,9 +371,10 @@ def main():
     output_dir = convert_reports_to_markdown()
     print(f"\nReports converted to markdown in: {output_dir}")
     merge_facts_to_markdown()
-    add_keywords_to_sections("resources/pliki_z_fabryki/facts/facts.md")
+    add_keywords_to_sections(os.path.join(FACTS_DIR, "facts.md"))
     process_all_markdown_files()
-    merged_keywords = merge_keywords_with_facts()
+    fact_store = FactStore.load_or_build(FACTS_DIR, os.path.join(FACTS_DIR, "facts_index.json"))
+    merged_keywords = merge_keywords_with_facts(fact_store=fact_store)
     send_report("dokumenty", merged_keywords)
 
 if __name__ == "__main__":
@@ -4,17 +4,20 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from assignments.utils.aidevs3_utils import send_report
 from assignments.utils.qdrant_utils import QdrantManager
 
+TASK_DIR = os.path.dirname(os.path.abspath(__file__))
+
 def main():
     qdrant_manager = QdrantManager()
-    reports_folder = "resources/do-not-share"
+    reports_folder = os.path.join(TASK_DIR, "resources", "do-not-share")
     question = "W raporcie, z którego dnia znajduje się wzmianka o kradzieży prototypu broni?"
     print("question = ", question)
+    question_path = os.path.join(TASK_DIR, "question.txt")
 
-    with open("question.txt", 'w', encoding='utf-8') as f:
+    with open(question_path, 'w', encoding='utf-8') as f:
         f.write(question)
 
     qdrant_manager.index_documents(reports_folder, "reports")
-    result = qdrant_manager.search("question.txt", "reports")
+    result = qdrant_manager.search(question_path, "reports")
     print("\nresult = ", result)
 
     send_report("wektory", result)
@@ -1,30 +1,17 @@
 import sys
 import os
+import logging
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from assignments.utils.aidevs3_utils import connect_to_apidb, send_report
+from assignments.utils.aidevs3_utils import send_report
 from assignments.utils.openai_api import ask_gpt
+from assignments.utils.apidb_utils import (
+    get_table_schemas, format_schema_for_prompt, query_apidb
+)
 
 def main():
-    # Get all table structures
-    connections = connect_to_apidb("database", "show create table connections")
-    correct_order = connect_to_apidb("database", "show create table correct_order")
-    datacenters = connect_to_apidb("database", "show create table datacenters")
-    users = connect_to_apidb("database", "show create table users")
-
-    # Combine all structures with clear separation
-    tables_structure = f"""
-    Table: connections
-    {connections}
-
-    Table: correct_order
-    {correct_order}
-
-    Table: datacenters
-    {datacenters}
-
-    Table: users
-    {users}
-    """
+    # Get all table structures, from the schema cache when it is fresh
+    schemas = get_table_schemas("database")
+    tables_structure = format_schema_for_prompt(schemas)
     
     print("Database structure:")
     print(tables_structure)
@@ -45,7 +32,9 @@ def main():
     answer = ask_gpt(prompt, question, "gpt-4o")
     # print("answer: ", answer)
 
-    result = connect_to_apidb("database", answer)
+    # The SQL is written for the MySQL schema, so it runs on the remote apidb, not the SQLite replica
+    result = query_apidb("database", answer)
+    print(f"Answered by: {result.get('backend')}")
     # print("result: ", result)
     
     # Extract dc_id values from the result
@@ -56,4 +45,5 @@ def main():
     send_report("database", answer)
     
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
     main()
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Run one or many assignments in a single process.
+
+    python -m assignments --list
+    python -m assignments S01E03
+    python -m assignments S02 S03E01 --workers 4
+    python -m assignments all --trace-file trace.jsonl --log-dir logs
+
+Tasks are the S??E??/S??E??.py scripts with a main() function. They run in
+parallel threads of one interpreter, so the provider clients, connection
+pools, caches, circuit breakers and latency statistics built by the utils are
+shared, and every span and ledger entry is attributed to its task. Output of
+each task (prints, stderr and logging) is prefixed with its name (or written
+to --log-dir), and a table of per-task wall times is printed at the end.
+"""
+import argparse
+import contextvars
+import glob
+import importlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+from assignments.utils.tracing import bind_context, configure_tracing, span
+from assignments.utils.usage_ledger import records, task_scope
+
+ASSIGNMENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TASK_PATTERN = re.compile(r"^S\d\dE\d\d$")
+
+_task_output = contextvars.ContextVar("task_output", default=None)
+
+
+class TaskOutput:
+    """
+    Stand-in for sys.stdout routing every write to the output of the task
+    running in the current context (see bind_context), or to the real stdout.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        target = _task_output.get()
+        return (target or self.stream).write(text)
+
+    def flush(self):
+        target = _task_output.get()
+        (target or self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class PrefixedWriter:
+    """Write complete lines to a shared stream, each prefixed with the task name."""
+
+    _lock = threading.Lock()
+
+    def __init__(self, name: str, stream):
+        self.prefix = f"[{name}] "
+        self.stream = stream
+        self._buffer = ""
+
+    def write(self, text):
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        if lines:
+            with self._lock:
+                self.stream.write("".join(f"{self.prefix}{line}\n" for line in lines))
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            self.write("\n")
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+def discover_tasks() -> Dict[str, str]:
+    """Map task names to the scripts that define a main() function."""
+    tasks = {}
+    for path in sorted(glob.glob(os.path.join(ASSIGNMENTS_DIR, "S??E??", "S??E??.py"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if not TASK_PATTERN.match(name) or name != os.path.basename(os.path.dirname(path)):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            if re.search(r"^def main\(", f.read(), re.MULTILINE):
+                tasks[name] = path
+    return tasks
+
+
+def select_tasks(requested: List[str], tasks: Dict[str, str]) -> List[str]:
+    """Resolve task names, season prefixes (S02) and "all" to known tasks."""
+    selected = []
+    for name in requested:
+        matches = list(tasks) if name.lower() == "all" else [t for t in tasks if t.startswith(name.upper())]
+        if not matches:
+            raise SystemExit(f"Unknown task {name}, available: {', '.join(tasks)}")
+        selected.extend(t for t in matches if t not in selected)
+    return selected
+
+
+def run_task(name: str, module, log_dir: str = None) -> Dict:
+    """
+    Run module.main() attributed to the task, with its output captured.
+
+    Returns:
+        Dict: Task name, status, wall time in seconds and error, if any
+    """
+    if log_dir:
+        output = open(os.path.join(log_dir, f"{name}.log"), 'w', encoding='utf-8')
+    else:
+        output = PrefixedWriter(name, sys.__stdout__)
+    token = _task_output.set(output)
+    start = time.time()
+    result = {"task": name, "status": "ok", "error": None}
+    try:
+        with task_scope(name), span(f"task.{name}", kind="task", task=name):
+            module.main()
+    except BaseException as e:
+        # A task calling sys.exit() or failing must not take the other tasks down
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc(file=output)
+    finally:
+        result["seconds"] = time.time() - start
+        _task_output.reset(token)
+        output.close()
+    return result
+
+
+def print_results(results: List[Dict], wall_time: float):
+    """Print the per-task wall time, status and provider usage."""
+    usage = {}
+    for entry in records():
+        stats = usage.setdefault(entry["task"], {"requests": 0, "tokens": 0})
+        stats["requests"] += 1
+        stats["tokens"] += entry["prompt_tokens"] + entry["completion_tokens"]
+
+    print("\n=== Tasks ===")
+    print(f"{'task':<8} {'status':<7} {'wall s':>8} {'requests':>9} {'tokens':>8}  error")
+    for result in results:
+        stats = usage.get(result["task"], {"requests": 0, "tokens": 0})
+        print(f"{result['task']:<8} {result['status']:<7} {result['seconds']:>8.2f} "
+              f"{stats['requests']:>9} {stats['tokens']:>8}  {result['error'] or ''}")
+    task_time = sum(result["seconds"] for result in results)
+    print(f"Wall time: {wall_time:.2f}s for {task_time:.2f}s of task time")
+
+
+def main():
+    tasks = discover_tasks()
+    parser = argparse.ArgumentParser(description="Run assignments in one process")
+    parser.add_argument("tasks", nargs="*", help="Task names (S01E03), seasons (S02) or all")
+    parser.add_argument("--list", action="store_true", help="List the runnable tasks")
+    parser.add_argument("--workers", type=int, help="Tasks running at once, defaults to all of them")
+    parser.add_argument("--trace-file", help="Write the spans of the run to this JSONL file")
+    parser.add_argument("--log-dir", help="Write the output of every task to <log-dir>/<task>.log")
+    args = parser.parse_args()
+
+    if args.list or not args.tasks:
+        for name, path in tasks.items():
+            print(f"{name}  {os.path.relpath(path, os.path.dirname(ASSIGNMENTS_DIR))}")
+        return
+
+    selected = select_tasks(args.tasks, tasks)
+    load_dotenv()
+    # stderr and log records of a task go to its output, like its prints
+    stderr = TaskOutput(sys.stderr)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s", stream=stderr)
+    if args.trace_file:
+        configure_tracing(args.trace_file, otel=os.getenv("AIDEVS3_TRACE_OTEL") == "1")
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    # Import one by one before starting threads; import time is reported separately
+    start = time.time()
+    modules = {name: importlib.import_module(f"assignments.{name}.{name}") for name in selected}
+    print(f"Imported {len(modules)} tasks in {time.time() - start:.2f}s")
+
+    sys.stdout = TaskOutput(sys.stdout)
+    sys.stderr = stderr
+    start = time.time()
+    try:
+        with span("tasks", kind="internal", tasks=",".join(selected)):
+            with ThreadPoolExecutor(max_workers=args.workers or len(selected), thread_name_prefix="task") as executor:
+                futures = [executor.submit(bind_context(run_task), name, modules[name], args.log_dir)
+                           for name in selected]
+                results = [future.result() for future in futures]
+    finally:
+        sys.stdout = sys.stdout.stream
+        sys.stderr = sys.stderr.stream
+    print_results(results, time.time() - start)
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
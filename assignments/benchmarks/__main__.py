@@ -0,0 +1,172 @@
+"""
+Benchmark the assignment pipelines against local stand-in servers.
+
+Every external dependency (OpenAI, Anthropic, Groq, centrala, apidb and the
+article host) is served by MockProviderServer and Qdrant runs in memory, so
+the numbers measure our own code plus the injected latency only:
+
+    python -m assignments.benchmarks
+    python -m assignments.benchmarks --scale 20 --latency-ms 80 --jitter-ms 40 --error-rate 0.05
+    python -m assignments.benchmarks --scenarios categorize_files index_documents --repeat 5 --json results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from assignments.benchmarks.mock_servers import MockProviderServer
+
+
+class SpanCollector:
+    """Tracing exporter keeping the duration of every finished span by kind."""
+
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        with self._lock:
+            self.durations.setdefault(span.kind, []).append(span.duration)
+
+    def reset(self) -> Dict[str, List[float]]:
+        with self._lock:
+            durations, self.durations = self.durations, {}
+        return durations
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def latency_stats(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def run_scenario(name: str, scale: int, repeat: int, workdir: str, server: MockProviderServer,
+                 collector: SpanCollector, verbose: bool = False) -> Dict:
+    """
+    Prepare a scenario, run it repeat times and aggregate the measurements.
+
+    Returns:
+        Dict: Throughput, per-iteration latency and per-kind latency of the spans it produced
+    """
+    from assignments.benchmarks.scenarios import SCENARIOS
+
+    scenario_dir = os.path.join(workdir, name)
+    os.makedirs(scenario_dir, exist_ok=True)
+    os.chdir(scenario_dir)
+    run, items = SCENARIOS[name](scale, scenario_dir, server)
+
+    iterations = []
+    calls = {}
+    errors = 0
+    requests_before = sum(server.requests.values())
+    collector.reset()
+    for _ in range(repeat):
+        # The pipelines print progress for every item; keep it out of the report
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        start = time.perf_counter()
+        try:
+            with output:
+                run()
+        except Exception as e:
+            errors += 1
+            print(f"  {name}: iteration failed: {e}", file=sys.stderr)
+        iterations.append(time.perf_counter() - start)
+        for kind, durations in collector.reset().items():
+            calls.setdefault(kind, []).extend(durations)
+
+    total = sum(iterations)
+    return {
+        "scenario": name,
+        "items": items,
+        "repeat": repeat,
+        "errors": errors,
+        "wall_seconds": round(total, 3),
+        "items_per_second": round(items * repeat / total, 1) if total else None,
+        "iteration": latency_stats(iterations),
+        "spans": {kind: latency_stats(durations) for kind, durations in sorted(calls.items())},
+        "server_requests": sum(server.requests.values()) - requests_before,
+    }
+
+
+def print_result(result: Dict):
+    iteration = result["iteration"]
+    print(f"\n{result['scenario']}: {result['items']} items x {result['repeat']}, "
+          f"{result['items_per_second']} items/s, {result['server_requests']} requests"
+          + (f", {result['errors']} failed iterations" if result["errors"] else ""))
+    print(f"  iteration     p50 {iteration['p50_ms']:>9} ms  p95 {iteration['p95_ms']:>9} ms  "
+          f"p99 {iteration['p99_ms']:>9} ms")
+    for kind, stats in result["spans"].items():
+        print(f"  {kind:<13} p50 {stats['p50_ms']:>9} ms  p95 {stats['p95_ms']:>9} ms  "
+              f"p99 {stats['p99_ms']:>9} ms  ({stats['count']} spans)")
+
+
+def main():
+    from assignments.benchmarks.scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(description="Benchmark the pipelines against local stand-in servers")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--scale", type=int, default=10, help="Input size multiplier of every scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="Measured iterations per scenario")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency added to every mock request")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Random extra latency up to this value")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests failing with 429/500")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the pipelines")
+    args = parser.parse_args()
+
+    server = MockProviderServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                error_rate=args.error_rate, seed=args.seed, apidb_rows=args.scale * 100)
+    # Point every SDK and helper at the stand-in before any client is created
+    os.environ.update(server.env())
+    os.environ.setdefault("AIDEVS3_USAGE_SUMMARY", "0")
+
+    from assignments.utils.tracing import add_exporter, configure_tracing
+
+    configure_tracing(os.getenv("AIDEVS3_TRACE_FILE"))
+    collector = SpanCollector()
+    add_exporter(collector)
+
+    cwd = os.getcwd()
+    results = []
+    with server, tempfile.TemporaryDirectory(prefix="aidevs3-bench-") as workdir:
+        print(f"Mock server at {server.url} (latency {args.latency_ms}+{args.jitter_ms} ms, "
+              f"error rate {args.error_rate})")
+        try:
+            for name in args.scenarios:
+                result = run_scenario(name, args.scale, args.repeat, workdir, server, collector, args.verbose)
+                print_result(result)
+                results.append(result)
+        finally:
+            os.chdir(cwd)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
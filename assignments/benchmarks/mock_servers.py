@@ -0,0 +1,379 @@
+import email.parser
+import email.policy
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+EMBEDDING_SIZE = 1536
+
+# MySQL definitions served by the apidb stand-in, mirrored into SQLite for the data
+APIDB_TABLES = {
+    "users": ("CREATE TABLE `users` (\n"
+              "  `id` int(11) NOT NULL AUTO_INCREMENT,\n"
+              "  `username` varchar(20) DEFAULT NULL,\n"
+              "  `access_level` varchar(20) DEFAULT 'user',\n"
+              "  `is_active` int(11) DEFAULT 1,\n"
+              "  `lastlog` date DEFAULT NULL,\n"
+              "  PRIMARY KEY (`id`)\n"
+              ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4",
+              'CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, access_level TEXT, is_active INTEGER, lastlog TEXT)'),
+    "datacenters": ("CREATE TABLE `datacenters` (\n"
+                    "  `dc_id` int(11) DEFAULT NULL,\n"
+                    "  `location` varchar(30) NOT NULL,\n"
+                    "  `manager` int(11) NOT NULL DEFAULT 31,\n"
+                    "  `is_active` int(11) DEFAULT 0\n"
+                    ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4",
+                    'CREATE TABLE datacenters (dc_id INTEGER, location TEXT, manager INTEGER, is_active INTEGER)'),
+    "connections": ("CREATE TABLE `connections` (\n"
+                    "  `user1_id` int(11) NOT NULL,\n"
+                    "  `user2_id` int(11) NOT NULL,\n"
+                    "  PRIMARY KEY (`user1_id`,`user2_id`)\n"
+                    ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4",
+                    'CREATE TABLE connections (user1_id INTEGER, user2_id INTEGER, PRIMARY KEY (user1_id, user2_id))'),
+    "correct_order": ("CREATE TABLE `correct_order` (\n"
+                      "  `base_id` int(11) DEFAULT NULL,\n"
+                      "  `letter` char(1) DEFAULT NULL,\n"
+                      "  `weight` int(11) DEFAULT 0\n"
+                      ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4",
+                      'CREATE TABLE correct_order (base_id INTEGER, letter TEXT, weight INTEGER)'),
+}
+
+
+def fake_embedding(text: str, size: int = EMBEDDING_SIZE) -> list:
+    """Deterministic hashed bag-of-words vector, so similar texts get similar embeddings."""
+    vector = [0.0] * size
+    for token in re.findall(r'\w+', text.lower()):
+        vector[int(hashlib.md5(token.encode('utf-8')).hexdigest(), 16) % size] += 1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def fake_chat_reply(body: dict) -> str:
+    """
+    Produce a plausible reply for the prompts used across the assignments.
+    """
+    messages = body.get("messages", [])
+    system = " ".join(str(m.get("content")) for m in messages if m.get("role") == "system")
+    user = " ".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for m in messages if m.get("role") == "user"
+        for part in (m["content"] if isinstance(m.get("content"), list) else [m.get("content", "")])
+    )
+
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        ids = re.findall(r'<question id="([^"]+)">', user)
+        return json.dumps({q_id: "odpowiedź" for q_id in ids})
+    if "JSON array" in system:
+        count = len(re.findall(r'^\d+\. ', user, flags=re.MULTILINE))
+        return json.dumps(["word"] * count)
+    if "requested JSON format" in system:
+        return json.dumps({"title": user.strip().splitlines()[-1][:40] if user.strip() else "Raport",
+                           "keywords": ["raport", "sektor", "patrol", "robot", "fabryka"]})
+    if "Content Classifier" in system:
+        return "<thinking>routine report</thinking> other"
+    if "keyword" in system.lower():
+        return "Sektor C, patrol, robot, fabryka"
+    if "ALWAYS a number" in system:
+        return "1939"
+    return "word"
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients cancel requests (races, hedging, timeouts); that is not a server error
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class MockProviderServer:
+    """
+    Local stand-in for every external endpoint the assignments talk to.
+
+    Serves an OpenAI-compatible API (chat, embeddings, audio, files and
+    batches), the Anthropic messages and message batches API, the Cloudflare
+    worker, the centrala /report and /apidb endpoints and a small article with
+    images and audio. Every request can be delayed by latency_ms (+ jitter)
+    and failed with error_rate (429 with Retry-After or 500). Batches end
+    batch_delay seconds after they are created.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 seed: int = 0, apidb_rows: int = 100):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = {}
+        self.article_paragraphs = 10
+        self.apidb_rows = apidb_rows
+        self.batch_delay = 0.0
+        self._files = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+        self._db = self._build_apidb(apidb_rows)
+        self._server = QuietHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def env(self) -> dict:
+        """Environment variables pointing every SDK and helper at this server."""
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "OPENAI_API_KEY": "mock-key",
+            "ANTHROPIC_BASE_URL": self.url,
+            "ANTHROPIC_API_KEY": "mock-key",
+            "GROQ_BASE_URL": self.url,
+            "GROQ_API_KEY": "mock-key",
+            "AIDEVS3_API_KEY": "mock-key",
+            "URL_REPORT": f"{self.url}/report",
+            "APIDB_URL": f"{self.url}/apidb",
+            "URL_CLOUDFLARE_LAMA-3-2": f"{self.url}/cloudflare",
+        }
+
+    def start(self) -> "MockProviderServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _build_apidb(self, rows: int) -> sqlite3.Connection:
+        db = sqlite3.connect(":memory:", check_same_thread=False)
+        for _, sqlite_ddl in APIDB_TABLES.values():
+            db.execute(sqlite_ddl)
+        db.executemany("INSERT INTO users VALUES (?, ?, 'user', ?, '2024-11-12')",
+                       [(i, f"user{i}", i % 3 != 0) for i in range(1, rows + 1)])
+        db.executemany("INSERT INTO datacenters VALUES (?, ?, ?, ?)",
+                       [(i, f"dc{i}", i % rows + 1, i % 2) for i in range(1, rows // 2 + 1)])
+        db.executemany("INSERT INTO connections VALUES (?, ?)",
+                       [(i, i % rows + 1) for i in range(1, rows + 1)])
+        db.executemany("INSERT INTO correct_order VALUES (?, ?, ?)",
+                       [(i, chr(65 + i % 26), i) for i in range(1, rows + 1)])
+        return db
+
+    def _count(self, route: str):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def _inject(self):
+        """Sleep for the configured latency and decide whether to fail the request."""
+        delay = self.latency_ms + (self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay:
+            time.sleep(delay / 1000)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return self.random.choice([429, 500])
+        return None
+
+    def _apidb(self, body: dict) -> dict:
+        query = body.get("query", "").strip()
+        match = re.match(r'show create table (\w+)', query, re.IGNORECASE)
+        if match:
+            table = match.group(1)
+            return {"reply": [{"Table": table, "Create Table": APIDB_TABLES[table][0]}], "error": "OK"}
+        with self._lock:
+            cursor = self._db.execute(query.replace('`', '"'))
+            columns = [c[0] for c in cursor.description or []]
+            # The real API returns every value as a string
+            rows = [{c: (None if v is None else str(v)) for c, v in zip(columns, row)} for row in cursor.fetchall()]
+        return {"reply": rows, "error": "OK"}
+
+    def _chat_completion(self, body: dict, request_size: int) -> dict:
+        reply = fake_chat_reply(body)
+        prompt_tokens = request_size // 4
+        return {
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": reply}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(reply) // 4 + 1,
+                      "total_tokens": prompt_tokens + len(reply) // 4 + 1}
+        }
+
+    def _message(self, body: dict, request_size: int) -> dict:
+        system = [{"role": "system", "content": body["system"]}] if body.get("system") else []
+        reply = fake_chat_reply({"messages": system + body.get("messages", [])})
+        return {
+            "id": "msg_mock", "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": [{"type": "text", "text": reply}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": request_size // 4, "output_tokens": len(reply) // 4 + 1}
+        }
+
+    def _upload(self, content_type: str, raw: bytes) -> dict:
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + raw)
+        part = next(p for p in message.iter_parts() if p.get_param("name", header="content-disposition") == "file")
+        with self._lock:
+            file_id = f"file-{len(self._files) + 1}"
+            self._files[file_id] = part.get_payload(decode=True)
+        return {"id": file_id, "object": "file", "bytes": len(self._files[file_id]), "created_at": int(time.time()),
+                "filename": part.get_filename(), "purpose": "batch", "status": "processed"}
+
+    def _create_batch(self, provider: str, lines: list) -> dict:
+        """Answer every request of a batch now; the batch reports them once batch_delay passed."""
+        results = []
+        for line in lines:
+            if provider == "anthropic":
+                message = self._message(line["params"], len(json.dumps(line["params"])))
+                results.append({"custom_id": line["custom_id"], "result": {"type": "succeeded", "message": message}})
+            else:
+                completion = self._chat_completion(line["body"], len(json.dumps(line["body"])))
+                results.append({"id": f"batch_req_{len(results)}", "custom_id": line["custom_id"], "error": None,
+                                "response": {"status_code": 200, "request_id": "mock", "body": completion}})
+        with self._lock:
+            batch_id = f"{'msgbatch' if provider == 'anthropic' else 'batch'}_{len(self._batches) + 1}"
+            self._batches[batch_id] = {"provider": provider, "created_at": time.time(), "results": results}
+            if provider == "openai":
+                self._files[f"{batch_id}-output"] = "".join(json.dumps(r) + "\n" for r in results).encode('utf-8')
+        return self._batch(batch_id)
+
+    def _batch(self, batch_id: str) -> dict:
+        batch = self._batches[batch_id]
+        ended = time.time() - batch["created_at"] >= self.batch_delay
+        total = len(batch["results"])
+        if batch["provider"] == "anthropic":
+            created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["created_at"]))
+            return {"id": batch_id, "type": "message_batch", "processing_status": "ended" if ended else "in_progress",
+                    "request_counts": {"processing": 0 if ended else total, "succeeded": total if ended else 0,
+                                       "errored": 0, "canceled": 0, "expired": 0},
+                    "created_at": created, "expires_at": created, "ended_at": created if ended else None,
+                    "cancel_initiated_at": None, "archived_at": None,
+                    "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None}
+        return {"id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions", "errors": None,
+                "input_file_id": "file-mock", "completion_window": "24h",
+                "status": "completed" if ended else "in_progress", "created_at": int(batch["created_at"]),
+                "output_file_id": f"{batch_id}-output" if ended else None, "error_file_id": None,
+                "request_counts": {"total": total, "completed": total if ended else 0, "failed": 0}}
+
+    def _article(self) -> str:
+        paragraphs = "\n".join(
+            f"<p>Akapit {i} o profesorze Maju, owocach i podróżach w czasie numer {i}.</p>"
+            for i in range(self.article_paragraphs)
+        )
+        return ("<html><body><article><h1>Artykuł</h1>" + paragraphs +
+                '<figure><img src="i/fruit.png"><figcaption>Owoc</figcaption></figure>'
+                '<audio><source src="i/rafal.mp3"></audio></article></body></html>')
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload, content_type: str = "application/json", headers=None):
+                data = payload if isinstance(payload, bytes) else (
+                    payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8'))
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _fail(self, status: int):
+                if status == 429:
+                    self._send(429, {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+                               headers={"Retry-After": "0.05"})
+                else:
+                    self._send(500, {"error": {"message": "mock failure", "type": "server_error"}})
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                server._count(f"GET {path}")
+                status = server._inject()
+                if status:
+                    return self._fail(status)
+                batch = re.match(r'.*/v1/(?:messages/)?batches/([\w-]+)(/results)?$', path)
+                if batch and batch.group(1) in server._batches:
+                    if batch.group(2):
+                        results = server._batches[batch.group(1)]["results"]
+                        return self._send(200, "".join(json.dumps(r) + "\n" for r in results), "application/x-jsonl")
+                    return self._send(200, server._batch(batch.group(1)))
+                content = re.match(r'.*/v1/files/([\w-]+)/content$', path)
+                if content and content.group(1) in server._files:
+                    return self._send(200, server._files[content.group(1)], "application/octet-stream")
+                if path.endswith(".png"):
+                    return self._send(200, b"\x89PNG\r\n\x1a\n" + b"\0" * 256, "image/png")
+                if path.endswith(".mp3"):
+                    return self._send(200, b"ID3" + b"\0" * 4096, "audio/mpeg")
+                if path.endswith("questions.txt"):
+                    return self._send(200, "\n".join(f"{i:02d}=Pytanie {i}?" for i in range(1, 6)), "text/plain")
+                return self._send(200, server._article(), "text/html; charset=utf-8")
+
+            def do_POST(self):
+                path = self.path.split('?')[0].replace("/openai/v1", "/v1")
+                raw = self._body()
+                server._count(f"POST {path}")
+                status = server._inject()
+                if status:
+                    return self._fail(status)
+
+                if path.endswith("/chat/completions"):
+                    return self._send(200, server._chat_completion(json.loads(raw), len(raw)))
+                if path.endswith("/embeddings"):
+                    body = json.loads(raw)
+                    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                    tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+                    return self._send(200, {
+                        "object": "list", "model": body.get("model"),
+                        "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(str(text))}
+                                 for i, text in enumerate(inputs)],
+                        "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+                    })
+                if path.endswith("/audio/transcriptions"):
+                    duration = round(len(raw) / 16000, 2)
+                    return self._send(200, {"text": "Profesor Maj wykładał na uczelni w Krakowie.",
+                                            "duration": duration, "language": "pl"})
+                if path.endswith("/v1/messages"):
+                    return self._send(200, server._message(json.loads(raw), len(raw)))
+                if path.endswith("/v1/messages/batches"):
+                    return self._send(200, server._create_batch("anthropic", json.loads(raw)["requests"]))
+                if path.endswith("/v1/files"):
+                    return self._send(200, server._upload(self.headers.get("Content-Type"), raw))
+                if path.endswith("/v1/batches"):
+                    body = json.loads(raw)
+                    lines = [json.loads(line) for line in server._files[body["input_file_id"]].decode('utf-8').splitlines()
+                             if line.strip()]
+                    return self._send(200, server._create_batch("openai", lines))
+                if path.endswith("/cloudflare"):
+                    text = parse_qs(raw.decode('utf-8')).get("text", [""])[0]
+                    return self._send(200, fake_chat_reply({"messages": [{"role": "system", "content": text},
+                                                                         {"role": "user", "content": text}]}),
+                                      "text/plain; charset=utf-8")
+                if path.endswith("/report"):
+                    return self._send(200, {"code": 0, "message": "OK"})
+                if path.endswith("/apidb"):
+                    try:
+                        return self._send(200, server._apidb(json.loads(raw)))
+                    except sqlite3.Error as e:
+                        return self._send(200, {"reply": None, "error": str(e)})
+                return self._send(404, {"error": "unknown endpoint"})
+
+        return Handler
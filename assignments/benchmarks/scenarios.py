@@ -0,0 +1,162 @@
+import os
+import random
+from typing import Callable, Dict, Tuple
+
+from assignments.benchmarks.mock_servers import MockProviderServer
+
+# Every scenario prepares its inputs in workdir (also the working directory of the
+# run) and returns (run, items): run() performs one measured iteration and items is
+# the number of units it processes
+Scenario = Callable[[int, str, MockProviderServer], Tuple[Callable[[], object], int]]
+
+SCENARIOS: Dict[str, Scenario] = {}
+
+
+def scenario(name: str):
+    def decorator(func: Scenario) -> Scenario:
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def report_text(idx: int) -> str:
+    sectors = ["A", "B", "C"]
+    return (f"Raport patrolu numer {idx}\n"
+            f"Sektor {sectors[idx % 3]}{idx % 4}. Jednostka patrolowa wykryła ruch w pobliżu fabryki. "
+            f"Robot numer {idx} sprawdził teren, nie znaleziono intruzów.\n")
+
+
+@scenario("validate_math_equations")
+def validate_math_equations_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from assignments.S01E03.S01E03 import validate_math_equations
+
+    rng = random.Random(scale)
+    items = scale * 100
+    template = []
+    for _ in range(items):
+        a, b = rng.randint(0, 99), rng.randint(0, 99)
+        template.append({"question": f"{a} + {b}", "answer": a + b + (rng.random() < 0.1)})
+
+    def run():
+        data = {"test-data": [dict(item) for item in template]}
+        return validate_math_equations(data, chunk_size=100)
+    return run, items
+
+
+@scenario("process_test_questions")
+def process_test_questions_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from assignments.S01E03.S01E03 import process_test_questions
+
+    items = scale * 5
+
+    def run():
+        data = {"test-data": [
+            {"question": "1 + 1", "answer": 2, "test": {"q": f"What is the capital of country {i}?", "a": "???"}}
+            for i in range(items)
+        ]}
+        return process_test_questions(data)
+    return run, items
+
+
+@scenario("html_to_markdown")
+def html_to_markdown_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from assignments.utils.aidevs3_utils import html_to_markdown
+
+    server.article_paragraphs = scale * 10
+    return lambda: html_to_markdown(f"{server.url}/dane/arxiv-draft.html"), server.article_paragraphs
+
+
+@scenario("get_answers_from_content")
+def get_answers_from_content_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from assignments.utils.openai_api import get_answers_from_content
+
+    content = "\n\n".join(report_text(i) for i in range(scale * 10))
+    questions = {f"{i:02d}": f"Co sprawdził robot numer {i}?" for i in range(1, scale + 1)}
+    return lambda: get_answers_from_content(content, questions), len(questions)
+
+
+@scenario("semantic_cache_store")
+def semantic_cache_store_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from concurrent.futures import ThreadPoolExecutor
+    from assignments.utils.semantic_cache import SemanticCache, fingerprint
+
+    cache_path = os.path.join(workdir, "semantic_cache.json")
+    items = scale * 40
+
+    def run():
+        # Concurrent stores to one file-backed cache, each of them saving it
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        # A local embedding keeps the iteration about saving, not the embeddings endpoint
+        cache = SemanticCache(cache_path, max_entries=items, embed=lambda texts: [[1.0, float(len(texts[0]))]])
+        content_fingerprint = fingerprint("benchmark")
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda i: cache.store("benchmark", f"Question {i}?", content_fingerprint, f"Answer {i}"),
+                              range(items)))
+        return len(cache.entries)
+    return run, items
+
+
+@scenario("categorize_files")
+def categorize_files_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from assignments.S02E04.S02E04 import categorize_files
+
+    directory = os.path.join(workdir, "categorize")
+    os.makedirs(directory, exist_ok=True)
+    items = scale * 5
+    for i in range(items):
+        with open(os.path.join(directory, f"report_{i}.md"), 'w', encoding='utf-8') as f:
+            f.write(f"---\nfilename: report_{i}.txt\n---\n\n{report_text(i)}")
+    labels_path = os.path.join(directory, "labels.json")
+
+    def run():
+        # Start every iteration from the seed examples only
+        if os.path.exists(labels_path):
+            os.remove(labels_path)
+        return categorize_files(directory, labels_path)
+    return run, items
+
+
+@scenario("index_documents")
+def index_documents_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from qdrant_client import QdrantClient
+    from assignments.utils.qdrant_utils import QdrantManager
+
+    directory = os.path.join(workdir, "reports")
+    os.makedirs(directory, exist_ok=True)
+    items = scale * 5
+    for i in range(items):
+        with open(os.path.join(directory, f"2024_{i // 28 % 12 + 1:02d}_{i % 28 + 1:02d}.txt"), 'w',
+                  encoding='utf-8') as f:
+            f.write(report_text(i))
+
+    manager = QdrantManager(client=QdrantClient(":memory:"))
+    return lambda: manager.index_documents(directory, "benchmark"), items
+
+
+@scenario("send_report")
+def send_report_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from assignments.utils.aidevs3_utils import send_report
+
+    items = scale * 5
+
+    def run():
+        return [send_report("benchmark", {"answer": i}) for i in range(items)]
+    return run, items
+
+
+@scenario("apidb_schemas")
+def apidb_schemas_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from assignments.utils.apidb_utils import get_table_schemas
+
+    cache_path = os.path.join(workdir, "apidb_schema_cache.json")
+    return lambda: get_table_schemas("database", cache_path=cache_path, refresh=True), 4
+
+
+@scenario("apidb_sync_replica")
+def apidb_sync_replica_scenario(scale: int, workdir: str, server: MockProviderServer):
+    from assignments.utils.apidb_utils import sync_replica
+
+    db_path = os.path.join(workdir, "apidb_replica.sqlite")
+    # users, connections and correct_order hold apidb_rows rows, datacenters half of that
+    return lambda: sync_replica("database", db_path=db_path), server.apidb_rows * 3 + server.apidb_rows // 2
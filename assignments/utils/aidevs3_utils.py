@@ -1,20 +1,51 @@
 import os
-import requests
 import json
+import functools
+import time
 from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
-from openai import OpenAI
-from anthropic import Anthropic
-from groq import Groq
 from pathlib import Path
 from typing import Dict, List
 from dotenv import load_dotenv
 import base64
-from bs4 import BeautifulSoup
-import markdown
+import logging
+import tempfile
+from assignments.utils.cassette_utils import install_from_env
+from assignments.utils.lazy_utils import lazy_import
+from assignments.utils.model_router import observe, route
+from assignments.utils.openai_api import get_openai_client
+from assignments.utils.resilience_utils import resilient_call, check_status
+from assignments.utils.token_budget import count_tokens, fit_content
+from assignments.utils.tracing import span, text_size, traced
+from assignments.utils.usage_ledger import record_response
+
+# Heavy SDKs are imported on first use
+requests = lazy_import("requests")
+anthropic = lazy_import("anthropic")
+groq = lazy_import("groq")
+bs4 = lazy_import("bs4")
 
 load_dotenv()
 
+# Record or replay HTTP traffic when AIDEVS3_CASSETTE is set
+install_from_env()
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def get_anthropic_client():
+    """Shared Anthropic client, created on first use."""
+    # Retries are handled by resilient_call
+    return anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"), max_retries=0)
+
+
+@functools.lru_cache(maxsize=None)
+def get_groq_client():
+    """Shared Groq client, created on first use."""
+    # Retries are handled by resilient_call
+    return groq.Groq(api_key=os.environ.get("GROQ_API_KEY"), max_retries=0)
+
 
 def send_answer_centrala(task, answer):
     """
@@ -35,11 +66,14 @@ def send_answer_centrala(task, answer):
         
         # Send POST request
         print("Sending answer...")
-        response = requests.post(
-            url_report,
-            json=payload,
-            headers={'Content-Type': 'application/json'}
-        )
+        with span("centrala.report", kind="centrala", call_site="send_answer_centrala", task=task,
+                  request_chars=text_size(payload)) as s:
+            response = resilient_call("centrala", lambda: check_status(requests.post(
+                url_report,
+                json=payload,
+                headers={'Content-Type': 'application/json'}
+            )))
+            s.set(status=response.status_code, response_chars=text_size(response.text))
         
         # Check response
         response.raise_for_status()
@@ -48,13 +82,37 @@ def send_answer_centrala(task, answer):
     except requests.exceptions.RequestException as e:
         print(f"Error sending request: {str(e)}")
 
-def send_report(task: str, answer: str) -> str:
+class ReportFileBody:
+    """
+    Report request body whose answer is a JSON file, streamed from disk.
+
+    Iterable more than once, so a retried request sends the whole body again.
+    """
+
+    def __init__(self, prefix: bytes, path: str, suffix: bytes, chunk_size: int = 1 << 16):
+        self.prefix = prefix
+        self.path = path
+        self.suffix = suffix
+        self.chunk_size = chunk_size
+        self.size = len(prefix) + os.path.getsize(path) + len(suffix)
+
+    def __iter__(self):
+        yield self.prefix
+        with open(self.path, 'rb') as f:
+            while chunk := f.read(self.chunk_size):
+                yield chunk
+        yield self.suffix
+
+
+def send_report(task: str, answer: str = None, answer_path: str = None) -> str:
     """
     Send a report to the AIDEVS3 API.
     
     Args:
         task (str): Task identifier
         answer (str): Answer to submit
+        answer_path (str): JSON file holding the answer, sent from disk without
+            loading it (instead of answer)
         
     Returns:
         str: Response from the API
@@ -66,31 +124,41 @@ def send_report(task: str, answer: str) -> str:
         if not url or not api_key:
             raise ValueError("URL_REPORT or AIDEVS3_API_KEY environment variable is not set")
         
-        data = {
-            "task": task,
-            "apikey": api_key,
-            "answer": answer
-        }
-        
-        json_data = json.dumps(data).encode('utf-8')
-        
         headers = {
             'Content-Type': 'application/json',
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
+        if answer_path:
+            envelope = json.dumps({"task": task, "apikey": api_key}).encode('utf-8')
+            json_data = ReportFileBody(envelope[:-1] + b', "answer": ', answer_path, b'}')
+            headers['Content-Length'] = str(json_data.size)
+            request_chars = json_data.size
+        else:
+            data = {
+                "task": task,
+                "apikey": api_key,
+                "answer": answer
+            }
+            
+            json_data = json.dumps(data).encode('utf-8')
+            request_chars = text_size(json_data)
+        
         request = Request(url, data=json_data, headers=headers, method='POST')
         
-        with urlopen(request) as response:
-            # Print response headers
-            print("\nResponse Headers:")
-            for header, value in response.headers.items():
-                print(f"{header}: {value}")
+        with span("centrala.report", kind="centrala", call_site="send_report", task=task,
+                  request_chars=request_chars) as s:
+            with resilient_call("centrala", urlopen, request) as response:
+                # Print response headers
+                print("\nResponse Headers:")
+                for header, value in response.headers.items():
+                    print(f"{header}: {value}")
             
-            # Get and print response body
-            response_text = response.read().decode('utf-8')
-            print(f"\nResponse Body:\n{response_text}")
-            return response_text
+                # Get and print response body
+                response_text = response.read().decode('utf-8')
+                s.set(status=response.status, response_chars=text_size(response_text))
+                print(f"\nResponse Body:\n{response_text}")
+                return response_text
     
     except (HTTPError, URLError, Exception) as e:
         print(f"Error in send_report: {str(e)}")
@@ -99,25 +167,32 @@ def send_report(task: str, answer: str) -> str:
 # S02E05
 def process_audio(audio_url):
     """Process audio using Whisper and return transcription"""
-    client = OpenAI()
+    client = get_openai_client()
     
     # Download the audio file
-    response = requests.get(audio_url)
+    with span("http.get", kind="http", call_site="process_audio", url=audio_url) as s:
+        response = resilient_call("http", lambda: check_status(requests.get(audio_url)))
+        s.set(status=response.status_code, response_bytes=len(response.content))
     print(f"Downloaded audio from {audio_url}, status code: {response.status_code}")
     
-    # Save temporarily
-    temp_audio_path = "temp_audio.mp3"
-    with open(temp_audio_path, "wb") as f:
+    # Save temporarily, under a unique name so concurrent tasks don't share the file
+    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
         f.write(response.content)
+    temp_audio_path = f.name
     print(f"Audio saved to {temp_audio_path}")
     
     # Get transcription using Whisper
     try:
         with open(temp_audio_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
+            with span("openai.transcription", kind="transcription", call_site="process_audio", model="whisper-1",
+                      request_bytes=os.path.getsize(temp_audio_path)) as s:
+                transcription = resilient_call("openai", client.audio.transcriptions.create,
+                    model="whisper-1",
+                    file=(os.path.basename(temp_audio_path), audio_file.read()),  # bytes can be re-sent on retry
+                    response_format="verbose_json"  # includes the audio duration
+                )
+                s.set(response_chars=text_size(transcription.text))
+                record_response(s, transcription, "openai")
         print(f"Transcription received: {transcription.text}")
         print(f"Transcription length: {len(transcription.text)} characters")
         # Return just the transcription text
@@ -130,9 +205,50 @@ def process_audio(audio_url):
         print(f"Temporary file {temp_audio_path} removed")
 
 # S02E04
-def transcribe_audio_with_groq(input_folder: str, overwrite: bool = False) -> dict:
+AUDIO_FORMATS = {".m4a", ".mp3", ".wav", ".ogg", ".flac", ".aac"}
+
+def transcribe_audio_file(client, audio_file: Path) -> Path:
+    """
+    Transcribe a single audio file with Groq Whisper into a markdown file next to it.
+    
+    Args:
+        client (Groq): Groq client
+        audio_file (Path): Audio file to transcribe
+        
+    Returns:
+        Path: Path of the written markdown file
+    """
+    audio_file = Path(audio_file)
+    output_file = audio_file.parent / f"{audio_file.stem}.md"
 
+    # Validate file size (25MB limit)
+    if audio_file.stat().st_size > 25 * 1024 * 1024:
+        raise ValueError("File too large (max 25MB)")
+    
+    with open(audio_file, "rb") as file:
+        with span("groq.transcription", kind="transcription", call_site="transcribe_audio_file",
+                  model="whisper-large-v3-turbo", file=audio_file.name, request_bytes=audio_file.stat().st_size) as s:
+            transcription = resilient_call("groq", client.audio.transcriptions.create,
+                file=(str(audio_file), file.read()),
+                model="whisper-large-v3-turbo",
+                response_format="verbose_json"  # includes the audio duration
+            )
+            s.set(response_chars=text_size(transcription.text))
+            record_response(s, transcription, "groq")
+    
+    # Create content with YAML front matter metadata and content
+    content = f"""---
+filename: {audio_file.name}
+---
+
+{transcription.text}"""
+    
+    # Write transcription to file
+    output_file.write_text(content, encoding="utf-8")
+    return output_file
 
+@traced("transcribe_audio_with_groq")
+def transcribe_audio_with_groq(input_folder: str, overwrite: bool = False) -> dict:
     """
     Transcribe audio files to markdown files.
     
@@ -144,15 +260,12 @@ def transcribe_audio_with_groq(input_folder: str, overwrite: bool = False) -> di
         dict: Summary of transcription results
     """
     # Initialize Groq client
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-    
-    # Define supported audio formats
-    SUPPORTED_FORMATS = {".m4a", ".mp3", ".wav", ".ogg", ".flac", ".aac"}
+    client = get_groq_client()
     
     # Get all audio files
     audio_files = [
         f for f in Path(input_folder).iterdir()
-        if f.suffix.lower() in SUPPORTED_FORMATS
+        if f.suffix.lower() in AUDIO_FORMATS
     ]
     
     results = {"processed": 0, "skipped": 0, "failed": 0}
@@ -169,26 +282,7 @@ def transcribe_audio_with_groq(input_folder: str, overwrite: bool = False) -> di
         print(f"Transcribing {audio_file.name}...")
         
         try:
-            # Validate file size (25MB limit)
-            if audio_file.stat().st_size > 25 * 1024 * 1024:
-                raise ValueError("File too large (max 25MB)")
-            
-            with open(audio_file, "rb") as file:
-                transcription = client.audio.transcriptions.create(
-                    file=(str(audio_file), file.read()),
-                    model="whisper-large-v3-turbo",
-                    response_format="text"
-                )
-            
-            # Create content with YAML front matter metadata and content
-            content = f"""---
-filename: {audio_file.name}
----
-
-{transcription}"""
-            
-            # Write transcription to file
-            output_file.write_text(content, encoding="utf-8")
+            transcribe_audio_file(client, audio_file)
             print(f"✓ Successfully transcribed to {output_file}")
             results["processed"] += 1
             
@@ -201,43 +295,104 @@ filename: {audio_file.name}
 # S02E05
 def process_image(image_url, caption=""):
     """Process image using GPT-4V and return markdown-formatted description"""
-    client = OpenAI()
+    client = get_openai_client()
     
     # Ensure the image URL is complete
     if not image_url.startswith(('http://', 'https://')):
         image_url = f"https://{image_url}"
     
     # Download and encode image
-    response = requests.get(image_url)
+    with span("http.get", kind="http", call_site="process_image", url=image_url) as s:
+        response = resilient_call("http", lambda: check_status(requests.get(image_url)))
+        s.set(status=response.status_code, response_bytes=len(response.content))
     image_data = base64.b64encode(response.content).decode('utf-8')
     
     # Get image description from GPT-4V
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"Describe this image briefly with attention to details and context. Do it all in Polish. Context: {caption}"
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_data}"
+    with span("openai.chat", kind="vision", call_site="process_image", model="gpt-4o",
+              request_bytes=len(image_data), images=1) as s:
+        response = resilient_call("openai", client.chat.completions.create,
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": f"Describe this image briefly with attention to details and context. Do it all in Polish. Context: {caption}"
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{image_data}"
+                            }
                         }
-                    }
-                ]
-            }
-        ],
-        max_tokens=100
-    )
+                    ]
+                }
+            ],
+            max_tokens=100
+        )
+        s.set(response_chars=text_size(response.choices[0].message.content))
+        record_response(s, response, "openai", images=1)
     
     description = response.choices[0].message.content
     return description
 
 # S02E04
+IMAGE_FORMATS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+def extract_text_from_image_file(client, image_file: Path) -> str:
+    """
+    Extract text from a single image with GPT-4 Vision and save it as a markdown file next to it.
+    
+    Args:
+        client (OpenAI): OpenAI client
+        image_file (Path): Image file to read
+        
+    Returns:
+        str: Extracted text
+    """
+    image_file = Path(image_file)
+    md_path = image_file.parent / f"{image_file.stem}.md"
+
+    # Read image file as base64
+    with open(image_file, "rb") as img_file:
+        with span("openai.chat", kind="vision", call_site="extract_text_from_image_file", model="gpt-4o",
+                  file=image_file.name, request_bytes=image_file.stat().st_size, images=1) as s:
+            response = resilient_call("openai", client.chat.completions.create,
+                model="gpt-4o",  # Using the correct model name
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": "Please extract and return ONLY the text content from this image. Do not include any additional formatting, comments, or metadata."},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{base64.b64encode(img_file.read()).decode('utf-8')}"
+                                }
+                            }
+                        ]
+                    }
+                ],
+                max_tokens=1000
+            )
+            s.set(response_chars=text_size(response.choices[0].message.content))
+            record_response(s, response, "openai", images=1)
+        
+    text = response.choices[0].message.content
+    
+    # Create content with YAML front matter metadata and content
+    content = f"""---
+filename: {image_file.name}
+---
+
+{text}"""
+    
+    # Write to markdown file
+    md_path.write_text(content, encoding="utf-8")
+    return text
+
+@traced("extract_text_from_images")
 def extract_text_from_images(input_folder: str, overwrite: bool = False) -> dict:
 
     """
@@ -250,15 +405,12 @@ def extract_text_from_images(input_folder: str, overwrite: bool = False) -> dict
     Returns:
         dict: Dictionary of transcriptions {filename: text}
     """
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    
-    # Define supported image formats
-    SUPPORTED_FORMATS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+    client = get_openai_client()
     
     # Get all image files
     image_files = [
         f for f in Path(input_folder).iterdir()
-        if f.suffix.lower() in SUPPORTED_FORMATS
+        if f.suffix.lower() in IMAGE_FORMATS
     ]
     
     transcriptions = {}
@@ -272,40 +424,7 @@ def extract_text_from_images(input_folder: str, overwrite: bool = False) -> dict
             continue
             
         try:
-            # Read image file as base64
-            with open(image_file, "rb") as img_file:
-                response = client.chat.completions.create(
-                    model="gpt-4o",  # Using the correct model name
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": "Please extract and return ONLY the text content from this image. Do not include any additional formatting, comments, or metadata."},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{base64.b64encode(img_file.read()).decode('utf-8')}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=1000
-                )
-                
-            text = response.choices[0].message.content
-            transcriptions[image_file.name] = text
-            
-            # Create content with YAML front matter metadata and content
-            content = f"""---
-filename: {image_file.name}
----
-
-{text}"""
-    
-            
-            # Write to markdown file
-            md_path.write_text(content, encoding="utf-8")
+            transcriptions[image_file.name] = extract_text_from_image_file(client, image_file)
             print(f"Created markdown file: {md_filename}")
             
         except Exception as e:
@@ -314,34 +433,64 @@ filename: {image_file.name}
     return transcriptions
 
 # S02E02
-def request_anthropic(content: str, question: str, prompt: str) -> str:
-    client = Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+def request_anthropic(content: str, question: str, prompt: str, model: str = None,
+                      task_class: str = "reasoning", validate=None, latency_budget: float = None,
+                      call_site: str = "request_anthropic") -> str:
+    """
+    Ask Claude with a prompt template filled with content and question.
+
+    Without a model the router picks one for task_class and escalates while
+    validate(answer) rejects the answer; returns the last answer. Content over
+    the token budget (AIDEVS3_TOKEN_BUDGET, at most the context window) is
+    packed before sending.
+    """
+    client = get_anthropic_client()
     
+    budget_model = model or "claude-3-5-sonnet-latest"
+    content, estimate = fit_content(content, budget_model, question=question, max_output_tokens=100,
+                                    reserved=count_tokens(prompt.format(content="", question=question), budget_model))
     prompt = prompt.format(content=content, question=question)
+    models = [model] if model else route(call_site, task_class, estimate["tokens"], latency_budget,
+                                         provider="anthropic")
 
-    response = client.messages.create(
-        model="claude-3-5-sonnet-latest",
-        max_tokens=100,
-        temperature=0.1,
-        messages=[{
-            "role": "user",
-            "content": prompt
-        }]
-    )
-    
-    return response.content[0].text
+    for escalation, model_name in enumerate(models):
+        with span("anthropic.messages", kind="llm", call_site=call_site, model=model_name,
+                  escalation=escalation or None, request_chars=text_size(prompt),
+                  estimated_tokens=estimate["tokens"]) as s:
+            start = time.time()
+            response = resilient_call("anthropic", client.messages.create,
+                model=model_name,
+                max_tokens=100,
+                temperature=0.1,
+                messages=[{
+                    "role": "user",
+                    "content": prompt
+                }]
+            )
+            observe(model_name, time.time() - start)
+            s.set(response_chars=text_size(response.content[0].text))
+            record_response(s, response, "anthropic")
+        answer = response.content[0].text
+        if validate is None or validate(answer):
+            break
+        print(f"Answer of {model_name} failed validation: {answer!r}")
+    
+    return answer
 
 # S02E05
+@traced("html_to_markdown")
 def html_to_markdown(url):
 
     """Convert HTML article to markdown with processed images and audio in their original positions"""
     print(f"\n=== Starting HTML to Markdown conversion for {url} ===")
     
     # Fetch the article
-    response = requests.get(url)
-    print(f"Fetched article with status code: {response.status_code}")
+    with span("http.get", kind="http", call_site="html_to_markdown", url=url) as s:
+        response = resilient_call("http", lambda: check_status(requests.get(url)))
+        print(f"Fetched article with status code: {response.status_code}")
+        s.set(status=response.status_code, response_bytes=len(response.content))
     
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = bs4.BeautifulSoup(response.text, 'html.parser')
     
     # Get base URL for resolving relative paths
     base_url = '/'.join(url.split('/')[:-1]) + '/'
@@ -441,6 +590,35 @@ def html_to_markdown(url):
     return ''.join(markdown_content)
 
 # S02E04
+def txt_file_to_markdown(txt_path: str) -> str:
+    """
+    Convert a single .txt file to a .md file with metadata next to it.
+    
+    Args:
+        txt_path (str): Path to the .txt file
+        
+    Returns:
+        str: Path of the written markdown file
+    """
+    txt_file = os.path.basename(txt_path)
+    md_path = os.path.join(os.path.dirname(txt_path), txt_file.replace('.txt', '.md'))
+
+    # Read content from txt file
+    with open(txt_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+        
+    # Create markdown content with metadata
+    md_content = f"""---
+filename: {txt_file}
+---
+
+{content}"""
+    
+    # Write markdown file
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write(md_content)
+    return md_path
+
 def txt_to_markdown(directory_path: str, overwrite: bool = False) -> List[str]:
     """
     Convert all .txt files in a directory to .md files with metadata.
@@ -463,33 +641,17 @@ def txt_to_markdown(directory_path: str, overwrite: bool = False) -> List[str]:
     
     for txt_file in txt_files:
         txt_path = os.path.join(directory_path, txt_file)
-        md_file = txt_file.replace('.txt', '.md')
-        md_path = os.path.join(directory_path, md_file)
+        md_path = os.path.join(directory_path, txt_file.replace('.txt', '.md'))
         
         # Skip if file exists and overwrite is False
         if os.path.exists(md_path) and not overwrite:
             continue
             
-        # Read content from txt file
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
-        # Create markdown content with metadata
-        md_content = f"""---
-filename: {txt_file}
----
-
-{content}"""
-        
-        # Write markdown file
-        with open(md_path, 'w', encoding='utf-8') as f:
-            f.write(md_content)
-            
-        created_files.append(md_path)
+        created_files.append(txt_file_to_markdown(txt_path))
         
     return created_files
 
-#
+# S03E03
 def connect_to_apidb(task, query):
     """
     Connect to the API using credentials from .env file
@@ -501,13 +663,10 @@ def connect_to_apidb(task, query):
     Returns:
         str: Table structure if 'show create table' query, otherwise full response
     """
-    # Load environment variables
-    load_dotenv()
-    
     api_key = os.getenv('AIDEVS3_API_KEY')
     apidb_url = os.getenv('APIDB_URL')
 
-    print(f"Connecting to API: {apidb_url}")
+    logger.info("apidb query: %s", query)
     
     # Prepare request payload
     payload = {
@@ -520,14 +679,15 @@ def connect_to_apidb(task, query):
     json_payload = json.dumps(payload)
     
     try:
-        response = requests.post(apidb_url, data=json_payload)
+        with span("centrala.apidb", kind="centrala", call_site="connect_to_apidb", task=task,
+                  request_chars=text_size(json_payload)) as s:
+            response = resilient_call("centrala", lambda: check_status(requests.post(apidb_url, data=json_payload)))
+            s.set(status=response.status_code, response_chars=text_size(response.text))
         response.raise_for_status()
         
-        # Print response headers and body for debugging
-        print("\nResponse Headers:")
-        for header, value in response.headers.items():
-            print(f"{header}: {value}")
-        print(f"\nResponse Body:\n{response.text}")
+        # Response details only at debug level
+        logger.debug("apidb response headers: %s", dict(response.headers))
+        logger.debug("apidb response body: %s", response.text)
         
         # Parse the response
         json_response = response.json()
@@ -539,5 +699,5 @@ def connect_to_apidb(task, query):
         return json_response
         
     except requests.exceptions.RequestException as e:
-        print(f"Error connecting to API: {e}")
+        logger.error("Error connecting to API: %s", e)
         return None
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from assignments.utils.aidevs3_utils import connect_to_apidb
+from assignments.utils.tracing import bind_context
+
+logger = logging.getLogger(__name__)
+
+# S03E03; the schema cache and replica live next to the task, whatever the working directory
+DEFAULT_TABLES = ("connections", "correct_order", "datacenters", "users")
+APIDB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "S03E03")
+SCHEMA_CACHE_PATH = os.path.join(APIDB_DIR, ".apidb_schema_cache.json")
+REPLICA_PATH = os.path.join(APIDB_DIR, ".apidb_replica.sqlite")
+
+COLUMN_PATTERN = re.compile(r'^\s*`(?P<name>[^`]+)`\s+(?P<type>\w+(?:\([^)]*\))?(?:\s+unsigned)?)(?P<rest>.*?),?\s*$', re.IGNORECASE)
+PRIMARY_KEY_PATTERN = re.compile(r'PRIMARY KEY\s*\(([^)]*)\)', re.IGNORECASE)
+
+
+def parse_create_table(ddl: str) -> Dict:
+    """
+    Turn a MySQL 'CREATE TABLE' statement into structured column metadata.
+    
+    Returns:
+        Dict: {"ddl", "columns": [{"name", "type", "nullable", "default", "auto_increment"}], "primary_key"}
+    """
+    columns = []
+    for line in ddl.splitlines()[1:]:
+        match = COLUMN_PATTERN.match(line)
+        if not match:
+            continue
+        rest = match.group('rest')
+        default = re.search(r"DEFAULT\s+('(?:[^']*)'|\S+)", rest, re.IGNORECASE)
+        default = default.group(1) if default and default.group(1).upper() != 'NULL' else None
+        columns.append({
+            "name": match.group('name'),
+            "type": match.group('type').lower(),
+            "nullable": 'NOT NULL' not in rest.upper(),
+            "default": default.strip("'") if default else None,
+            "auto_increment": 'AUTO_INCREMENT' in rest.upper()
+        })
+    primary_key = PRIMARY_KEY_PATTERN.search(ddl)
+    return {
+        "ddl": ddl,
+        "columns": columns,
+        "primary_key": [c.strip(' `') for c in primary_key.group(1).split(',')] if primary_key else []
+    }
+
+
+def schema_fingerprint(tables: Dict[str, Dict]) -> str:
+    """Hash of all table definitions, stable across fetches of an unchanged schema."""
+    digest = hashlib.sha256()
+    for name in sorted(tables):
+        digest.update(name.encode('utf-8'))
+        digest.update(tables[name]["ddl"].encode('utf-8'))
+    return digest.hexdigest()
+
+
+def fetch_table_schemas(task: str = "database", tables: Iterable[str] = DEFAULT_TABLES,
+                        max_workers: int = 8) -> Dict[str, Dict]:
+    """
+    Fetch 'show create table' for all tables concurrently.
+    
+    Returns:
+        Dict[str, Dict]: Parsed schema per table
+    """
+    tables = list(tables)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        ddls = executor.map(bind_context(lambda table: connect_to_apidb(task, f"show create table {table}")), tables)
+        schemas = {}
+        for table, ddl in zip(tables, ddls):
+            if not ddl:
+                raise ValueError(f"Could not fetch the schema of table {table}")
+            schemas[table] = parse_create_table(ddl)
+    return schemas
+
+
+def get_table_schemas(task: str = "database", tables: Iterable[str] = DEFAULT_TABLES,
+                      ttl: float = 24 * 3600, cache_path: Optional[str] = SCHEMA_CACHE_PATH,
+                      refresh: bool = False) -> Dict:
+    """
+    Return the schema of the apidb tables, from the disk cache while it is fresh.
+    
+    Args:
+        task (str): Task used for the apidb requests
+        tables (Iterable[str]): Tables to introspect
+        ttl (float): Seconds a cached schema stays valid
+        cache_path (str): JSON cache file, None disables caching
+        refresh (bool): Ignore the cache and fetch again
+        
+    Returns:
+        Dict: {"fingerprint", "fetched_at", "tables": {name: parsed schema}}
+    """
+    tables = list(tables)
+    if cache_path and not refresh and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if time.time() - cached["fetched_at"] < ttl and set(tables) <= set(cached["tables"]):
+            logger.info("Using cached apidb schema %s", cached["fingerprint"][:12])
+            return {**cached, "tables": {name: cached["tables"][name] for name in tables}}
+
+    logger.info("Fetching schema of %d tables", len(tables))
+    schemas = fetch_table_schemas(task, tables)
+    result = {"fingerprint": schema_fingerprint(schemas), "fetched_at": time.time(), "tables": schemas}
+    previous = cached_schema_fingerprint(cache_path) if cache_path else None
+    if previous and previous != result["fingerprint"]:
+        logger.info("apidb schema changed (%s -> %s), the replica needs a re-sync",
+                    previous[:12], result["fingerprint"][:12])
+
+    if cache_path:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+def cached_schema_fingerprint(cache_path: str = SCHEMA_CACHE_PATH) -> Optional[str]:
+    """Fingerprint of the cached schema, None without a cache."""
+    if not os.path.exists(cache_path):
+        return None
+    with open(cache_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("fingerprint")
+
+
+def format_schema_for_prompt(schemas: Dict) -> str:
+    """Render the table definitions for an NL-to-SQL prompt."""
+    return "\n\n".join(
+        f"Table: {name}\n{table['ddl']}" for name, table in schemas["tables"].items()
+    )
+
+
+def sqlite_type(mysql_type: str) -> str:
+    """Map a MySQL column type to its SQLite storage class."""
+    mysql_type = mysql_type.lower()
+    if 'int' in mysql_type:
+        return "INTEGER"
+    if any(t in mysql_type for t in ('decimal', 'float', 'double', 'real', 'numeric')):
+        return "REAL"
+    return "TEXT"
+
+
+def _create_replica_table(conn: sqlite3.Connection, table: str, schema: Dict):
+    columns = [f'"{c["name"]}" {sqlite_type(c["type"])}' for c in schema["columns"]]
+    if schema["primary_key"]:
+        columns.append("PRIMARY KEY (" + ", ".join(f'"{c}"' for c in schema["primary_key"]) + ")")
+    conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+    conn.execute(f'CREATE TABLE "{table}" ({", ".join(columns)})')
+
+
+def _fetch_rows(task: str, table: str, schema: Dict, page_size: int) -> List[tuple]:
+    column_names = [c["name"] for c in schema["columns"]]
+    order_by = ", ".join(f"`{c}`" for c in (schema["primary_key"] or column_names[:1]))
+    rows, offset = [], 0
+    while True:
+        response = connect_to_apidb(task, f"select * from {table} order by {order_by} limit {page_size} offset {offset}")
+        if not response or response.get('error') not in (None, 'OK'):
+            raise ValueError(f"Could not read {table} at offset {offset}: {response}")
+        page = response.get('reply') or []
+        rows.extend(tuple(row.get(c) for c in column_names) for row in page)
+        offset += len(page)
+        if len(page) < page_size:
+            return rows
+
+
+def _replace_table(db_path: str, table: str, schema: Dict, rows: List[tuple], fingerprint: str):
+    staging = f"{table}__new"
+    column_names = [c["name"] for c in schema["columns"]]
+    insert = (f'INSERT INTO "{staging}" ({", ".join(chr(34) + c + chr(34) for c in column_names)}) '
+              f'VALUES ({", ".join("?" for _ in column_names)})')
+
+    # Explicit transaction: the legacy isolation mode would autocommit DROP/CREATE on their own
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _create_replica_table(conn, staging, schema)
+            conn.executemany(insert, rows)
+            conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            conn.execute(f'ALTER TABLE "{staging}" RENAME TO "{table}"')
+            conn.execute('INSERT OR REPLACE INTO "_replica_meta" VALUES (?, ?, ?, ?)',
+                         (table, time.time(), fingerprint, len(rows)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def _sync_table(task: str, table: str, schema: Dict, db_path: str, page_size: int, fingerprint: str) -> int:
+    # Every page is fetched before the write lock is taken, so workers only lock SQLite for the swap
+    rows = _fetch_rows(task, table, schema, page_size)
+    _replace_table(db_path, table, schema, rows, fingerprint)
+    return len(rows)
+
+
+def sync_replica(task: str = "database", tables: Iterable[str] = DEFAULT_TABLES,
+                 db_path: str = REPLICA_PATH, page_size: int = 1000, max_workers: int = 4) -> Dict[str, int]:
+    """
+    Mirror the remote apidb tables into a local SQLite file.
+    
+    Tables are created from their 'show create table' schema and synced
+    concurrently. All pages of a table are fetched first, then loaded into a
+    staging table that replaces the old one together with its _replica_meta
+    entry in one transaction, so a failed sync leaves the previous copy.
+    
+    Returns:
+        Dict[str, int]: Number of rows copied per table
+    """
+    tables = list(tables)
+    schemas = get_table_schemas(task, tables)
+    conn = sqlite3.connect(db_path, timeout=30)
+    with conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('CREATE TABLE IF NOT EXISTS "_replica_meta" '
+                     '(table_name TEXT PRIMARY KEY, synced_at REAL, fingerprint TEXT, row_count INTEGER)')
+    conn.close()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        counts = dict(zip(tables, executor.map(bind_context(lambda table: _sync_table(
+            task, table, schemas["tables"][table], db_path, page_size, schemas["fingerprint"])), tables)))
+
+    logger.info("Replica synced: %s", counts)
+    return counts
+
+
+def replica_is_fresh(db_path: str = REPLICA_PATH, max_age: float = 24 * 3600,
+                     tables: Optional[Iterable[str]] = None, fingerprint: Optional[str] = None) -> bool:
+    """
+    Check that the replica exists and every (given) table was synced within
+    max_age seconds, from the schema with the given fingerprint when one is given.
+    """
+    if not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path)
+    try:
+        synced = {table: (synced_at, synced_fingerprint) for table, synced_at, synced_fingerprint in
+                  conn.execute('SELECT table_name, synced_at, fingerprint FROM "_replica_meta"').fetchall()}
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+    required = list(tables) if tables is not None else list(synced)
+    return bool(required) and all(
+        table in synced and time.time() - synced[table][0] < max_age
+        and (fingerprint is None or synced[table][1] == fingerprint)
+        for table in required
+    )
+
+
+def validate_sql(query: str, db_path: str = REPLICA_PATH) -> Optional[str]:
+    """
+    Check a query against the replica without running it.
+    
+    Returns:
+        str: The SQLite error message, or None when the query compiles
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"EXPLAIN QUERY PLAN {query}")
+        return None
+    except sqlite3.Error as e:
+        return str(e)
+    finally:
+        conn.close()
+
+
+def query_apidb(task: str, query: str, local: bool = False, db_path: str = REPLICA_PATH,
+                max_age: float = 24 * 3600, schema_cache_path: Optional[str] = SCHEMA_CACHE_PATH) -> Dict:
+    """
+    Run a query on the remote apidb, or with local=True run SELECTs on the
+    replica while it is fresh.
+    
+    The replica is SQLite: only opt in for SQL written for SQLite, as MySQL
+    queries that SQLite also accepts (case-insensitive string comparisons,
+    mixed int/str comparisons) can return different rows. Anything the replica
+    cannot run goes to the remote apidb. A replica built from another schema
+    than the cached one is not fresh.
+    
+    Returns:
+        Dict: Response in the apidb shape {"reply": [rows], "error": "OK"}, with
+        "backend" set to "replica" or "apidb"
+    """
+    if local and query.lstrip().lower().startswith('select'):
+        fingerprint = cached_schema_fingerprint(schema_cache_path) if schema_cache_path else None
+        if replica_is_fresh(db_path, max_age, fingerprint=fingerprint):
+            conn = sqlite3.connect(db_path)
+            conn.row_factory = sqlite3.Row
+            try:
+                rows = [dict(row) for row in conn.execute(query).fetchall()]
+                logger.info("Answered by the replica: %s", query)
+                return {"reply": rows, "error": "OK", "backend": "replica"}
+            except sqlite3.Error as e:
+                logger.warning("Replica could not run the query (%s), using the remote apidb", e)
+            finally:
+                conn.close()
+    response = connect_to_apidb(task, query)
+    logger.info("Answered by the remote apidb: %s", query)
+    return {**response, "backend": "apidb"} if isinstance(response, dict) else response
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="apidb schema and replica tools")
+    parser.add_argument("command", choices=["sync", "schema"])
+    parser.add_argument("--task", default="database")
+    parser.add_argument("--db", default=REPLICA_PATH)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    if args.command == "sync":
+        print(json.dumps(sync_replica(args.task, db_path=args.db, page_size=args.page_size), indent=2))
+    else:
+        print(format_schema_for_prompt(get_table_schemas(args.task, refresh=True)))
@@ -0,0 +1,262 @@
+"""
+Offline bulk mode: send many LLM requests through the provider batch APIs.
+
+    requests = {path: chat_request("gpt-4o", messages, temperature=0) for path in paths}
+    replies = run_batch("S03E01.keywords", requests)
+    # {path: "reply text", or None when that request failed}
+
+OpenAI models go through the Batch API (JSONL file upload + /v1/batches),
+Claude models through the Anthropic Message Batches API. Batches cost half
+as much and have their own rate limits, but may take up to 24 hours, so the
+bulk helpers only use them with AIDEVS3_BATCH=1 (overnight re-indexing).
+
+The JSONL input, the id of the submitted job and the results are kept in
+AIDEVS3_BATCH_DIR (assignments/.batches, whatever the working directory),
+named after the batch and a hash of its requests: an interrupted run resumes
+polling the same job instead of submitting it again, and a finished batch is
+not paid for twice. A job that ended without output is forgotten, so the
+next run submits a new one.
+
+AIDEVS3_BATCH_BACKEND=local answers the JSONL with regular concurrent calls
+instead, a stand-in for tests and for providers without a batch API.
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from assignments.utils.aidevs3_utils import get_anthropic_client
+from assignments.utils.openai_api import get_openai_client
+from assignments.utils.resilience_utils import resilient_call
+from assignments.utils.tracing import bind_context, span
+from assignments.utils.usage_ledger import record
+
+BACKENDS = ("openai", "anthropic", "local")
+OPENAI_FINAL_STATUS = {"completed", "failed", "expired", "cancelled"}
+CHAT_ENDPOINT = "/v1/chat/completions"
+BATCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".batches")
+
+
+def batch_enabled(batch: Optional[bool] = None) -> bool:
+    """An explicit batch argument wins, otherwise AIDEVS3_BATCH=1 turns bulk mode on."""
+    return batch if batch is not None else os.getenv("AIDEVS3_BATCH") == "1"
+
+
+def chat_request(model: str, messages: List[Dict], **params) -> Dict:
+    """Body of one chat completion request, in the OpenAI format."""
+    return {"model": model, "messages": messages, **params}
+
+
+def to_anthropic(body: Dict, max_tokens: int = 1024) -> Dict:
+    """Convert an OpenAI style chat request to Anthropic messages parameters."""
+    system = "\n\n".join(m["content"] for m in body["messages"] if m["role"] == "system")
+    params = {
+        "model": body["model"],
+        "max_tokens": body.get("max_tokens") or max_tokens,
+        "messages": [m for m in body["messages"] if m["role"] != "system"],
+    }
+    if system:
+        params["system"] = system
+    if body.get("temperature") is not None:
+        params["temperature"] = body["temperature"]
+    return params
+
+
+def _provider(model: str) -> str:
+    return "anthropic" if model.startswith("claude") else "openai"
+
+
+def _backend(requests: Dict[str, Dict]) -> str:
+    backend = os.getenv("AIDEVS3_BATCH_BACKEND")
+    if backend:
+        if backend not in BACKENDS:
+            raise ValueError(f"AIDEVS3_BATCH_BACKEND must be one of {BACKENDS}")
+        return backend
+    providers = {_provider(body["model"]) for body in requests.values()}
+    if len(providers) > 1:
+        raise ValueError("A batch can only contain requests for one provider")
+    return providers.pop()
+
+
+def _batch_lines(requests: Dict[str, Dict], custom_ids: Dict[str, str], backend: str) -> List[Dict]:
+    # Anthropic only accepts [a-zA-Z0-9_-]{1,64} ids, so keys (file paths) are mapped to req-N
+    if backend == "anthropic":
+        return [{"custom_id": custom_ids[key], "params": to_anthropic(body)} for key, body in requests.items()]
+    return [{"custom_id": custom_ids[key], "method": "POST", "url": CHAT_ENDPOINT, "body": body}
+            for key, body in requests.items()]
+
+
+def _submit(backend: str, name: str, input_path: str, lines: List[Dict]) -> str:
+    with span(f"{backend}.batch.submit", kind="llm", call_site=name, requests=len(lines)):
+        if backend == "anthropic":
+            job = resilient_call("anthropic", get_anthropic_client().messages.batches.create, requests=lines)
+        else:
+            client = get_openai_client()
+            with open(input_path, 'rb') as f:
+                data = f.read()
+            uploaded = resilient_call("openai", client.files.create,
+                                      file=(os.path.basename(input_path), data), purpose="batch")
+            job = resilient_call("openai", client.batches.create, input_file_id=uploaded.id,
+                                 endpoint=CHAT_ENDPOINT, completion_window="24h")
+    print(f"Submitted batch {name} as {job.id} ({len(lines)} requests)")
+    return job.id
+
+
+def _poll(backend: str, job_id: str, poll_interval: float, timeout: float):
+    start = time.time()
+    while True:
+        if backend == "anthropic":
+            job = resilient_call("anthropic", get_anthropic_client().messages.batches.retrieve, job_id)
+            status, done = job.processing_status, job.processing_status == "ended"
+        else:
+            job = resilient_call("openai", get_openai_client().batches.retrieve, job_id)
+            status, done = job.status, job.status in OPENAI_FINAL_STATUS
+        counts = getattr(job, "request_counts", None)
+        print(f"Batch {job_id}: {status} {counts.model_dump() if counts is not None else ''}")
+        if done:
+            return job
+        if time.time() - start > timeout:
+            raise TimeoutError(f"Batch {job_id} did not finish in {timeout:.0f}s, run again to resume polling")
+        time.sleep(poll_interval)
+
+
+def _openai_results(job) -> List[Dict]:
+    if job.status != "completed" and not job.output_file_id:
+        raise RuntimeError(f"Batch {job.id} ended as {job.status}: {job.errors}")
+    client = get_openai_client()
+    results = []
+    for file_id in (job.output_file_id, job.error_file_id):
+        if not file_id:
+            continue
+        content = resilient_call("openai", client.files.content, file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            body = response.get("body") or {}
+            if response.get("status_code") == 200:
+                usage = body.get("usage") or {}
+                results.append({"custom_id": entry["custom_id"], "text": body["choices"][0]["message"]["content"],
+                                "model": body.get("model"), "prompt_tokens": usage.get("prompt_tokens", 0),
+                                "completion_tokens": usage.get("completion_tokens", 0)})
+            else:
+                results.append({"custom_id": entry["custom_id"], "text": None,
+                                "error": entry.get("error") or body.get("error")})
+    return results
+
+
+def _anthropic_results(job) -> List[Dict]:
+    results = []
+    for entry in resilient_call("anthropic", get_anthropic_client().messages.batches.results, job.id):
+        if entry.result.type == "succeeded":
+            message = entry.result.message
+            results.append({"custom_id": entry.custom_id, "text": message.content[0].text, "model": message.model,
+                            "prompt_tokens": message.usage.input_tokens,
+                            "completion_tokens": message.usage.output_tokens})
+        else:
+            error = getattr(entry.result, "error", None)
+            results.append({"custom_id": entry.custom_id, "text": None,
+                            "error": error.model_dump() if error is not None else entry.result.type})
+    return results
+
+
+def _local_results(lines: List[Dict], max_workers: int) -> List[Dict]:
+    def answer(line):
+        body = line["body"]
+        try:
+            if _provider(body["model"]) == "anthropic":
+                response = resilient_call("anthropic", get_anthropic_client().messages.create, **to_anthropic(body))
+                text, usage = response.content[0].text, (response.usage.input_tokens, response.usage.output_tokens)
+            else:
+                response = resilient_call("openai", get_openai_client().chat.completions.create, **body)
+                text = response.choices[0].message.content
+                usage = (response.usage.prompt_tokens, response.usage.completion_tokens) if response.usage else (0, 0)
+        except Exception as e:
+            return {"custom_id": line["custom_id"], "text": None, "error": f"{type(e).__name__}: {e}"}
+        return {"custom_id": line["custom_id"], "text": text, "model": body["model"],
+                "prompt_tokens": usage[0], "completion_tokens": usage[1]}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(bind_context(answer), lines))
+
+
+def run_batch(name: str, requests: Dict[str, Dict], poll_interval: Optional[float] = None,
+              timeout: float = 25 * 3600, batch_dir: Optional[str] = None, max_workers: int = 8) -> Dict[str, Optional[str]]:
+    """
+    Answer chat requests in bulk and map the replies back to their keys.
+
+    Args:
+        name (str): Batch name, used for the files in batch_dir and as the call site
+        requests (Dict[str, Dict]): Key (e.g. the source file) -> chat_request() body
+        poll_interval (float): Seconds between status checks, AIDEVS3_BATCH_POLL or 30
+        timeout (float): Seconds to wait for the batch; a later run resumes the same job
+        batch_dir (str): Where the JSONL, job state and results live, AIDEVS3_BATCH_DIR or BATCH_DIR
+        max_workers (int): Concurrent requests of the local backend
+
+    Returns:
+        Dict[str, Optional[str]]: Reply text for every key, None for failed requests
+    """
+    if not requests:
+        return {}
+    backend = _backend(requests)
+    batch_dir = batch_dir or os.getenv("AIDEVS3_BATCH_DIR", BATCH_DIR)
+    poll_interval = poll_interval if poll_interval is not None else float(os.getenv("AIDEVS3_BATCH_POLL", "30"))
+    os.makedirs(batch_dir, exist_ok=True)
+
+    custom_ids = {key: f"req-{index}" for index, key in enumerate(requests)}
+    keys = {custom_id: key for key, custom_id in custom_ids.items()}
+    lines = _batch_lines(requests, custom_ids, backend)
+    payload = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+    digest = hashlib.sha256(f"{backend}\n{payload}".encode('utf-8')).hexdigest()[:12]
+    base = os.path.join(batch_dir, f"{name}.{digest}")
+    state_path, results_path = base + ".job.json", base + ".results.jsonl"
+
+    if os.path.exists(results_path):
+        print(f"Batch {name}: reusing results from {results_path}")
+        with open(results_path, 'r', encoding='utf-8') as f:
+            results = [json.loads(line) for line in f if line.strip()]
+        return {keys[r["custom_id"]]: r["text"] for r in results if r["custom_id"] in keys}
+
+    with span(f"batch.{name}", kind="internal", backend=backend, requests=len(lines)) as s:
+        with open(base + ".jsonl", 'w', encoding='utf-8') as f:
+            f.write(payload)
+
+        if backend == "local":
+            results = _local_results(lines, max_workers)
+        else:
+            if os.path.exists(state_path):
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    job_id = json.load(f)["job_id"]
+                print(f"Batch {name}: resuming {job_id}")
+            else:
+                job_id = _submit(backend, name, base + ".jsonl", lines)
+                with open(state_path, 'w', encoding='utf-8') as f:
+                    json.dump({"backend": backend, "job_id": job_id, "submitted_at": time.time()}, f)
+            job = _poll(backend, job_id, poll_interval, timeout)
+            try:
+                results = _anthropic_results(job) if backend == "anthropic" else _openai_results(job)
+            except RuntimeError:
+                # The job is over and has nothing to resume; the next run submits a new one
+                os.remove(state_path)
+                raise
+
+        failed = 0
+        for result in results:
+            if result["text"] is None:
+                failed += 1
+                print(f"Batch {name}: {keys.get(result['custom_id'])} failed: {result.get('error')}")
+                continue
+            record(call_site=name, provider=_provider(result["model"] or ""), model=result["model"],
+                   prompt_tokens=result["prompt_tokens"], completion_tokens=result["completion_tokens"])
+        s.set(failed=failed)
+
+    with open(results_path, 'w', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    print(f"Batch {name}: {len(results) - failed} of {len(lines)} requests answered")
+    return {keys[r["custom_id"]]: r["text"] for r in results if r["custom_id"] in keys}
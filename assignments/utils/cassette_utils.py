@@ -0,0 +1,401 @@
+"""
+Record/replay cassettes for provider and HTTP traffic.
+
+In record mode every outbound request made through httpx (Groq SDK), httpx2
+(OpenAI and Anthropic SDKs), requests or urllib is passed through and its response is
+appended to a gzip-compressed JSONL cassette. In replay mode the responses
+are served from the cassette without touching the network:
+
+    AIDEVS3_CASSETTE=cassettes/S02E04.jsonl.gz AIDEVS3_CASSETTE_MODE=record python S02E04.py
+    AIDEVS3_CASSETTE=cassettes/S02E04.jsonl.gz python S02E04.py
+
+or in code:
+
+    with use_cassette("cassettes/S02E05.jsonl.gz", mode="auto", match="lenient"):
+        ...
+
+Strict matching compares method, URL and body; lenient matching falls back
+to method and URL path and serves the recorded responses of that endpoint in
+order. API keys from the environment are replaced by placeholders before a
+request is hashed or written, and request headers are never stored.
+"""
+import base64
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from assignments.utils.lazy_utils import lazy_import
+
+# Only needed once a cassette is in use; install_from_env() stays a cheap env check
+gzip = lazy_import("gzip")
+email_message = lazy_import("email.message")
+
+MODES = ("record", "replay", "auto")
+MATCHES = ("strict", "lenient")
+
+# Environment variables whose values must never end up in a cassette
+SECRET_VARIABLES = ("AIDEVS3_API_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GROQ_API_KEY",
+                    "QDRANT_API_KEY", "SERPAPI_API_KEY", "FIRECRAWL_API_KEY")
+
+# Response headers worth keeping; encoding and length headers no longer apply to the stored body
+KEPT_HEADERS = ("content-type", "retry-after", "x-request-id", "request-id")
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when no recorded response matches a request."""
+
+
+class Cassette:
+    """
+    Recorded request/response pairs with strict or lenient lookup.
+
+    Args:
+        path (str): Cassette file (gzip JSONL)
+        mode (str): record (pass through and overwrite), replay (offline only)
+            or auto (replay what is recorded, record the rest)
+        match (str): strict or lenient request matching
+    """
+
+    def __init__(self, path: str, mode: str = "replay", match: str = "strict"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {MODES}")
+        if match not in MATCHES:
+            raise ValueError(f"Unknown cassette match {match!r}, expected one of {MATCHES}")
+        self.path = path
+        self.mode = mode
+        self.match = match
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+        self._strict = {}
+        self._lenient = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+        if mode == "record":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            open(path, 'wb').close()
+        elif os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry: Dict):
+        self._strict.setdefault(entry["key"], []).append(entry["response"])
+        self._lenient.setdefault(entry["endpoint"], []).append(entry["response"])
+
+    def _next(self, table: Dict[str, List[Dict]], key: str) -> Optional[Dict]:
+        # Repeated identical requests get the recorded responses in order, then the last one again
+        responses = table.get(key)
+        if not responses:
+            return None
+        cursor = self._cursors.get((id(table), key), 0)
+        self._cursors[(id(table), key)] = cursor + 1
+        return responses[min(cursor, len(responses) - 1)]
+
+    def lookup(self, method: str, url: str, body: bytes, content_type: str = "") -> Optional[Dict]:
+        """Return the recorded response for a request, or None."""
+        key, endpoint = request_key(method, url, body, content_type)
+        with self._lock:
+            response = self._next(self._strict, key)
+            if response is None and self.match == "lenient":
+                response = self._next(self._lenient, endpoint)
+            self.stats["hits" if response else "misses"] += 1
+        return response
+
+    def record(self, method: str, url: str, body: bytes, content_type: str,
+               status: int, headers: Dict[str, str], content: bytes):
+        key, endpoint = request_key(method, url, body, content_type)
+        entry = {
+            "key": key,
+            "endpoint": endpoint,
+            "request": {"method": method.upper(), "url": scrub(url)},
+            "response": {
+                "status": status,
+                "headers": {k.lower(): v for k, v in headers.items() if k.lower() in KEPT_HEADERS},
+                "body": encode_body(content)
+            }
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            # Appending gzip members keeps the cassette valid even if the run is interrupted
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(line)
+            self._index(entry)
+            self.stats["recorded"] += 1
+
+    def should_replay(self) -> bool:
+        return self.mode in ("replay", "auto")
+
+
+def scrub(text: str) -> str:
+    """Replace the values of known API keys with placeholders."""
+    for variable in SECRET_VARIABLES:
+        value = os.getenv(variable)
+        if value and len(value) >= 8:
+            text = text.replace(value, f"<{variable}>")
+    return text
+
+
+def normalize_body(body: bytes, content_type: str) -> bytes:
+    """Make semantically equal bodies byte-equal: scrubbed secrets, sorted JSON, fixed multipart boundary."""
+    if not body:
+        return b""
+    boundary = re.search(r'boundary=("?)([^";]+)\1', content_type or "")
+    if boundary:
+        body = body.replace(boundary.group(2).encode('utf-8'), b"BOUNDARY")
+    try:
+        text = scrub(body.decode('utf-8'))
+    except UnicodeDecodeError:
+        return body
+    try:
+        return json.dumps(json.loads(text), sort_keys=True, ensure_ascii=False).encode('utf-8')
+    except ValueError:
+        return text.encode('utf-8')
+
+
+def request_key(method: str, url: str, body: bytes, content_type: str = "") -> tuple:
+    """Return (strict key, lenient endpoint key) of a request."""
+    url = scrub(url)
+    parts = urlsplit(url)
+    digest = hashlib.sha256(normalize_body(body, content_type)).hexdigest()
+    strict = f"{method.upper()} {url} {digest}"
+    endpoint = f"{method.upper()} {parts.netloc}{parts.path}"
+    return strict, endpoint
+
+
+def encode_body(content: bytes) -> Dict:
+    try:
+        return {"text": scrub(content.decode('utf-8'))}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(content).decode('ascii')}
+
+
+def decode_body(body: Dict) -> bytes:
+    if "text" in body:
+        return body["text"].encode('utf-8')
+    return base64.b64decode(body["base64"])
+
+
+# Active cassette and the original methods patched while it is installed
+_active = None
+_originals = {}
+
+
+def _miss(method: str, url: str):
+    raise CassetteMiss(f"No recorded response for {method.upper()} {scrub(url)} in {_active.path}")
+
+
+def _patch_httpx(module_name: str):
+    # openai>=3 and anthropic>=1 require httpx2 (Requires-Dist: httpx2<3) instead of
+    # httpx, which groq still uses; httpx2 keeps the httpx transport API
+    try:
+        httpx = importlib.import_module(module_name)
+    except ImportError:
+        return
+
+    original_send = httpx.HTTPTransport.handle_request
+    original_async_send = httpx.AsyncHTTPTransport.handle_async_request
+
+    def to_response(recorded: Dict, request):
+        return httpx.Response(recorded["status"], headers=recorded["headers"],
+                              content=decode_body(recorded["body"]), request=request)
+
+    def handle_request(transport, request):
+        cassette = _active
+        body = request.read()
+        content_type = request.headers.get("content-type", "")
+        if cassette.should_replay():
+            recorded = cassette.lookup(request.method, str(request.url), body, content_type)
+            if recorded:
+                return to_response(recorded, request)
+            if cassette.mode == "replay":
+                _miss(request.method, str(request.url))
+        response = original_send(transport, request)
+        content = response.read()
+        cassette.record(request.method, str(request.url), body, content_type,
+                        response.status_code, dict(response.headers), content)
+        return httpx.Response(response.status_code, headers=_kept(response.headers),
+                              content=content, request=request)
+
+    async def handle_async_request(transport, request):
+        cassette = _active
+        body = await request.aread()
+        content_type = request.headers.get("content-type", "")
+        if cassette.should_replay():
+            recorded = cassette.lookup(request.method, str(request.url), body, content_type)
+            if recorded:
+                return to_response(recorded, request)
+            if cassette.mode == "replay":
+                _miss(request.method, str(request.url))
+        response = await original_async_send(transport, request)
+        content = await response.aread()
+        cassette.record(request.method, str(request.url), body, content_type,
+                        response.status_code, dict(response.headers), content)
+        return httpx.Response(response.status_code, headers=_kept(response.headers),
+                              content=content, request=request)
+
+    httpx.HTTPTransport.handle_request = handle_request
+    httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+    _originals[module_name] = (original_send, original_async_send)
+
+
+def _patch_requests():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    original_send = HTTPAdapter.send
+
+    def to_response(recorded: Dict, request):
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response._content = decode_body(recorded["body"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        return response
+
+    def send(adapter, request, **kwargs):
+        cassette = _active
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        content_type = request.headers.get("Content-Type", "")
+        if cassette.should_replay():
+            recorded = cassette.lookup(request.method, request.url, body, content_type)
+            if recorded:
+                return to_response(recorded, request)
+            if cassette.mode == "replay":
+                _miss(request.method, request.url)
+        response = original_send(adapter, request, **kwargs)
+        cassette.record(request.method, request.url, body, content_type,
+                        response.status_code, dict(response.headers), response.content)
+        return response
+
+    HTTPAdapter.send = send
+    _originals["requests"] = original_send
+
+
+def _patch_urllib():
+    import urllib.request
+    from urllib.error import HTTPError
+    from urllib.response import addinfourl
+
+    original_open = urllib.request.OpenerDirector.open
+
+    def to_response(recorded: Dict, url: str):
+        headers = email_message.Message()
+        for key, value in recorded["headers"].items():
+            headers[key] = value
+        content = decode_body(recorded["body"])
+        if recorded["status"] >= 400:
+            raise HTTPError(url, recorded["status"], "Replayed", headers, io.BytesIO(content))
+        return addinfourl(io.BytesIO(content), headers, url, recorded["status"])
+
+    def open_url(opener, fullurl, data=None, *args, **kwargs):
+        cassette = _active
+        if isinstance(fullurl, str):
+            request = urllib.request.Request(fullurl, data=data)
+        else:
+            request = fullurl
+            if data is not None:
+                request.data = data
+        url = request.full_url
+        method = request.get_method()
+        body = request.data or b""
+        if not isinstance(body, (bytes, str)):
+            # Streamed bodies are read once so they can be matched and recorded
+            body = request.data = b"".join(body)
+        content_type = request.get_header("Content-type", "")
+        if cassette.should_replay():
+            recorded = cassette.lookup(method, url, body, content_type)
+            if recorded:
+                return to_response(recorded, url)
+            if cassette.mode == "replay":
+                _miss(method, url)
+        try:
+            response = original_open(opener, request, None, *args, **kwargs)
+        except HTTPError as e:
+            content = e.read()
+            cassette.record(method, url, body, content_type, e.code, dict(e.headers or {}), content)
+            raise HTTPError(url, e.code, e.reason, e.headers, io.BytesIO(content)) from None
+        content = response.read()
+        status = response.status
+        cassette.record(method, url, body, content_type, status, dict(response.headers), content)
+        return addinfourl(io.BytesIO(content), response.headers, url, status)
+
+    urllib.request.OpenerDirector.open = open_url
+    _originals["urllib"] = original_open
+
+
+def _kept(headers) -> Dict[str, str]:
+    return {k: v for k, v in headers.items() if k.lower() not in ("content-encoding", "content-length",
+                                                                   "transfer-encoding")}
+
+
+def install(path: str, mode: str = "replay", match: str = "strict") -> Cassette:
+    """
+    Route all HTTP traffic of the process through a cassette.
+
+    Returns:
+        Cassette: The active cassette, its stats count hits, misses and recordings
+    """
+    global _active
+    if _active is not None:
+        uninstall()
+    _active = Cassette(path, mode, match)
+    _patch_httpx("httpx")
+    _patch_httpx("httpx2")
+    _patch_requests()
+    _patch_urllib()
+    return _active
+
+
+def uninstall():
+    """Restore the original transports."""
+    global _active
+    for module_name in ("httpx", "httpx2"):
+        if module_name in _originals:
+            httpx = importlib.import_module(module_name)
+            httpx.HTTPTransport.handle_request, httpx.AsyncHTTPTransport.handle_async_request = \
+                _originals.pop(module_name)
+    if "requests" in _originals:
+        from requests.adapters import HTTPAdapter
+        HTTPAdapter.send = _originals.pop("requests")
+    if "urllib" in _originals:
+        import urllib.request
+        urllib.request.OpenerDirector.open = _originals.pop("urllib")
+    _active = None
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = "replay", match: str = "strict"):
+    """Install a cassette for the duration of the block."""
+    cassette = install(path, mode, match)
+    try:
+        yield cassette
+    finally:
+        uninstall()
+
+
+def install_from_env() -> Optional[Cassette]:
+    """
+    Install the cassette named by AIDEVS3_CASSETTE, once per process.
+
+    AIDEVS3_CASSETTE_MODE (record/replay/auto, default replay) and
+    AIDEVS3_CASSETTE_MATCH (strict/lenient, default strict) select the behaviour.
+    """
+    path = os.getenv("AIDEVS3_CASSETTE")
+    if not path or _active is not None:
+        return _active
+    return install(path, os.getenv("AIDEVS3_CASSETTE_MODE", "replay"), os.getenv("AIDEVS3_CASSETTE_MATCH", "strict"))
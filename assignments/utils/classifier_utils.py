@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+
+
+class KNNClassifier:
+    """
+    Cosine k-nearest-neighbours classifier over embedding vectors.
+
+    Confidence is the similarity-weighted vote share of the winning label;
+    calibrate() turns it into a threshold with a known precision on the
+    labeled examples.
+    """
+
+    def __init__(self, k: int = 5):
+        self.k = k
+        self.vectors = np.zeros((0, 0))
+        self.labels = []
+        self.threshold = 1.0
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def fit(self, vectors, labels):
+        self.vectors = self._normalize(vectors)
+        self.labels = list(labels)
+        return self
+
+    def _vote(self, similarities, exclude=None):
+        order = np.argsort(-similarities)
+        scores = {}
+        taken = 0
+        for idx in order:
+            if idx == exclude:
+                continue
+            scores[self.labels[idx]] = scores.get(self.labels[idx], 0.0) + max(float(similarities[idx]), 0.0)
+            taken += 1
+            if taken >= self.k:
+                break
+        total = sum(scores.values())
+        if not total:
+            return None, 0.0
+        label = max(scores, key=scores.get)
+        return label, scores[label] / total
+
+    def predict(self, vectors) -> list:
+        """
+        Returns:
+            list: (label, confidence) tuple for every input vector
+        """
+        if not self.labels:
+            return [(None, 0.0) for _ in vectors]
+        similarities = self._normalize(vectors) @ self.vectors.T
+        return [self._vote(row) for row in similarities]
+
+    def calibrate(self, target_precision: float = 0.95) -> float:
+        """
+        Pick the lowest confidence threshold whose leave-one-out precision on
+        the labeled examples reaches target_precision.
+
+        Returns:
+            float: The chosen threshold (1.0 when no threshold qualifies)
+        """
+        self.threshold = 1.0
+        if len(self.labels) <= self.k:
+            return self.threshold
+
+        similarities = self.vectors @ self.vectors.T
+        results = []
+        for idx, row in enumerate(similarities):
+            label, confidence = self._vote(row, exclude=idx)
+            results.append((confidence, label == self.labels[idx]))
+
+        correct = 0
+        for count, (confidence, is_correct) in enumerate(sorted(results, reverse=True), 1):
+            correct += is_correct
+            if correct / count >= target_precision:
+                self.threshold = min(self.threshold, confidence)
+        return self.threshold
+
+
+def load_labeled_examples(labels_path: str, seed_examples=None) -> list:
+    """
+    Load labeled examples ({"text", "label"} dicts) from a JSON file,
+    prepended with optional seed examples.
+    """
+    examples = list(seed_examples or [])
+    if labels_path and os.path.exists(labels_path):
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            examples.extend(json.load(f))
+    return examples
+
+
+def save_labeled_examples(labels_path: str, examples: list) -> None:
+    """Persist labeled examples so later runs can classify them locally."""
+    with open(labels_path, 'w', encoding='utf-8') as f:
+        json.dump(examples, f, ensure_ascii=False, indent=2)
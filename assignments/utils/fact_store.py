@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List
+
+UPPER = "A-ZĄĆĘŁŃÓŚŹŻ"
+LOWER = "a-ząćęłńóśźż"
+
+SECTOR_PATTERN = re.compile(r'\b[Ss]ektor\w*\s+([A-Z]\d*)\b')
+# Lookahead so overlapping pairs are found ("Zatrzymano Barbarę Zawadzką")
+PERSON_PATTERN = re.compile(rf'(?=\b([{UPPER}][{LOWER}]+)\s+([{UPPER}][{LOWER}]+)\b)')
+CAPITALIZED_WORD = re.compile(rf'\s+[{UPPER}][{LOWER}]+\b')
+SENTENCE_START = re.compile(r'(?:^|[.!?:]\s+|\n\s*)$')
+# Endings of verbs that start sentences ("Zatrzymano", "Zauważył", "Przesłuchali")
+VERB_SUFFIXES = ("no", "to", "ył", "ił", "yła", "iła", "ało", "ali", "ili", "yli", "ały", "ać", "eć", "ić")
+LOCATION_PATTERN = re.compile(rf'\b(?:w|we|na|do|z|ze|pod|koło|niedaleko|okolicach)\s+([{UPPER}][{LOWER}]+)\b')
+
+# Capitalized words that start sentences rather than names
+STOPWORDS = {"w", "we", "na", "do", "z", "ze", "po", "od", "przez", "pod", "jest", "był", "była",
+             "to", "ten", "ta", "jego", "jej", "sektor", "sektorze", "raport", "dzień", "godzina"}
+
+ENTITY_TYPES = ("person", "sector", "location")
+# Bump when extract_entities changes, so saved indexes are rebuilt
+INDEX_VERSION = "2"
+
+DIACRITICS = str.maketrans("ąćęłńóśźż", "acelnoszz")
+
+
+def normalize_entity(name: str, stem_length: int = 5) -> str:
+    """
+    Normalize an entity name so inflected forms share a key
+    ("Barbarę Zawadzką" and "Barbara Zawadzka" -> "barba zawad").
+    """
+    return " ".join(word[:stem_length] for word in name.lower().translate(DIACRITICS).split())
+
+
+def _starts_sentence_not_name(text: str, match: re.Match) -> bool:
+    # Every sentence starts capitalized, so a sentence-initial pair is only a name when
+    # its first word does not look like a verb and no third capitalized word follows it
+    return match.group(1).lower().endswith(VERB_SUFFIXES) or CAPITALIZED_WORD.match(text, match.end(2)) is not None
+
+
+def extract_entities(text: str) -> Dict[str, set]:
+    """
+    Find people, sectors and locations mentioned in a text with regex heuristics.
+
+    Returns:
+        Dict[str, set]: Normalized entity keys per entity type
+    """
+    entities = {entity_type: set() for entity_type in ENTITY_TYPES}
+    entities["sector"].update(match.upper() for match in SECTOR_PATTERN.findall(text))
+    for match in PERSON_PATTERN.finditer(text):
+        first, last = match.groups()
+        if first.lower() in STOPWORDS or last.lower() in STOPWORDS:
+            continue
+        if SENTENCE_START.search(text[:match.start()]) and _starts_sentence_not_name(text, match):
+            continue
+        entities["person"].add(normalize_entity(f"{first} {last}"))
+    for name in LOCATION_PATTERN.findall(text):
+        if name.lower() not in STOPWORDS:
+            entities["location"].add(normalize_entity(name))
+    return entities
+
+
+def read_fact_files(facts_dir: str) -> Dict[str, str]:
+    """Text of every f*.txt fact file of a directory, keyed by the file stem."""
+    facts = {}
+    for file_name in sorted(os.listdir(facts_dir)):
+        if file_name.startswith('f') and file_name.endswith('.txt'):
+            with open(os.path.join(facts_dir, file_name), 'r', encoding='utf-8') as file:
+                facts[file_name[:-4]] = file.read().strip()
+    return facts
+
+
+def facts_hash(facts_dir: str) -> str:
+    """Hash of the fact files, changes whenever a fact is added, removed or edited."""
+    digest = hashlib.sha256()
+    for fact_id, text in read_fact_files(facts_dir).items():
+        digest.update(f"{fact_id}\0{text}\0".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FactStore:
+    """
+    Persistent store of facts with an inverted index from entity to fact IDs.
+    """
+
+    def __init__(self, facts: Dict[str, str] = None, index: Dict[str, Dict[str, List[str]]] = None):
+        self.facts = facts or {}
+        self.index = index or {entity_type: {} for entity_type in ENTITY_TYPES}
+
+    def add(self, fact_id: str, text: str):
+        self.facts[fact_id] = text
+        for entity_type, keys in extract_entities(text).items():
+            for key in keys:
+                ids = self.index[entity_type].setdefault(key, [])
+                if fact_id not in ids:
+                    ids.append(fact_id)
+
+    @classmethod
+    def build(cls, facts_dir: str) -> "FactStore":
+        """Index every f*.txt fact file of a directory, using the file stem as fact ID."""
+        store = cls()
+        for fact_id, text in read_fact_files(facts_dir).items():
+            if text and text != "entry deleted":
+                store.add(fact_id, text)
+        print(f"Indexed {len(store.facts)} facts: "
+              + ", ".join(f"{len(store.index[t])} {t} keys" for t in ENTITY_TYPES))
+        return store
+
+    @classmethod
+    def load(cls, path: str) -> "FactStore":
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        return cls(data["facts"], data["index"])
+
+    @classmethod
+    def load_or_build(cls, facts_dir: str, path: str) -> "FactStore":
+        """Load the index saved at path while the fact files are unchanged, else rebuild and save it."""
+        digest = facts_hash(facts_dir)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("facts_hash") == digest and data.get("version") == INDEX_VERSION:
+                print(f"Loaded fact index from {path}")
+                return cls(data["facts"], data["index"])
+        store = cls.build(facts_dir)
+        store.save(path, digest)
+        return store
+
+    def save(self, path: str, facts_hash: str = None):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({"version": INDEX_VERSION, "facts_hash": facts_hash, "facts": self.facts, "index": self.index},
+                      file, ensure_ascii=False, indent=2)
+
+    def lookup(self, entity_type: str, name: str) -> List[str]:
+        """Return the IDs of facts mentioning the entity."""
+        return list(self.index[entity_type].get(normalize_entity(name), []))
+
+    def facts_about_person(self, name: str) -> Dict[str, str]:
+        return {fact_id: self.facts[fact_id] for fact_id in self.lookup("person", name)}
+
+    def facts_about_sector(self, sector: str) -> Dict[str, str]:
+        return {fact_id: self.facts[fact_id] for fact_id in self.index["sector"].get(sector.upper(), [])}
+
+    def facts_about_location(self, location: str) -> Dict[str, str]:
+        return {fact_id: self.facts[fact_id] for fact_id in self.lookup("location", location)}
+
+    def facts_for_text(self, text: str, entity_types=("person",)) -> Dict[str, str]:
+        """
+        Join a text against the store: return the facts sharing any entity with it.
+
+        Only people are joined by default, since almost every report and fact
+        mentions a sector.
+        """
+        fact_ids = []
+        for entity_type, keys in extract_entities(text).items():
+            if entity_type not in entity_types:
+                continue
+            for key in keys:
+                fact_ids.extend(i for i in self.index[entity_type].get(key, []) if i not in fact_ids)
+        return {fact_id: self.facts[fact_id] for fact_id in fact_ids}
@@ -0,0 +1,89 @@
+"""
+Import-time budget check for the utils modules.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for
+every module and fails when its cumulative import time exceeds the budget:
+
+    python -m assignments.utils.importtime_check
+    python -m assignments.utils.importtime_check --repeat 5 --show 10
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Budgets in milliseconds; heavy SDKs must stay out of these import paths
+BUDGETS_MS = {
+    "assignments.utils.aidevs3_utils": 150,
+    "assignments.utils.openai_api": 100,
+    "assignments.utils.qdrant_utils": 150,
+    "assignments.utils.tracing": 50,
+    "assignments.utils.usage_ledger": 50,
+}
+
+LINE_PATTERN = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure_import(module: str) -> dict:
+    """
+    Import module in a fresh interpreter.
+
+    Returns:
+        dict: {"total_ms", "modules": {name: cumulative_ms}} for the direct imports of module
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    python_path = os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=root, env={**os.environ, "PYTHONPATH": python_path}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(2)) / 1000, len(match.group(3))))
+
+    # Children are printed before their parent, one indentation level deeper
+    position = max((i for i, entry in enumerate(entries) if entry[0] == module), default=None)
+    if position is None:
+        return {"total_ms": 0.0, "modules": {}}
+    depth = entries[position][2]
+    modules = {}
+    for name, cumulative_ms, indent in reversed(entries[:position]):
+        if indent <= depth:
+            break
+        if indent == depth + 2:
+            modules[name] = cumulative_ms
+    return {"total_ms": entries[position][1], "modules": modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import-time budgets of the utils modules")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module, the fastest one counts")
+    parser.add_argument("--show", type=int, default=5, help="Heaviest imports to list per module")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module, budget in BUDGETS_MS.items():
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run["total_ms"])
+        status = "OK" if best["total_ms"] <= budget else "OVER"
+        print(f"{status:4} {module}: {best['total_ms']:.1f} ms (budget {budget} ms)")
+        heaviest = sorted(
+            best["modules"].items(),
+            key=lambda item: item[1], reverse=True
+        )[:args.show]
+        for name, ms in heaviest:
+            print(f"       {name}: {ms:.1f} ms")
+        if status == "OVER":
+            over_budget.append(module)
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
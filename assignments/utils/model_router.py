@@ -0,0 +1,123 @@
+"""
+Latency-aware model routing for the LLM helpers.
+
+Callers describe the request (task class, prompt size, latency budget) and
+get back an escalation ladder: the cheapest model that fits first, bigger
+models only if the answer of the previous one fails validation.
+
+Call sites can be configured in code with configure_route() or with a JSON
+file named by AIDEVS3_ROUTES:
+
+    {"S01E01.answer": {"models": ["gpt-4o-mini", "gpt-4o"], "latency_budget": 2.0},
+     "request_anthropic": {"task_class": "short_answer"}}
+"""
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+# Typical latency (seconds for a short prompt) and relative cost of each model
+MODELS = {
+    "gpt-4o-mini": {"provider": "openai", "context": 128000, "latency": 0.6, "cost": 1},
+    "gpt-4o": {"provider": "openai", "context": 128000, "latency": 1.2, "cost": 15},
+    "gpt-4": {"provider": "openai", "context": 8192, "latency": 2.5, "cost": 60},
+    "claude-3-5-haiku-latest": {"provider": "anthropic", "context": 200000, "latency": 0.8, "cost": 5},
+    "claude-3-5-sonnet-latest": {"provider": "anthropic", "context": 200000, "latency": 1.5, "cost": 20},
+}
+
+# Escalation ladders, cheapest first
+TASK_CLASSES = {
+    # One word, one number, yes/no
+    "short_answer": ["gpt-4o-mini", "gpt-4o", "claude-3-5-haiku-latest", "claude-3-5-sonnet-latest"],
+    # Pulling facts or structured data out of a given text
+    "extraction": ["gpt-4o-mini", "gpt-4o", "claude-3-5-haiku-latest", "claude-3-5-sonnet-latest"],
+    # Multi-step reasoning, code or SQL generation
+    "reasoning": ["gpt-4o", "gpt-4", "claude-3-5-sonnet-latest"],
+}
+
+# Seconds added per 1000 prompt tokens to the expected latency
+LATENCY_PER_1K_TOKENS = 0.15
+
+_routes: Dict[str, Dict] = {}
+_routes_loaded = False
+_observed: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def configure_route(call_site: str, task_class: Optional[str] = None, models: Optional[List[str]] = None,
+                    latency_budget: Optional[float] = None, max_escalations: Optional[int] = None):
+    """
+    Override routing for one call site.
+
+    Args:
+        call_site (str): Name passed by the caller, e.g. "S01E01.answer"
+        task_class (str): Ladder from TASK_CLASSES to use instead of the caller's
+        models (List[str]): Explicit ladder, takes precedence over task_class
+        latency_budget (float): Seconds the call may take
+        max_escalations (int): How many bigger models may be tried after the first
+    """
+    _load_routes()
+    route_config = {"task_class": task_class, "models": models,
+                    "latency_budget": latency_budget, "max_escalations": max_escalations}
+    with _lock:
+        _routes[call_site] = {k: v for k, v in route_config.items() if v is not None}
+
+
+def _load_routes():
+    global _routes_loaded
+    if _routes_loaded:
+        return
+    _routes_loaded = True
+    path = os.getenv("AIDEVS3_ROUTES")
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            with _lock:
+                _routes.update(json.load(f))
+
+
+def observe(model: str, seconds: float, alpha: float = 0.2):
+    """Feed the measured latency of a call into the model's moving average."""
+    with _lock:
+        previous = _observed.get(model)
+        _observed[model] = seconds if previous is None else alpha * seconds + (1 - alpha) * previous
+
+
+def expected_latency(model: str, prompt_tokens: int = 0) -> float:
+    """Observed moving average (or the catalog value) plus a prompt-size term."""
+    with _lock:
+        base = _observed.get(model, MODELS.get(model, {}).get("latency", 2.0))
+    return base + prompt_tokens / 1000 * LATENCY_PER_1K_TOKENS
+
+
+def route(call_site: str, task_class: str = "short_answer", prompt_tokens: int = 0,
+          latency_budget: Optional[float] = None, provider: Optional[str] = None) -> List[str]:
+    """
+    Return the models to try for a request, in escalation order.
+
+    Models whose context window is too small are skipped. With a latency
+    budget, models expected to exceed it are skipped too, keeping at least
+    the fastest remaining one.
+
+    Returns:
+        List[str]: Model names, never empty
+    """
+    _load_routes()
+    with _lock:
+        config = dict(_routes.get(call_site, {}))
+    ladder = config.get("models") or TASK_CLASSES[config.get("task_class", task_class)]
+    latency_budget = config.get("latency_budget", latency_budget)
+
+    candidates = [
+        model for model in ladder
+        if (provider is None or MODELS.get(model, {}).get("provider", provider) == provider)
+        and MODELS.get(model, {}).get("context", float("inf")) > prompt_tokens
+    ]
+    if not candidates:
+        raise ValueError(f"No {provider or ''} model for {call_site} fits {prompt_tokens} prompt tokens")
+
+    if latency_budget is not None:
+        fitting = [m for m in candidates if expected_latency(m, prompt_tokens) <= latency_budget]
+        candidates = fitting or [min(candidates, key=lambda m: expected_latency(m, prompt_tokens))]
+
+    max_escalations = config.get("max_escalations")
+    return candidates if max_escalations is None else candidates[:max_escalations + 1]
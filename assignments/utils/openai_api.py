@@ -1,53 +1,174 @@
 import os
-from openai import OpenAI
+import json
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from assignments.utils.cassette_utils import install_from_env
+from assignments.utils.lazy_utils import lazy_import
+from assignments.utils.model_router import observe, route
+from assignments.utils.resilience_utils import resilient_call
+from assignments.utils.retrieval_utils import select_sections
+from assignments.utils.semantic_cache import fingerprint, get_cache
+from assignments.utils.token_budget import count_tokens, fit_content
+from assignments.utils.tracing import span, text_size, bind_context
+from assignments.utils.usage_ledger import record_response
 from dotenv import load_dotenv
 
-client = OpenAI()
+# The SDK is imported and the client created on first use
+openai = lazy_import("openai")
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Load API keys from environments variable
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Record or replay HTTP traffic when AIDEVS3_CASSETTE is set
+install_from_env()
 
-# Initialize the OpenAI client
-client_openai = OpenAI(api_key=OPENAI_API_KEY)
+@functools.lru_cache(maxsize=None)
+def get_openai_client():
+    """Shared OpenAI client, created on first use."""
+    # Retries are handled by resilient_call
+    return openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 
-def ask_gpt(prompt, question, model):
+def __getattr__(name):
+    # Backwards compatible module attributes, now created lazily
+    if name in ("client", "client_openai"):
+        return get_openai_client()
+    if name == "OPENAI_API_KEY":
+        return os.getenv("OPENAI_API_KEY")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def ask_gpt(prompt, question, model=None, hedge=False, task_class="short_answer",
+            validate=None, latency_budget=None, call_site="ask_gpt", race=False):
+    """
+    Ask a single question; returns the answer text or None when every call fails.
+
+    Without a model the router picks the cheapest model of task_class that fits
+    the prompt and latency_budget, and escalates to bigger models while
+    validate(answer) rejects the answer. With hedge, a slow request is
+    duplicated after the observed p95 latency. With race, all available
+    providers are asked at once and the first valid answer wins; the routed
+    models are the fallback when none arrives. With the semantic cache on, a
+    reworded question already answered for the same prompt is not asked again.
+    """
+    cache = get_cache()
+    content_fingerprint = fingerprint(call_site, prompt, model or task_class)
+    if cache:
+        with span("semantic_cache.lookup", kind="internal", call_site=call_site) as s:
+            cached, score = cache.lookup(call_site, question, content_fingerprint)
+            s.set(hit=cached is not None, score=round(score, 4))
+        if cached is not None and (validate is None or validate(cached)):
+            print(f"Semantic cache hit ({score:.3f}) for: {question}")
+            return cached
+
+    answer = _ask_gpt(prompt, question, model, hedge, task_class, validate, latency_budget, call_site, race)
+    if cache and answer is not None and (validate is None or validate(answer)):
+        cache.store(call_site, question, content_fingerprint, answer)
+    return answer
+
+def _ask_gpt(prompt, question, model, hedge, task_class, validate, latency_budget, call_site, race):
+    if race:
+        # asyncio and the async clients are only imported for racing calls
+        from assignments.utils import race_utils
+        try:
+            answer, _ = race_utils.race(prompt, question, validate=validate, timeout=latency_budget or 30.0)
+            if answer is not None:
+                return answer
+            print("No valid answer from the race, falling back to routed models")
+        except ValueError as e:
+            print(f"Race skipped: {e}")
+
+    if model:
+        models = [model]
+    else:
+        models = route(call_site, task_class, count_tokens(prompt + question), latency_budget, provider="openai")
+
+    answer = None
+    for escalation, model_name in enumerate(models):
+        candidate = _ask_gpt_once(prompt, question, model_name, hedge, call_site, escalation)
+        if candidate is None:
+            continue
+        answer = candidate
+        if validate is None or validate(candidate):
+            return candidate
+        print(f"Answer of {model_name} failed validation: {candidate!r}")
+    return answer
+
+def _ask_gpt_once(prompt, question, model, hedge, call_site, escalation):
+    client = get_openai_client()
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": question}
-            ]
-        )
+        with span("openai.chat", kind="llm", call_site=call_site, model=model, escalation=escalation or None,
+                  request_chars=text_size(prompt) + text_size(question)) as s:
+            start = time.time()
+            response = resilient_call("openai", client.chat.completions.create,
+                model=model,
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": question}
+                ],
+                hedge=hedge
+            )
+            observe(model, time.time() - start)
+            s.set(response_chars=text_size(response.choices[0].message.content))
+            record_response(s, response, "openai")
         
         # Return just the answer text
         return response.choices[0].message.content.strip()
         
     except Exception as e:
-        print(f"Error getting GPT-4 response: {e}")
+        print(f"Error getting {model} response: {e}")
         return None
 
-def get_answer_from_content(content: str, question: str) -> str:
+# Semantic cache namespace shared by the single and the shared-context answers
+CONTENT_ANSWERS = "get_answer_from_content"
+
+def get_answer_from_content(content: str, question: str, top_k: int = None,
+                            token_budget: int = None, use_embeddings: bool = False,
+                            source: str = None) -> str:
     """
     Get an answer to a question using GPT-4 based on provided content.
     
     Args:
         content (str): Text containing content to analyze
         question (str): Question to answer
+        top_k (int): If set, send only the top_k sections most relevant to the question
+        token_budget (int): Maximum tokens of the prompt; over-budget content is
+            packed (duplicates and least relevant sections dropped) before sending
+        use_embeddings (bool): Score sections with embeddings in addition to BM25
+        source (str): Name of the content (e.g. its file); with the semantic cache on,
+            answers cached for an older version of it are dropped
         
     Returns:
         str: Answer from GPT-4
     """
-    # Initialize OpenAI client
-    client = OpenAI(
-        api_key=os.environ.get("OPENAI_API_KEY")
-    )
+    cache = get_cache()
+    content_fingerprint = fingerprint(content, str(top_k), str(token_budget))
+    if cache:
+        cached = _cached_answer(cache, question, content_fingerprint, source)
+        if cached is not None:
+            return cached
+
+    answer = _answer_from_content(content, question, top_k, token_budget, use_embeddings)
+    if cache:
+        cache.store(CONTENT_ANSWERS, question, content_fingerprint, answer, source)
+    return answer
+
+def _cached_answer(cache, question, content_fingerprint, source):
+    with span("semantic_cache.lookup", kind="internal", call_site=CONTENT_ANSWERS) as s:
+        cached, score = cache.lookup(CONTENT_ANSWERS, question, content_fingerprint, source)
+        s.set(hit=cached is not None, score=round(score, 4))
+    if cached is not None:
+        print(f"Semantic cache hit ({score:.3f}) for: {question}")
+    return cached
+
+def _answer_from_content(content, question, top_k, token_budget, use_embeddings):
+    if top_k:
+        content = select_sections(content, question, top_k, token_budget, use_embeddings)
+
+    client = get_openai_client()
+    system_prompt = "You are a precise answering assistant. Provide direct, concise answers based only on the given content."
     
     # Create prompt combining content and question
-    prompt = f"""Based on the following content, please answer the question. 
+    template = """Based on the following content, please answer the question. 
     Provide only the direct answer in the same language as the question without any additional explanations or context.
 
 <rules>
@@ -61,18 +182,146 @@ def get_answer_from_content(content: str, question: str) -> str:
 <question>
 {question}
 </question>"""
+    content, estimate = fit_content(content, "gpt-4o", token_budget, question,
+                                    reserved=count_tokens(system_prompt + template.format(content="", question=question)))
+    prompt = template.format(content=content, question=question)
     # Make API call to GPT-4
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a precise answering assistant. Provide direct, concise answers based only on the given content."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.1  # Low temperature for more focused answers
-    )
+    with span("openai.chat", kind="llm", call_site="get_answer_from_content", model="gpt-4o",
+              request_chars=text_size(prompt), estimated_tokens=estimate["tokens"]) as s:
+        response = resilient_call("openai", client.chat.completions.create,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1  # Low temperature for more focused answers
+        )
+        s.set(response_chars=text_size(response.choices[0].message.content))
+        record_response(s, response, "openai")
     
     return response.choices[0].message.content.strip()
 
+def get_answers_from_content(content: str, questions: dict, max_workers: int = 8, source: str = None) -> dict:
+    """
+    Answer several questions about the same content in one request.
+    
+    The content is sent once together with all questions and the model returns
+    a JSON object keyed by question ID. Answers that are missing or malformed
+    are re-asked individually and concurrently with get_answer_from_content.
+    With the semantic cache on, questions answered before are not sent.
+    
+    Args:
+        content (str): Text containing content to analyze
+        questions (dict): Questions keyed by their ID
+        max_workers (int): Concurrent requests for the re-asked questions
+        source (str): Name of the content, see get_answer_from_content
+        
+    Returns:
+        dict: Answers keyed by question ID, None for questions that failed
+    """
+    cache = get_cache()
+    content_fingerprint = fingerprint(content, str(None), str(None))
+    answers = {}
+    if cache:
+        for q_id, q_text in questions.items():
+            cached = _cached_answer(cache, q_text, content_fingerprint, source)
+            if cached is not None:
+                answers[q_id] = cached
+    pending = {q_id: q_text for q_id, q_text in questions.items() if q_id not in answers}
+    if pending:
+        fresh = _shared_answers(content, pending)
+        if cache:
+            for q_id, answer in fresh.items():
+                cache.store(CONTENT_ANSWERS, pending[q_id], content_fingerprint, answer, source)
+        answers.update(fresh)
+    
+    missing = [q_id for q_id in questions if q_id not in answers]
+    if missing:
+        print(f"Re-asking {len(missing)} questions individually: {missing}")
+        ask = bind_context(lambda q_id: get_answer_from_content(content, questions[q_id], source=source))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(ask, q_id): q_id for q_id in missing}
+            for future in as_completed(futures):
+                q_id = futures[future]
+                try:
+                    answers[q_id] = future.result()
+                except Exception as e:
+                    # One failed question must not discard the answers already paid for
+                    print(f"Error re-asking question {q_id}: {e}")
+                    answers[q_id] = None
+    
+    return {q_id: answers[q_id] for q_id in questions}
+
+def _shared_answers(content: str, questions: dict) -> dict:
+    client = get_openai_client()
+    
+    questions_block = "\n".join(f'<question id="{q_id}">{q_text}</question>' for q_id, q_text in questions.items())
+    prompt = f"""Based on the following content, please answer every question.
+    Provide only the direct answer in the same language as the question without any additional explanations or context.
+    Respond with a JSON object mapping each question id to its answer string.
+
+<rules>
+1. while answering, use only facts provided in <content> section
+</rules>
+
+<content>
+{content}
+</content>
+
+<questions>
+{questions_block}
+</questions>"""
+
+    answers = {}
+    try:
+        with span("openai.chat", kind="llm", call_site="get_answers_from_content", model="gpt-4o",
+                  request_chars=text_size(prompt), questions=len(questions)) as s:
+            response = resilient_call("openai", client.chat.completions.create,
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": "You are a precise answering assistant. Provide direct, concise answers based only on the given content."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.1
+            )
+            s.set(response_chars=text_size(response.choices[0].message.content))
+            record_response(s, response, "openai")
+        parsed = json.loads(response.choices[0].message.content)
+        if isinstance(parsed, dict):
+            answers = {
+                q_id: parsed[q_id].strip() for q_id in questions
+                if isinstance(parsed.get(q_id), str) and parsed[q_id].strip()
+            }
+    except Exception as e:
+        print(f"Error getting shared-context answers: {e}")
+    return answers
+
+# Inputs per embeddings request, well below the API limit of 2048
+EMBEDDING_BATCH_SIZE = 256
+
+def get_embeddings(texts, model: str = "text-embedding-3-small") -> list:
+    """
+    Embed several texts in as few requests as possible (EMBEDDING_BATCH_SIZE inputs each).
+    
+    Args:
+        texts (list): Texts to embed
+        model (str): OpenAI embedding model
+        
+    Returns:
+        list: One embedding vector per text, in input order
+    """
+    texts = list(texts)
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        chunk = texts[start:start + EMBEDDING_BATCH_SIZE]
+        with span("openai.embeddings", kind="embedding", call_site="get_embeddings", model=model,
+                  inputs=len(chunk), request_chars=sum(text_size(t) for t in chunk)) as s:
+            response = resilient_call("openai", get_openai_client().embeddings.create, input=chunk, model=model)
+            record_response(s, response, "openai")
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return vectors
+
 def connect_openai(model_name: str) -> bool:
     """
     Validates connection to OpenAI API and checks model availability.
@@ -85,7 +334,7 @@ def connect_openai(model_name: str) -> bool:
     """
     try:
         # List available models and check if requested model is available
-        available_models = client_openai.models.list()
+        available_models = get_openai_client().models.list()
         model_exists = any(model.id == model_name for model in available_models)
         
         if not model_exists:
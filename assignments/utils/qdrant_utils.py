@@ -1,71 +1,101 @@
-from qdrant_client import QdrantClient, models
-from qdrant_client.http.models import Filter, FieldCondition, MatchAny
-from openai import OpenAI
+import functools
 import json
 import os
 from dotenv import load_dotenv
+from assignments.utils.lazy_utils import lazy_import
+from assignments.utils.openai_api import get_openai_client
+from assignments.utils.resilience_utils import resilient_call
+from assignments.utils.tracing import span, text_size, traced
+from assignments.utils.usage_ledger import record_response
 
-def connect_to_qdrant():
+# Heavy SDKs are imported on first use
+qdrant_client = lazy_import("qdrant_client")
+models = lazy_import("qdrant_client.models")
+qdrant_local = lazy_import("qdrant_client.local.qdrant_local")
+
+# Payload fields filtered on in search(), indexed when the collection is created
+PAYLOAD_INDEXES = {
+    "date": "datetime",
+    "keywords": "keyword",
+    "filename": "keyword",
+}
+
+# Points sent per upsert request
+UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH", "64"))
+
+_checked_clients = set()
+
+def connect_to_qdrant(url=None, api_key=None, path=None, prefer_grpc=None):
     """
-    Establishes connection to Qdrant vector database using environment variables.
-    Returns a QdrantClient instance.
+    Returns a shared QdrantClient for the configuration, created on first use.
+
+    QDRANT_PATH runs Qdrant embedded in the process: ":memory:" for a
+    throwaway collection or a directory to keep it on disk, no server needed.
+    Otherwise QDRANT_URL (with the optional QDRANT_API_KEY) is used, over gRPC
+    when QDRANT_PREFER_GRPC=1 (port QDRANT_GRPC_PORT, 6334 by default).
+    Arguments override the environment.
     """
     load_dotenv()
-    qdrant_url = os.getenv("QDRANT_URL")
-    qdrant_api_key = os.getenv("QDRANT_API_KEY")
-    
-    if not qdrant_url or not qdrant_api_key:
-        raise ValueError("QDRANT_URL and QDRANT_API_KEY must be set in .env file")
+    path = path or os.getenv("QDRANT_PATH")
+    url = url or os.getenv("QDRANT_URL")
+    api_key = api_key or os.getenv("QDRANT_API_KEY")
+    if prefer_grpc is None:
+        prefer_grpc = os.getenv("QDRANT_PREFER_GRPC") == "1"
     
+    if path:
+        return _client(path=path)
+    if not url:
+        raise ValueError("QDRANT_URL (or QDRANT_PATH for an embedded Qdrant) must be set in .env file")
+    return _client(url=url, api_key=api_key, prefer_grpc=prefer_grpc,
+                   grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")))
+
+@functools.lru_cache(maxsize=None)
+def _client(url=None, api_key=None, path=None, prefer_grpc=False, grpc_port=6334):
+    # One client per configuration, so managers share its connection pool (or embedded storage)
+    if path == ":memory:":
+        return qdrant_client.QdrantClient(location=":memory:")
+    if path:
+        return qdrant_client.QdrantClient(path=path)
+    return qdrant_client.QdrantClient(url=url, api_key=api_key, prefer_grpc=prefer_grpc, grpc_port=grpc_port)
+
+def is_local(client):
+    """Whether the client runs Qdrant embedded in the process (QDRANT_PATH or QdrantClient(":memory:"))."""
+    return isinstance(getattr(client, "_client", None), qdrant_local.QdrantLocal)
+
+def check_connection(client):
+    """Fail early when Qdrant is unreachable; every client is checked once."""
+    if id(client) in _checked_clients:
+        return
     try:
-        client = QdrantClient(
-            url=qdrant_url,
-            api_key=qdrant_api_key
-        )
-        client.get_collections()
+        with span("qdrant.get_collections", kind="qdrant"):
+            client.get_collections()
         print("Successfully connected to Qdrant")
-        return client
     except Exception as e:
         print(f"Error connecting to Qdrant: {str(e)}")
         raise
+    _checked_clients.add(id(client))
 
 def generate_embedding(model, file_path):
     print(f"\n=== Generating embedding for {file_path} ===")
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    print("OpenAI client initialized")
+    client = get_openai_client()
     
     with open(file_path, 'r', encoding='utf-8') as file:
         content = file.read()
     print(f"File content read: {len(content)} characters")
     
     print("Generating embedding...")
-    response = client.embeddings.create(
-        input=content,
-        model=model
-    )
+    with span("openai.embeddings", kind="embedding", call_site="generate_embedding", model=model,
+              inputs=1, request_chars=text_size(content)) as s:
+        response = resilient_call("openai", client.embeddings.create,
+            input=content,
+            model=model
+        )
+        record_response(s, response, "openai")
     print("Embedding generated successfully")
     return response.data[0].embedding
 
-def extract_metadata(file_path):
-    print(f"\n=== Extracting metadata for {file_path} ===")
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    print("OpenAI client initialized")
-    
-    filename = os.path.basename(file_path)
-    date_str = filename.split('.')[0]
-    try:
-        year, month, day = date_str.split('_')
-        formatted_date = f"{year}-{month}-{day}"
-    except ValueError:
-        print("WARNING: Could not parse date from filename")
-        formatted_date = None
-    
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-    print(f"File content read: {len(content)} characters")
-    
-    print("Creating GPT-4 prompt...")
-    prompt = """Analyze the following text and provide:
+METADATA_SYSTEM_PROMPT = "You are a precise document analyzer. Respond only with the requested JSON format."
+METADATA_PROMPT = """Analyze the following text and provide:
 1. A title (it always in the first line of the file)
 2. 5-7 relevant keywords
 
@@ -78,25 +108,32 @@ Respond in JSON format like this:
 Text to analyze:
 
 """
-    
-    print("Sending request to GPT-4...")
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are a precise document analyzer. Respond only with the requested JSON format."},
-            {"role": "user", "content": prompt + content}
-        ],
-        temperature=0.3
-    )
-    print("Received response from GPT-4")
-    
+
+def report_date(filename):
+    """Date of a report named YYYY_MM_DD.txt as YYYY-MM-DD, None for other names."""
     try:
-        gpt_analysis = json.loads(response.choices[0].message.content)
+        year, month, day = filename.split('.')[0].split('_')
+        return f"{year}-{month}-{day}"
+    except ValueError:
+        print("WARNING: Could not parse date from filename")
+        return None
+
+def metadata_messages(content):
+    return [
+        {"role": "system", "content": METADATA_SYSTEM_PROMPT},
+        {"role": "user", "content": METADATA_PROMPT + content}
+    ]
+
+def parse_metadata(file_path, reply):
+    """Build the point payload of a report from the model's JSON reply."""
+    try:
+        gpt_analysis = json.loads(reply)
         print("Successfully parsed GPT-4 response")
         
+        filename = os.path.basename(file_path)
         metadata = {
             "filename": filename,
-            "date": formatted_date,
+            "date": report_date(filename),
             "title": gpt_analysis["title"],
             "keywords": gpt_analysis["keywords"]
         }
@@ -107,27 +144,126 @@ Text to analyze:
         print("ERROR: Failed to parse GPT-4 response")
         raise Exception("Failed to parse GPT-4 response into JSON format")
 
+def extract_metadata(file_path):
+    print(f"\n=== Extracting metadata for {file_path} ===")
+    client = get_openai_client()
+    
+    filename = os.path.basename(file_path)
+    with open(file_path, 'r', encoding='utf-8') as file:
+        content = file.read()
+    print(f"File content read: {len(content)} characters")
+    
+    print("Sending request to GPT-4...")
+    with span("openai.chat", kind="llm", call_site="extract_metadata", model="gpt-4",
+              file=filename, request_chars=text_size(METADATA_PROMPT + content)) as s:
+        response = resilient_call("openai", client.chat.completions.create,
+            model="gpt-4",
+            messages=metadata_messages(content),
+            temperature=0.3
+        )
+        s.set(response_chars=text_size(response.choices[0].message.content))
+        record_response(s, response, "openai")
+    print("Received response from GPT-4")
+    return parse_metadata(file_path, response.choices[0].message.content)
+
+def extract_metadata_batch(file_paths):
+    """
+    Extract the metadata of many reports with one batch job (see batch_utils).
+
+    Returns:
+        dict: file path -> metadata, without the files whose request failed
+        (empty when the batch itself failed)
+    """
+    from assignments.utils.batch_utils import chat_request, run_batch
+
+    requests = {}
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            requests[file_path] = chat_request("gpt-4", metadata_messages(file.read()), temperature=0.3)
+    try:
+        replies = run_batch("extract_metadata", requests)
+    except Exception as e:
+        print(f"Batch failed, extracting metadata directly: {e}")
+        return {}
+    metadata = {}
+    for file_path, reply in replies.items():
+        if reply is None:
+            continue
+        try:
+            metadata[file_path] = parse_metadata(file_path, reply)
+        except Exception as e:
+            print(f"ERROR: {file_path}: {e}")
+    return metadata
+
 class QdrantManager:
-    def __init__(self):
-        self.client = connect_to_qdrant()
+    def __init__(self, client=None):
+        # Pass a client to reuse an existing connection, e.g. QdrantClient(":memory:")
+        self._client = client
+
+    @property
+    def client(self):
+        # Connected and health checked on first use, not on construction
+        if self._client is None:
+            self._client = connect_to_qdrant()
+        check_connection(self._client)
+        return self._client
+
+    def create_payload_indexes(self, collection_name):
+        """Index the PAYLOAD_INDEXES fields so filtered searches only visit matching points."""
+        if is_local(self.client):
+            # Embedded Qdrant filters without indexes (and warns about every one created)
+            return
+        for field, schema in PAYLOAD_INDEXES.items():
+            with span("qdrant.create_payload_index", kind="qdrant", collection=collection_name, field=field):
+                self.client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field,
+                    field_schema=models.PayloadSchemaType(schema),
+                    wait=True
+                )
 
-    def index_documents(self, reports_folder, collection_name):
+    def upsert_points(self, collection_name, points):
+        """Upsert points in requests of UPSERT_BATCH_SIZE."""
+        for start in range(0, len(points), UPSERT_BATCH_SIZE):
+            chunk = points[start:start + UPSERT_BATCH_SIZE]
+            with span("qdrant.upsert", kind="qdrant", collection=collection_name, points=len(chunk)):
+                self.client.upsert(collection_name=collection_name, points=chunk, wait=True)
+
+    @traced("QdrantManager.index_documents")
+    def index_documents(self, reports_folder, collection_name, batch=None):
+        """
+        Embed every .txt report of the folder and upsert it with its metadata.
+
+        With batch=True (or AIDEVS3_BATCH=1) the metadata of all reports is
+        extracted with one batch job first; files missing from its results
+        fall back to a regular request.
+        """
         print(f"\n=== Indexing documents from {reports_folder} to Qdrant ===")
         
         print("Creating/resetting Qdrant collection...")
-        self.client.recreate_collection(
-            collection_name=collection_name,
-            vectors_config=models.VectorParams(
-                size=1536,
-                distance=models.Distance.COSINE
+        with span("qdrant.recreate_collection", kind="qdrant", collection=collection_name):
+            self.client.recreate_collection(
+                collection_name=collection_name,
+                vectors_config=models.VectorParams(
+                    size=1536,
+                    distance=models.Distance.COSINE
+                )
             )
-        )
+        self.create_payload_indexes(collection_name)
         print(f"Collection '{collection_name}' created/reset successfully")
 
         txt_files = [f for f in os.listdir(reports_folder) if f.endswith('.txt')]
         total_files = len(txt_files)
         print(f"\nFound {total_files} text files to process")
 
+        # Batch support (and the SDKs it needs) is only imported in bulk mode
+        from assignments.utils.batch_utils import batch_enabled
+
+        batch_metadata = {}
+        if batch_enabled(batch):
+            batch_metadata = extract_metadata_batch([os.path.join(reports_folder, f) for f in txt_files])
+
+        points = []
         for idx, filename in enumerate(txt_files, 1):
             print(f"\nProcessing file {idx}/{total_files}: {filename}")
             file_path = os.path.join(reports_folder, filename)
@@ -137,42 +273,61 @@ class QdrantManager:
                 print("Embedding generated successfully")
                 
                 print("Extracting metadata...")
-                metadata = extract_metadata(file_path)
+                metadata = batch_metadata.get(file_path) or extract_metadata(file_path)
                 print("Metadata extracted successfully")
                 
                 point_id = abs(hash(filename)) % (2**63)
                 
-                print("Uploading to Qdrant...")
-                self.client.upsert(
-                    collection_name=collection_name,
-                    points=[
-                        models.PointStruct(
-                            id=point_id,
-                            vector=embedding,
-                            payload=metadata
-                        )
-                    ]
+                points.append(
+                    models.PointStruct(
+                        id=point_id,
+                        vector=embedding,
+                        payload=metadata
+                    )
                 )
-                print(f"✓ Successfully indexed {filename}")
+                print(f"✓ Prepared {filename}")
                 
             except Exception as e:
                 print(f"Error processing {filename}: {str(e)}")
                 continue
 
+        print(f"\nUploading {len(points)} points to Qdrant...")
+        self.upsert_points(collection_name, points)
         print(f"\n=== Indexing complete. Processed {total_files} files ===")
 
-    def search(self, question, collection_name):
+    @traced("QdrantManager.search")
+    def search(self, question, collection_name, date_from=None, date_to=None, keywords=None, filenames=None):
+        """
+        Find the report that best answers the question and return its date.
+
+        The filters are applied by Qdrant during the vector search, so narrow
+        questions only score the matching reports.
+
+        Args:
+            question (str): Path of the file with the question
+            collection_name (str): Collection filled by index_documents
+            date_from (str): Earliest report date, YYYY-MM-DD
+            date_to (str): Latest report date, YYYY-MM-DD
+            keywords (list): Reports with at least one of these keywords (exact match)
+            filenames (list): Reports with one of these file names
+
+        Returns:
+            str: Date of the best matching report, None when nothing matches
+        """
         print(f"\n=== Searching for answer to: {question} ===")
         
         question_embedding = generate_embedding("text-embedding-3-small", question)
         print("Question embedding generated")
         
-        # Search for the single best match across all documents
-        search_results = self.client.search(
-            collection_name=collection_name,
-            query_vector=question_embedding,
-            limit=1  # Get only the top match
-        )
+        query_filter = build_filter(date_from, date_to, keywords, filenames)
+        if query_filter:
+            print(f"Filtering by: {query_filter.model_dump(mode='json', exclude_none=True)}")
+        
+        # Search for the single best match across the (filtered) documents
+        with span("qdrant.search", kind="qdrant", collection=collection_name, limit=1,
+                  filtered=query_filter is not None) as s:
+            search_results = self.query(collection_name, question_embedding, query_filter, limit=1)
+            s.set(results=len(search_results))
         
         if search_results:
             best_match = search_results[0]  # This will be the highest scoring match
@@ -183,3 +338,30 @@ class QdrantManager:
         else:
             print("No matching documents found")
             return None
+
+    def query(self, collection_name, vector, query_filter=None, limit=1):
+        """Nearest points to the vector, with query_points on clients that no longer have search."""
+        if hasattr(self.client, "query_points"):
+            return self.client.query_points(
+                collection_name=collection_name,
+                query=vector,
+                query_filter=query_filter,
+                limit=limit
+            ).points
+        return self.client.search(
+            collection_name=collection_name,
+            query_vector=vector,
+            query_filter=query_filter,
+            limit=limit
+        )
+
+def build_filter(date_from=None, date_to=None, keywords=None, filenames=None):
+    """Qdrant filter matching every given condition, None when there are none."""
+    conditions = []
+    if date_from or date_to:
+        conditions.append(models.FieldCondition(key="date", range=models.DatetimeRange(gte=date_from, lte=date_to)))
+    if keywords:
+        conditions.append(models.FieldCondition(key="keywords", match=models.MatchAny(any=list(keywords))))
+    if filenames:
+        conditions.append(models.FieldCondition(key="filename", match=models.MatchAny(any=list(filenames))))
+    return models.Filter(must=conditions) if conditions else None
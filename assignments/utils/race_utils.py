@@ -0,0 +1,188 @@
+"""
+Race the same prompt against several providers and keep the first valid answer.
+
+    answer, provider = race(prompt, question, validate=is_number)
+
+Every configured provider (OpenAI, Anthropic, Groq and the Cloudflare worker
+used by S01E05) gets the request at the same time on a shared asyncio loop;
+the first answer that passes validation wins and the other requests are
+cancelled. Providers without credentials are skipped. Wins, failures and
+latencies are kept per provider, see race_stats().
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from assignments.utils.lazy_utils import lazy_import
+from assignments.utils.tracing import span, text_size
+from assignments.utils.usage_ledger import record_response
+
+openai = lazy_import("openai")
+anthropic = lazy_import("anthropic")
+groq = lazy_import("groq")
+httpx = lazy_import("httpx")
+
+# Fast model of every provider and the environment variable it needs
+RACE_PROVIDERS = {
+    "openai": {"model": "gpt-4o-mini", "env": "OPENAI_API_KEY"},
+    "anthropic": {"model": "claude-3-5-haiku-latest", "env": "ANTHROPIC_API_KEY"},
+    "groq": {"model": "llama-3.1-8b-instant", "env": "GROQ_API_KEY"},
+    "cloudflare": {"model": "llama-3.2", "env": "URL_CLOUDFLARE_LAMA-3-2"},
+}
+
+_loop = None
+_loop_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict] = {}
+
+
+def available_providers() -> List[str]:
+    """Providers whose credentials (or worker URL) are set."""
+    return [name for name, config in RACE_PROVIDERS.items() if os.getenv(config["env"])]
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    # One long-lived loop keeps the async clients and their connection pools warm
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="race-loop", daemon=True).start()
+        return _loop
+
+
+@functools.lru_cache(maxsize=None)
+def _client(provider: str):
+    # Racing is the redundancy, so the SDKs do not retry on their own
+    if provider == "openai":
+        return openai.AsyncOpenAI(max_retries=0)
+    if provider == "anthropic":
+        return anthropic.AsyncAnthropic(max_retries=0)
+    if provider == "groq":
+        return groq.AsyncGroq(max_retries=0)
+    return httpx.AsyncClient(timeout=30.0)
+
+
+async def _ask(provider: str, prompt: str, question: str, max_tokens: int) -> str:
+    model = RACE_PROVIDERS[provider]["model"]
+    client = _client(provider)
+    with span(f"{provider}.race", kind="llm", call_site="race", provider=provider, model=model,
+              request_chars=text_size(prompt) + text_size(question)) as s:
+        if provider == "anthropic":
+            response = await client.messages.create(
+                model=model, max_tokens=max_tokens, system=prompt,
+                messages=[{"role": "user", "content": question}]
+            )
+            answer = response.content[0].text
+            record_response(s, response, provider)
+        elif provider == "cloudflare":
+            response = await client.post(os.getenv(RACE_PROVIDERS[provider]["env"]),
+                                         data={"text": f"{prompt}\n\n{question}"})
+            response.raise_for_status()
+            answer = response.text
+        else:
+            response = await client.chat.completions.create(
+                model=model, max_tokens=max_tokens,
+                messages=[{"role": "system", "content": prompt}, {"role": "user", "content": question}]
+            )
+            answer = response.choices[0].message.content
+            record_response(s, response, provider)
+        s.set(response_chars=text_size(answer))
+    return answer.strip()
+
+
+def _record(provider: str, outcome: Optional[str] = None, latency: Optional[float] = None):
+    with _stats_lock:
+        stats = _stats.setdefault(provider, {"races": 0, "wins": 0, "invalid": 0, "failed": 0,
+                                             "cancelled": 0, "latencies": deque(maxlen=500)})
+        if outcome:
+            stats[outcome] += 1
+        if latency is not None:
+            stats["latencies"].append(latency)
+
+
+async def _race(prompt: str, question: str, providers: List[str], validate: Optional[Callable],
+                timeout: float, max_tokens: int) -> Tuple[Optional[str], Optional[str]]:
+    start = time.perf_counter()
+    tasks = {asyncio.ensure_future(_ask(p, prompt, question, max_tokens)): p for p in providers}
+    for provider in providers:
+        _record(provider, "races")
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = timeout - (time.perf_counter() - start)
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider = tasks[task]
+                latency = time.perf_counter() - start
+                if task.exception() is not None:
+                    print(f"Race: {provider} failed: {task.exception()}")
+                    _record(provider, "failed")
+                    continue
+                answer = task.result()
+                _record(provider, latency=latency)
+                if validate is None or validate(answer):
+                    _record(provider, "wins")
+                    return answer, provider
+                print(f"Race: {provider} answer failed validation: {answer!r}")
+                _record(provider, "invalid")
+        return None, None
+    finally:
+        for task in pending:
+            task.cancel()
+            _record(tasks[task], "cancelled")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def race(prompt: str, question: str, providers: Optional[List[str]] = None,
+         validate: Optional[Callable[[str], bool]] = None, timeout: float = 30.0,
+         max_tokens: int = 200) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Send the prompt to several providers at once and return the first valid answer.
+
+    Args:
+        prompt (str): System prompt
+        question (str): User message
+        providers (List[str]): Providers to race, defaults to every available one
+        validate (Callable): Accepts or rejects an answer; rejected answers do not win
+        timeout (float): Seconds to wait for a valid answer
+        max_tokens (int): Answer length limit
+
+    Returns:
+        Tuple[str, str]: (answer, provider), or (None, None) when nobody answered validly in time
+    """
+    providers = [p for p in (providers or available_providers()) if p in RACE_PROVIDERS]
+    if not providers:
+        raise ValueError("No race providers configured")
+    with span("race", kind="internal", providers=",".join(providers)) as s:
+        future = asyncio.run_coroutine_threadsafe(
+            _race(prompt, question, providers, validate, timeout, max_tokens), _get_loop()
+        )
+        answer, winner = future.result()
+        s.set(winner=winner)
+    return answer, winner
+
+
+def race_stats() -> Dict[str, Dict]:
+    """Per-provider races, win rate, failures and answer latency percentiles in seconds."""
+    report = {}
+    with _stats_lock:
+        for provider, stats in _stats.items():
+            latencies = sorted(stats["latencies"])
+            report[provider] = {
+                "races": stats["races"],
+                "wins": stats["wins"],
+                "win_rate": round(stats["wins"] / stats["races"], 3) if stats["races"] else 0.0,
+                "invalid": stats["invalid"],
+                "failed": stats["failed"],
+                "cancelled": stats["cancelled"],
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else None,
+            }
+    return report
@@ -0,0 +1,241 @@
+"""
+Retries, circuit breakers and hedged requests shared by all provider calls.
+
+    response = resilient_call("openai", client.chat.completions.create, model=..., messages=...)
+    response = resilient_call("openai", create, hedge=True, call_site="ask_gpt", ...)
+
+Transient failures (429, 408, 409, 5xx, connection errors and timeouts) are
+retried with exponential backoff and full jitter, waiting at least as long as
+a Retry-After header asks. Every provider has a circuit breaker that fails
+fast after repeated failures and lets a single probe through once the reset
+timeout passes. With hedge=True a second identical request is started when
+the first one is slower than the observed p95 latency of the call site, and
+the first successful response wins.
+"""
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+from assignments.utils.tracing import bind_context, current_span
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+TRANSIENT_ERROR_NAMES = ("Timeout", "Connection", "RemoteDisconnected", "ProtocolError")
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status carried by an SDK, requests or urllib exception, if any."""
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Decide whether an error is transient and the call is worth repeating."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    names = [cls.__name__ for cls in type(error).__mro__]
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(
+        marker in name for name in names for marker in TRANSIENT_ERROR_NAMES
+    )
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After (or retry-after-ms) response header."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        return max(parsed.timestamp() - time.time(), 0.0) if parsed else None
+
+
+def check_status(response):
+    """Raise for a retryable status of a requests response, so resilient_call repeats the request."""
+    if response.status_code in RETRYABLE_STATUS:
+        response.raise_for_status()
+    return response
+
+
+def backoff_delay(attempt: int, base_delay: float = 0.5, max_delay: float = 30.0,
+                  minimum: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff for the given (1-based) attempt, never below minimum."""
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    return max(delay, min(minimum, max_delay)) if minimum else delay
+
+
+class CircuitBreaker:
+    """
+    Fail fast after repeated failures of one provider.
+
+    Closed: calls pass. After failure_threshold consecutive failures the
+    breaker opens and rejects calls for reset_timeout seconds; then a single
+    half-open probe decides between closing it again and reopening it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.time() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"Circuit for {self.name} is open after {self.failures} failures")
+                self.state = "half-open"
+                self._probing = False
+            if self.state == "half-open":
+                if self._probing:
+                    raise CircuitOpenError(f"Circuit for {self.name} is half-open, probe in flight")
+                self._probing = True
+
+    def on_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.time()
+
+
+class LatencyTracker:
+    """Rolling window of successful call durations per call site."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, duration: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(duration)
+
+    def percentile(self, key: str, pct: float = 95, min_samples: int = 10) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(int(len(samples) * pct / 100), len(samples) - 1)]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+latencies = LatencyTracker()
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+
+def hedged(func: Callable, key: str, min_samples: int = 10):
+    """
+    Run func and, if it is still running after the p95 latency of key, start a
+    second identical call; return the first successful result.
+    """
+    threshold = latencies.percentile(key, 95, min_samples)
+    if threshold is None:
+        return func()
+
+    span = current_span()
+    first = _hedge_pool.submit(bind_context(func))
+    done, _ = wait([first], timeout=threshold)
+    if done:
+        return first.result()
+
+    if span:
+        span.set(hedged=True)
+    pending = {first, _hedge_pool.submit(bind_context(func))}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # The slower request is left to finish in the background
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def resilient_call(provider: str, func: Callable, *args, call_site: Optional[str] = None,
+                   max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                   hedge: bool = False, **kwargs):
+    """
+    Call func(*args, **kwargs) with retries, the provider's circuit breaker and optional hedging.
+
+    Args:
+        provider (str): Circuit breaker name (openai, anthropic, groq, centrala, ...)
+        func (Callable): The provider call
+        call_site (str): Latency key for hedging, defaults to the current span's call site
+        max_attempts (int): Attempts including the first one
+        base_delay (float): Backoff of the first retry in seconds
+        max_delay (float): Upper bound of a single wait
+        hedge (bool): Send a second request when the first exceeds the p95 latency
+
+    Returns:
+        The result of func; the last error is raised once attempts run out
+    """
+    span = current_span()
+    key = f"{provider}:{call_site or (span.attributes.get('call_site', span.name) if span else func.__qualname__)}"
+    breaker = get_breaker(provider)
+
+    for attempt in range(1, max_attempts + 1):
+        breaker.before_call()
+        start = time.time()
+        try:
+            result = hedged(lambda: func(*args, **kwargs), key) if hedge else func(*args, **kwargs)
+        except Exception as e:
+            # Only transient errors count against the provider; a 400 still means it is up
+            if is_retryable(e):
+                breaker.on_failure()
+            else:
+                breaker.on_success()
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay, retry_after(e))
+            if span:
+                span.increment("retries")
+            print(f"{provider} call failed ({type(e).__name__}: {e}), retry {attempt}/{max_attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        breaker.on_success()
+        latencies.add(key, time.time() - start)
+        return result
@@ -0,0 +1,186 @@
+import math
+import re
+from collections import Counter
+from typing import List, Optional
+
+# Markers written by html_to_markdown and extract_facts_from_transcriptions
+IMAGE_PREFIX = "!["
+IMAGE_DESCRIPTION_PREFIX = "*Image Description:*"
+AUDIO_PREFIX = "🔊"
+TRANSCRIPTION_PREFIX = "*Transcription:*"
+
+
+def tokenize(text: str, stem_length: int = 5) -> List[str]:
+    """
+    Lowercase word tokens truncated to stem_length characters, a cheap
+    stand-in for stemming inflected Polish words.
+    """
+    return [token[:stem_length] for token in re.findall(r'\w+', text.lower())]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token), the fallback of token_budget.count_tokens."""
+    return len(text) // 4 + 1
+
+
+def split_into_sections(content: str) -> List[str]:
+    """
+    Split markdown content into retrievable sections.
+
+    Every paragraph becomes a section prefixed with its nearest header, an image
+    stays together with its description and an audio link with its transcription.
+    """
+    sections = []
+    header = ""
+    for block in re.split(r'\n\s*\n', content):
+        block = block.strip()
+        if not block:
+            continue
+        if block.startswith('#'):
+            header = block.split('\n', 1)[0]
+            if '\n' in block:
+                sections.append(block)
+        elif sections and (block.startswith(IMAGE_DESCRIPTION_PREFIX) and IMAGE_PREFIX in sections[-1]
+                           or block.startswith(TRANSCRIPTION_PREFIX) and AUDIO_PREFIX in sections[-1]):
+            sections[-1] += f"\n\n{block}"
+        else:
+            sections.append(f"{header}\n\n{block}" if header else block)
+    return sections
+
+
+class BM25Index:
+    """Okapi BM25 over a list of texts."""
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = [Counter(tokenize(text)) for text in texts]
+        self.lengths = [sum(doc.values()) for doc in self.documents]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        frequencies = Counter(token for doc in self.documents for token in doc)
+        total = len(self.documents)
+        self.idf = {
+            token: math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for token, count in frequencies.items()
+        }
+
+    def _matches(self, token: str) -> List[str]:
+        # Short stems ("owoc") also match their longer inflections ("owoca")
+        if len(token) < 4:
+            return [token] if token in self.idf else []
+        return [known for known in self.idf if known.startswith(token) or token.startswith(known) and len(known) >= 4]
+
+    def scores(self, query: str) -> List[float]:
+        query_tokens = {match for token in set(tokenize(query)) for match in self._matches(token)}
+        results = []
+        for doc, length in zip(self.documents, self.lengths):
+            score = 0.0
+            for token in query_tokens:
+                frequency = doc.get(token)
+                if frequency:
+                    norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+                    score += self.idf[token] * frequency * (self.k1 + 1) / (frequency + norm)
+            results.append(score)
+        return results
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def select_sections(content: str, question: str, top_k: int = 5,
+                    token_budget: Optional[int] = None, use_embeddings: bool = False) -> str:
+    """
+    Keep only the sections of content most relevant to the question.
+
+    Args:
+        content (str): Full markdown content
+        question (str): Question the sections are scored against
+        top_k (int): Maximum number of sections to keep
+        token_budget (int): Maximum estimated tokens of the kept sections; the best
+            section is truncated when it alone is over the budget
+        use_embeddings (bool): Add embedding similarity to the BM25 score
+
+    Returns:
+        str: Selected sections joined in their original order
+    """
+    sections = split_into_sections(content)
+    if not sections:
+        return content
+
+    scores = BM25Index(sections).scores(question)
+    if use_embeddings:
+        from assignments.utils.openai_api import get_embeddings
+
+        vectors = get_embeddings([question] + sections)
+        top_lexical = max(scores) or 1.0
+        scores = [
+            score / top_lexical + _cosine(vectors[0], vector)
+            for score, vector in zip(scores, vectors[1:])
+        ]
+
+    ranked = sorted(range(len(sections)), key=lambda idx: scores[idx], reverse=True)
+    selected = []
+    used = 0
+    for idx in ranked[:top_k]:
+        cost = estimate_tokens(sections[idx])
+        if token_budget is not None and used + cost > token_budget:
+            if selected:
+                continue
+            # The best section alone is over the budget: keep its beginning
+            sections[idx] = sections[idx][:max(token_budget - 1, 0) * 4]
+            cost = estimate_tokens(sections[idx])
+        selected.append(idx)
+        used += cost
+
+    print(f"Selected {len(selected)} of {len(sections)} sections (~{used} tokens)")
+    return "\n\n".join(sections[idx] for idx in sorted(selected))
+
+
+
+def tfidf_matrix(texts: List[str], vocabulary: Optional[dict] = None, idf=None):
+    """
+    Build an L2-normalized TF-IDF matrix (texts x vocabulary) with numpy.
+
+    Pass the vocabulary and idf returned by a previous call to project further
+    texts onto the same space.
+
+    Returns:
+        tuple: (matrix, vocabulary, idf)
+    """
+    import numpy as np
+
+    counts = [Counter(tokenize(text)) for text in texts]
+    if vocabulary is None:
+        vocabulary = {token: idx for idx, token in enumerate(sorted({t for c in counts for t in c}))}
+
+    matrix = np.zeros((len(texts), len(vocabulary)), dtype=np.float32)
+    for row, counter in enumerate(counts):
+        for token, count in counter.items():
+            col = vocabulary.get(token)
+            if col is not None:
+                matrix[row, col] = 1 + math.log(count)
+
+    if idf is None:
+        document_frequency = (matrix > 0).sum(axis=0)
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12), vocabulary, idf
+
+
+def match_texts(queries: List[str], candidates: List[str]):
+    """
+    Score every query against every candidate with TF-IDF cosine similarity.
+
+    The vocabulary and IDF are fitted on the candidates, queries are projected
+    onto them and all pairs are scored with a single matrix multiply.
+
+    Returns:
+        numpy.ndarray: Similarity matrix of shape (queries, candidates)
+    """
+    candidate_matrix, vocabulary, idf = tfidf_matrix(candidates)
+    query_matrix, _, _ = tfidf_matrix(queries, vocabulary, idf)
+    return query_matrix @ candidate_matrix.T
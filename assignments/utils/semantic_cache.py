@@ -0,0 +1,221 @@
+"""
+Semantic answer cache for questions that come back reworded.
+
+    cache = get_cache()
+    answer, score = cache.lookup("ask_gpt", question, fingerprint(prompt, model))
+    if answer is None:
+        answer = ...
+        cache.store("ask_gpt", question, fingerprint(prompt, model), answer)
+
+Entries are keyed on the call site, a fingerprint of the content the answer
+was derived from (prompt, model, article) and the embedding of the question.
+A lookup returns the answer of the nearest cached question with the same
+fingerprint when its cosine similarity reaches the threshold, together with
+the score. Changed content changes the fingerprint, so old answers are never
+returned; entries of a source whose content changed are dropped on the spot.
+Least recently used entries are evicted above max_entries, and entries older
+than the TTL expire.
+
+Off by default. AIDEVS3_SEMANTIC_CACHE=memory keeps the cache for the run,
+any other value is the JSON file it is persisted to. The file belongs to one
+process at a time: sharing it between processes is not supported, the last
+one to save wins;
+AIDEVS3_SEMANTIC_CACHE_THRESHOLD (0.92) and AIDEVS3_SEMANTIC_CACHE_TTL
+(seconds) tune it.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from assignments.utils.lazy_utils import lazy_import
+
+np = lazy_import("numpy")
+
+DEFAULT_THRESHOLD = 0.92
+
+
+def fingerprint(*parts: str) -> str:
+    """Stable hash of the content an answer depends on."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def _normalize(question: str) -> str:
+    return re.sub(r'\s+', ' ', question).strip().lower()
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of answers over question embeddings.
+
+    Args:
+        path (str): JSON file the entries are persisted to, None keeps them in memory
+        threshold (float): Minimum cosine similarity of a hit
+        max_entries (int): Least recently used entries above this are evicted
+        ttl (float): Seconds an entry stays valid, None for no expiry
+        embed (Callable): Embeds a list of texts, defaults to openai_api.get_embeddings
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = DEFAULT_THRESHOLD, max_entries: int = 1000,
+                 ttl: Optional[float] = None, embed: Optional[Callable[[List[str]], List]] = None):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.entries: List[Dict] = []
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0, "invalidated": 0}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def _embed(self, question: str):
+        if self.embed is None:
+            from assignments.utils.openai_api import get_embeddings
+            self.embed = get_embeddings
+        vector = np.asarray(self.embed([question])[0], dtype=float)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+        now = time.time()
+        kept = [e for e in self.entries if now - e["created"] < self.ttl]
+        self.stats["evicted"] += len(self.entries) - len(kept)
+        self.entries = kept
+
+    def _invalidate_source(self, source: Optional[str], current: str) -> bool:
+        if source is None:
+            return False
+        kept = [e for e in self.entries if e.get("source") != source or e["fingerprint"] == current]
+        removed = len(self.entries) - len(kept)
+        self.stats["invalidated"] += removed
+        self.entries = kept
+        return removed > 0
+
+    def lookup(self, namespace: str, question: str, content_fingerprint: str,
+               source: Optional[str] = None) -> Tuple[Optional[str], float]:
+        """
+        Find the answer of the most similar cached question.
+
+        Args:
+            namespace (str): Call site the answer belongs to
+            question (str): Question as asked now
+            content_fingerprint (str): fingerprint() of the content the answer depends on
+            source (str): Name of the content (e.g. a file); cached answers for other
+                versions of it are dropped
+
+        Returns:
+            Tuple[str, float]: (answer, similarity), or (None, best similarity) on a miss
+        """
+        with self._lock:
+            self._expire()
+            changed = self._invalidate_source(source, content_fingerprint)
+            candidates = [e for e in self.entries
+                          if e["namespace"] == namespace and e["fingerprint"] == content_fingerprint]
+            exact = next((e for e in candidates if e["question_key"] == _normalize(question)), None)
+        if changed:
+            self._save()
+
+        best, score = exact, 1.0 if exact else 0.0
+        if best is None and candidates:
+            vector = self._embed(question)
+            scores = np.asarray([e["embedding"] for e in candidates]) @ vector
+            index = int(np.argmax(scores))
+            best, score = candidates[index], float(scores[index])
+
+        with self._lock:
+            if best is not None and score >= self.threshold:
+                best["last_used"] = time.time()
+                best["hits"] = best.get("hits", 0) + 1
+                self.stats["hits"] += 1
+                return best["answer"], score
+            self.stats["misses"] += 1
+        return None, score
+
+    def store(self, namespace: str, question: str, content_fingerprint: str, answer: str,
+              source: Optional[str] = None):
+        """Cache the answer to question, derived from the fingerprinted content."""
+        vector = self._embed(question)
+        now = time.time()
+        with self._lock:
+            self._invalidate_source(source, content_fingerprint)
+            key = _normalize(question)
+            self.entries = [e for e in self.entries if not (
+                e["namespace"] == namespace and e["fingerprint"] == content_fingerprint and e["question_key"] == key
+            )]
+            self.entries.append({
+                "namespace": namespace, "fingerprint": content_fingerprint, "source": source,
+                "question": question, "question_key": key, "answer": answer,
+                "embedding": [round(float(v), 6) for v in vector], "created": now, "last_used": now, "hits": 0,
+            })
+            self._expire()
+            if len(self.entries) > self.max_entries:
+                self.entries.sort(key=lambda e: e["last_used"])
+                self.stats["evicted"] += len(self.entries) - self.max_entries
+                self.entries = self.entries[-self.max_entries:]
+        self._save()
+
+    def invalidate(self, namespace: Optional[str] = None, content_fingerprint: Optional[str] = None,
+                   source: Optional[str] = None) -> int:
+        """Drop the entries matching every given filter (all entries without filters); returns how many."""
+        with self._lock:
+            kept = [e for e in self.entries if not (
+                (namespace is None or e["namespace"] == namespace)
+                and (content_fingerprint is None or e["fingerprint"] == content_fingerprint)
+                and (source is None or e.get("source") == source)
+            )]
+            removed = len(self.entries) - len(kept)
+            self.stats["invalidated"] += removed
+            self.entries = kept
+        self._save()
+        return removed
+
+    def _save(self):
+        if not self.path:
+            return
+        # One save at a time, so a stale snapshot never replaces a newer one. Only
+        # threads are coordinated: processes sharing the file overwrite each other
+        with self._save_lock:
+            with self._lock:
+                payload = json.dumps(self.entries, ensure_ascii=False)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                            prefix=os.path.basename(self.path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[SemanticCache]:
+    """The cache configured by AIDEVS3_SEMANTIC_CACHE, None when it is off."""
+    global _cache
+    setting = os.getenv("AIDEVS3_SEMANTIC_CACHE")
+    if not setting:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            ttl = os.getenv("AIDEVS3_SEMANTIC_CACHE_TTL")
+            _cache = SemanticCache(
+                path=None if setting == "memory" else setting,
+                threshold=float(os.getenv("AIDEVS3_SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+                ttl=float(ttl) if ttl else None,
+            )
+        return _cache
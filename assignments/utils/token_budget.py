@@ -0,0 +1,180 @@
+"""
+Pre-flight token budgeting for LLM calls.
+
+    tokens = count_tokens(prompt, "gpt-4o")
+    content, estimate = fit_content(content, "gpt-4o", question=question, reserved=count_tokens(template))
+    # estimate: {"tokens": 5210, "original_tokens": 18344, "budget": 6000, "duplicates": 3, "dropped": 12, ...}
+
+Tokens are counted locally with the tiktoken encoding of OpenAI models. The
+Claude tokenizer is not public, so Claude counts are approximated from the
+cl100k encoding; without tiktoken (or its encoding files) every count falls
+back to ~4 characters per token and the estimate is marked as not exact.
+
+Content over the budget is packed in stages: repeated blocks are dropped,
+then the least valuable blocks (least relevant to the question, boilerplate
+first), and a single block that still does not fit is truncated. The budget
+is the model's context window minus the reserved output, lowered with
+AIDEVS3_TOKEN_BUDGET or per call.
+"""
+import functools
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from assignments.utils.model_router import MODELS
+from assignments.utils.retrieval_utils import BM25Index, estimate_tokens, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Claude splits text into ~10% more tokens than cl100k; rounded up to stay on the safe side
+CLAUDE_TOKEN_RATIO = 1.15
+DEFAULT_CONTEXT = 8192
+# Tokens kept free for the answer when no max_output_tokens is given
+DEFAULT_OUTPUT_RESERVE = 1024
+# Blocks with fewer words are separators, navigation or empty headers
+BOILERPLATE_WORDS = 3
+# Per-message formatting tokens added by the chat format
+MESSAGE_OVERHEAD = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    """tiktoken encoding of a model, None when tiktoken or its encoding files are unavailable."""
+    try:
+        import tiktoken
+        if model.startswith("claude"):
+            return tiktoken.get_encoding("cl100k_base")
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Offline machines cannot download the encoding files on first use
+        logger.warning("No tokenizer for %s, estimating tokens from characters (%s)", model, e)
+        return None
+
+
+def is_exact(model: str) -> bool:
+    """Whether counts for the model come from its own tokenizer."""
+    return not model.startswith("claude") and _encoding(model) is not None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Number of tokens of text for the model, see the module docstring for the approximations."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    tokens = len(encoding.encode(text, disallowed_special=()))
+    return int(tokens * CLAUDE_TOKEN_RATIO) + 1 if model.startswith("claude") else tokens
+
+
+def count_message_tokens(messages: List[Dict], model: str = "gpt-4o") -> int:
+    """Prompt tokens of a chat request, including the per-message formatting."""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        total += count_tokens(content or "", model) + MESSAGE_OVERHEAD
+    return total
+
+
+def context_window(model: str) -> int:
+    return MODELS.get(model, {}).get("context", DEFAULT_CONTEXT)
+
+
+def prompt_budget(model: str, max_output_tokens: int = DEFAULT_OUTPUT_RESERVE, budget: Optional[int] = None) -> int:
+    """
+    Tokens the prompt may use: the explicit budget, else AIDEVS3_TOKEN_BUDGET,
+    never more than the context window minus the output.
+    """
+    limit = context_window(model) - max_output_tokens
+    budget = budget or int(os.getenv("AIDEVS3_TOKEN_BUDGET", "0")) or limit
+    return min(budget, limit)
+
+
+def _normalize(block: str) -> str:
+    return re.sub(r'\s+', ' ', block).strip().lower()
+
+
+def _truncate(text: str, tokens: int, model: str) -> str:
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max(tokens - 1, 0) * 4]
+    if model.startswith("claude"):
+        tokens = int(tokens / CLAUDE_TOKEN_RATIO)
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+
+
+def fit_content(content: str, model: str = "gpt-4o", budget: Optional[int] = None, question: Optional[str] = None,
+                reserved: int = 0, max_output_tokens: int = DEFAULT_OUTPUT_RESERVE) -> Tuple[str, Dict]:
+    """
+    Trim content so that it and the rest of the prompt fit the token budget.
+
+    Args:
+        content (str): Text forwarded to the model, split into blocks on blank lines
+        model (str): Model whose tokenizer and context window are used
+        budget (int): Prompt token budget, see prompt_budget()
+        question (str): Blocks least relevant to it are dropped first
+        reserved (int): Tokens of the prompt around the content (template, system prompt, question)
+        max_output_tokens (int): Tokens kept free for the answer
+
+    Returns:
+        Tuple[str, Dict]: The content and its estimate: tokens, original_tokens,
+        budget, duplicates, dropped, truncated and exact
+    """
+    budget = prompt_budget(model, max_output_tokens, budget)
+    available = budget - reserved
+    if available <= 0:
+        raise ValueError(f"Prompt of {reserved} tokens leaves no room for content within {budget} tokens for {model}")
+
+    original_tokens = count_tokens(content, model)
+    estimate = {"model": model, "budget": budget, "tokens": original_tokens + reserved,
+                "original_tokens": original_tokens + reserved, "duplicates": 0, "dropped": 0,
+                "truncated": False, "exact": is_exact(model)}
+    if original_tokens <= available:
+        return content, estimate
+
+    # 1. Repeated blocks (navigation, quoted paragraphs, re-sent facts) are kept once
+    blocks, seen = [], set()
+    for block in re.split(r'\n\s*\n', content):
+        key = _normalize(block)
+        if not key:
+            continue
+        if key in seen:
+            estimate["duplicates"] += 1
+            continue
+        seen.add(key)
+        blocks.append(block.strip())
+    costs = [count_tokens(block, model) for block in blocks]
+
+    # 2. Least valuable blocks go first: boilerplate, then the least relevant, then the latest
+    relevance = BM25Index(blocks).scores(question) if question else [0.0] * len(blocks)
+    order = sorted(range(len(blocks)), key=lambda i: (
+        blocks[i].startswith('#') or len(tokenize(blocks[i])) >= BOILERPLATE_WORDS, relevance[i], -i
+    ))
+    kept = set(range(len(blocks)))
+    # Blocks are joined with a blank line, about one token each
+    used = sum(costs) + len(blocks)
+    for index in order:
+        if used <= available or len(kept) == 1:
+            break
+        kept.discard(index)
+        used -= costs[index] + 1
+        estimate["dropped"] += 1
+
+    # 3. A single block that is still too long is cut
+    kept_blocks = [blocks[i] for i in sorted(kept)]
+    if used > available:
+        kept_blocks = [_truncate(kept_blocks[0], available, model)]
+        estimate["truncated"] = True
+
+    packed = "\n\n".join(kept_blocks)
+    estimate["tokens"] = count_tokens(packed, model) + reserved
+    print(f"Packed content for {model}: {estimate['original_tokens']} -> {estimate['tokens']} tokens "
+          f"(budget {budget}, {estimate['duplicates']} duplicates, {estimate['dropped']} blocks dropped"
+          f"{', truncated' if estimate['truncated'] else ''})")
+    return packed, estimate
@@ -0,0 +1,198 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_exporters = []
+_configured = False
+
+
+class Span:
+    """A timed operation with attributes and a parent span."""
+
+    def __init__(self, name: str, kind: str, attributes: dict, parent: Optional["Span"]):
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.end = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes):
+        """Add or overwrite attributes; None values are skipped."""
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def increment(self, attribute: str, amount: int = 1):
+        self.attributes[attribute] = self.attributes.get(attribute, 0) + amount
+
+    @property
+    def duration(self) -> Optional[float]:
+        return self.end - self.start if self.end is not None else None
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class JsonlExporter:
+    """Append every finished span as one JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+class OpenTelemetryExporter:
+    """Mirror spans into OpenTelemetry (requires the opentelemetry-api package)."""
+
+    def __init__(self, service_name: str = "aidevs3"):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer(service_name)
+        self._spans = {}
+
+    def on_start(self, span: Span):
+        parent = self._spans.get(span.parent_id)
+        context = self._trace.set_span_in_context(parent) if parent else None
+        self._spans[span.span_id] = self._tracer.start_span(
+            span.name, context=context, start_time=int(span.start * 1e9)
+        )
+
+    def on_end(self, span: Span):
+        otel_span = self._spans.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        otel_span.set_attribute("kind", span.kind)
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.error:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int(span.end * 1e9))
+
+
+def configure_tracing(jsonl_path: Optional[str] = None, otel: bool = False):
+    """
+    Replace the active exporters.
+
+    Args:
+        jsonl_path (str): Write spans to this JSONL file
+        otel (bool): Also export to the configured OpenTelemetry tracer provider
+    """
+    global _configured
+    _configured = True
+    _exporters.clear()
+    if jsonl_path:
+        _exporters.append(JsonlExporter(jsonl_path))
+    if otel:
+        _exporters.append(OpenTelemetryExporter())
+
+
+def add_exporter(exporter):
+    """Register an additional exporter with on_start(span)/on_end(span) hooks."""
+    # Configure from the environment first, so the first span does not drop this exporter
+    if not _configured:
+        _configure_from_env()
+    _exporters.append(exporter)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """
+    Time the enclosed block as a span nested under the current one.
+
+    Kinds used across the utils: llm, embedding, transcription, vision,
+    qdrant, http, centrala, internal.
+    """
+    if not _configured:
+        _configure_from_env()
+    new_span = Span(name, kind, {k: v for k, v in attributes.items() if v is not None}, _current_span.get())
+    token = _current_span.set(new_span)
+    for exporter in _exporters:
+        exporter.on_start(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        # Requests cancelled by a race or a timeout are not failures
+        new_span.status = "cancelled" if type(e).__name__ == "CancelledError" else "error"
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        new_span.end = time.time()
+        _current_span.reset(token)
+        for exporter in _exporters:
+            exporter.on_end(new_span)
+
+
+def traced(name: Optional[str] = None, kind: str = "internal"):
+    """Decorator running the function inside a span."""
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__qualname__, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind_context(func: Callable) -> Callable:
+    """
+    Carry the caller's current span into worker threads, so spans created by
+    ThreadPoolExecutor tasks nest under the span that submitted them.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def text_size(value) -> Optional[int]:
+    """Size in characters of a prompt/response, or None when it is not text."""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value)
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def _configure_from_env():
+    # Enable export for every run with AIDEVS3_TRACE_FILE=trace.jsonl (and AIDEVS3_TRACE_OTEL=1)
+    configure_tracing(os.getenv("AIDEVS3_TRACE_FILE"), otel=os.getenv("AIDEVS3_TRACE_OTEL") == "1")
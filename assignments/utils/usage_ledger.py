@@ -0,0 +1,153 @@
+import atexit
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_current_task = contextvars.ContextVar("current_task", default=None)
+_records = []
+_lock = threading.Lock()
+_started = time.time()
+
+
+def current_task() -> str:
+    """Task the current call belongs to: the active task_scope, AIDEVS3_TASK or the script name."""
+    return (_current_task.get() or os.getenv("AIDEVS3_TASK")
+            or os.path.splitext(os.path.basename(sys.argv[0] or ""))[0] or "interactive")
+
+
+@contextmanager
+def task_scope(task: str):
+    """Attribute every call made inside the block to task."""
+    token = _current_task.set(task)
+    try:
+        yield
+    finally:
+        _current_task.reset(token)
+
+
+def record(call_site: str, provider: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+           audio_seconds: float = 0.0, images: int = 0, duration: Optional[float] = None) -> Dict:
+    """Add one provider call to the ledger."""
+    entry = {
+        "time": time.time(),
+        "task": current_task(),
+        "call_site": call_site,
+        "provider": provider,
+        "model": model,
+        "prompt_tokens": prompt_tokens or 0,
+        "completion_tokens": completion_tokens or 0,
+        "audio_seconds": audio_seconds or 0.0,
+        "images": images or 0,
+        "duration": duration
+    }
+    with _lock:
+        _records.append(entry)
+    usage_file = os.getenv("AIDEVS3_USAGE_FILE")
+    if usage_file:
+        with _lock, open(usage_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def record_response(span, response, provider: str, images: int = 0, audio_seconds: Optional[float] = None) -> Dict:
+    """
+    Record the usage reported by an OpenAI, Anthropic or Groq response.
+
+    Call site, model and duration are taken from the active tracing span; the
+    token counts are also added to the span's attributes.
+    """
+    usage = getattr(response, "usage", None)
+    # OpenAI/Groq chat and embeddings use prompt/completion tokens, Anthropic input/output tokens
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0
+    if audio_seconds is None:
+        audio_seconds = getattr(response, "duration", None) or 0.0
+
+    span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+             audio_seconds=audio_seconds or None, images=images or None)
+    return record(
+        call_site=span.attributes.get("call_site", span.name),
+        provider=provider,
+        model=span.attributes.get("model"),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        audio_seconds=audio_seconds,
+        images=images,
+        duration=time.time() - span.start
+    )
+
+
+def records() -> List[Dict]:
+    with _lock:
+        return list(_records)
+
+
+def summary(top: int = 5) -> Dict:
+    """
+    Aggregate the ledger per task and call site.
+
+    Returns:
+        Dict: Totals, tokens per second of provider time, requests per minute
+        of wall time and the call sites with the most tokens
+    """
+    entries = records()
+    wall_time = max(time.time() - _started, 1e-9)
+
+    def aggregate(group: List[Dict]) -> Dict:
+        tokens = sum(e["prompt_tokens"] + e["completion_tokens"] for e in group)
+        busy = sum(e["duration"] or 0 for e in group)
+        return {
+            "requests": len(group),
+            "prompt_tokens": sum(e["prompt_tokens"] for e in group),
+            "completion_tokens": sum(e["completion_tokens"] for e in group),
+            "audio_seconds": round(sum(e["audio_seconds"] for e in group), 2),
+            "images": sum(e["images"] for e in group),
+            "provider_seconds": round(busy, 3),
+            "tokens_per_second": round(tokens / busy, 1) if busy else None
+        }
+
+    def grouped(key: str) -> Dict[str, Dict]:
+        groups = {}
+        for entry in entries:
+            groups.setdefault(entry[key], []).append(entry)
+        return {name: aggregate(group) for name, group in groups.items()}
+
+    call_sites = grouped("call_site")
+    total = aggregate(entries)
+    total["requests_per_minute"] = round(len(entries) / wall_time * 60, 1)
+    total["wall_seconds"] = round(wall_time, 3)
+    return {
+        "total": total,
+        "tasks": grouped("task"),
+        "call_sites": call_sites,
+        "most_expensive": sorted(
+            call_sites, key=lambda site: call_sites[site]["prompt_tokens"] + call_sites[site]["completion_tokens"],
+            reverse=True
+        )[:top]
+    }
+
+
+def print_summary():
+    """Print the usage summary of the run."""
+    if not _records:
+        return
+    report = summary()
+    total = report["total"]
+    print("\n=== Usage summary ===")
+    print(f"Requests: {total['requests']} ({total['requests_per_minute']}/min), "
+          f"tokens: {total['prompt_tokens']} in / {total['completion_tokens']} out, "
+          f"{total['tokens_per_second']} tokens/s, audio: {total['audio_seconds']}s, images: {total['images']}")
+    for site in report["most_expensive"]:
+        stats = report["call_sites"][site]
+        print(f"  {site}: {stats['requests']} requests, "
+              f"{stats['prompt_tokens'] + stats['completion_tokens']} tokens, {stats['provider_seconds']}s")
+
+
+# Print the summary at the end of every run unless AIDEVS3_USAGE_SUMMARY=0
+if os.getenv("AIDEVS3_USAGE_SUMMARY", "1") != "0":
+    atexit.register(print_summary)
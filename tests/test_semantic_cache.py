@@ -0,0 +1,45 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from assignments.utils.semantic_cache import SemanticCache, fingerprint
+
+
+def fake_embed(texts):
+    """Embed by the words present, so rewordings of a question stay close."""
+    vocabulary = ["capital", "france", "poland", "population"]
+    return [[1.0 if word in text.lower() else 0.0 for word in vocabulary] + [0.1] for text in texts]
+
+
+def test_concurrent_stores_are_all_persisted(tmp_path):
+    cache_path = tmp_path / "semantic_cache.json"
+    cache = SemanticCache(str(cache_path), max_entries=1000, embed=fake_embed)
+    content_fingerprint = fingerprint("test")
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda i: cache.store("test", f"Question {i}?", content_fingerprint, f"Answer {i}"),
+                          range(400)))
+
+    assert len(json.loads(cache_path.read_text(encoding='utf-8'))) == 400
+    assert len(SemanticCache(str(cache_path), embed=fake_embed).entries) == 400
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_reworded_question_hits_and_changed_content_misses(tmp_path):
+    cache = SemanticCache(str(tmp_path / "semantic_cache.json"), embed=fake_embed)
+    cache.store("ask", "What is the capital of France?", fingerprint("prompt", "gpt-4o"), "Paris")
+
+    answer, score = cache.lookup("ask", "France: its capital city?", fingerprint("prompt", "gpt-4o"))
+    assert answer == "Paris" and score >= cache.threshold
+
+    answer, _ = cache.lookup("ask", "What is the capital of France?", fingerprint("prompt", "gpt-4o-mini"))
+    assert answer is None
+
+
+def test_changed_source_drops_its_answers(tmp_path):
+    cache = SemanticCache(str(tmp_path / "semantic_cache.json"), embed=fake_embed)
+    cache.store("article", "Population of Poland?", fingerprint("v1"), "38M", source="article.html")
+
+    answer, _ = cache.lookup("article", "Population of Poland?", fingerprint("v2"), source="article.html")
+
+    assert answer is None
+    assert cache.entries == []